@@ -1,8 +1,11 @@
 from fastapi import APIRouter
-from app.api.routes import auth, chat, health
+from app.api.routes import admin, auth, chat, emergencies, facilities, health
 
 api_router = APIRouter()
 
+api_router.include_router(admin.router)
 api_router.include_router(auth.router)
 api_router.include_router(chat.router)
+api_router.include_router(emergencies.router)
+api_router.include_router(facilities.router)
 api_router.include_router(health.router)
\ No newline at end of file
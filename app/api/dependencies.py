@@ -1,7 +1,10 @@
+import hmac
 from typing import Optional
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, Header, HTTPException, status, Request
+from app.core.config import settings
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.auth_service import auth_service
+from app.utils.openai_client import OpenAIClient, openai_client
 
 # Use HTTPBearer for simple JWT token authentication (shows simple token field in Swagger UI)
 security = HTTPBearer(auto_error=False)
@@ -44,4 +47,31 @@ async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] =
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)) -> None:
+    """
+    Dependency guarding the /admin endpoints with the ADMIN_API_KEY shared secret
+
+    Raises:
+        HTTPException: 503 if no admin key is configured, 403 if the key is wrong
+    """
+    if not settings.admin_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Admin API is disabled"
+        )
+    if x_admin_key is None or not hmac.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin key"
+        )
+
+def get_openai_client() -> OpenAIClient:
+    """
+    Dependency providing the worker's LLM client
+
+    Its connection pool is opened by the app lifespan; tests can swap in a
+    fake through app.dependency_overrides.
+    """
+    return openai_client
@@ -0,0 +1,118 @@
+import json
+import time
+from typing import List, Optional, Tuple
+from app.services.admission import EXEMPT, PRIORITY_NAMES, AdmissionController, admission_controller
+from app.utils.metrics import REQUEST_LATENCY, SHED_REQUESTS
+
+class MetricsMiddleware:
+    """
+    Record per-route request latency
+
+    Plain ASGI so streamed responses are timed until their last chunk is
+    sent. Routes are labelled by template (e.g. /api/v1/chat) rather than
+    raw path to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status)
+            ).observe(time.perf_counter() - start)
+
+def _shed_response(status: int, detail: str, retry_after: int) -> List[dict]:
+    body = json.dumps({"detail": detail}).encode()
+    return [
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        },
+        {"type": "http.response.body", "body": body}
+    ]
+
+# Built once; shedding must stay cheap when the server is busiest
+RATE_LIMITED = _shed_response(429, "Too many requests", 1)
+OVERLOADED = _shed_response(503, "Server busy, please retry", 1)
+
+class AdmissionMiddleware:
+    """
+    Rate-limit and shed requests by priority before they reach a route
+
+    Plain ASGI: a refused request is answered with a prebuilt response
+    without reading its body. Admitted requests hold their concurrency
+    slot until the last response chunk is sent.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token, client_ip = self._identity(scope)
+        priority, key = await self.controller.classify(scope["path"], token, client_ip)
+        if priority == EXEMPT:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.controller.allow_rate(priority, key):
+            SHED_REQUESTS.labels("rate", PRIORITY_NAMES[priority]).inc()
+            await self._send_all(send, RATE_LIMITED)
+            return
+        if not self.controller.try_acquire(priority):
+            SHED_REQUESTS.labels("overload", PRIORITY_NAMES[priority]).inc()
+            await self._send_all(send, OVERLOADED)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    @staticmethod
+    def _identity(scope) -> Tuple[Optional[str], str]:
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and credentials:
+                    token = credentials.strip()
+                break
+        # uvicorn has already replaced the peer with the X-Forwarded-For
+        # address when the request came through a trusted proxy; the
+        # header itself is the client's to forge
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        return token, client_ip
+
+    @staticmethod
+    async def _send_all(send, messages: List[dict]) -> None:
+        for message in messages:
+            await send(message)
@@ -0,0 +1,173 @@
+import logging
+from dataclasses import asdict
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from app.api.dependencies import require_admin
+from app.models.schemas import DuplicateConfirmation, UnitRelease, UnitStatus, UnitUpdate
+from app.services.dispatch_engine import Unit, assignment_engine
+from app.services.dispatch_feed import dispatch_feed
+from app.services.emergency_service import emergency_service
+from app.services.export import (
+    FORMATS, ExportQuery, InvalidExportRequest, decode_cursor, record_exporter, require_pyarrow, utc_timestamp
+)
+from app.services.incident_dedup import incident_deduplicator
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+def _unit_status(unit: Unit) -> dict:
+    return {
+        "id": unit.id,
+        "latitude": unit.latitude,
+        "longitude": unit.longitude,
+        "capabilities": list(unit.capabilities),
+        "available": unit.available,
+        "incident_id": unit.incident_id
+    }
+
+@router.get("/units", response_model=List[UnitStatus])
+async def list_units():
+    """Every unit in the fleet with its position and availability"""
+    return [_unit_status(unit) for unit in assignment_engine.fleet.units.values()]
+
+@router.put("/units/{unit_id}", response_model=UnitStatus)
+async def update_unit(unit_id: str, update: UnitUpdate):
+    """Register a unit or report its position, capabilities or availability"""
+    unit = assignment_engine.update_unit(
+        unit_id,
+        update.latitude,
+        update.longitude,
+        capabilities=update.capabilities,
+        available=update.available
+    )
+    return _unit_status(unit)
+
+@router.post("/units/{unit_id}/release", response_model=UnitStatus)
+async def release_unit(unit_id: str, release: UnitRelease = UnitRelease()):
+    """Mark a unit available again once it has finished with its incident"""
+    unit = assignment_engine.release(unit_id, release.latitude, release.longitude)
+    if unit is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown unit")
+    return _unit_status(unit)
+
+@router.delete("/units/{unit_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_unit(unit_id: str):
+    """Take a unit out of the fleet"""
+    if not assignment_engine.fleet.remove(unit_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown unit")
+
+@router.get("/assignments")
+async def recent_assignments():
+    """Fleet and queue counters with the most recent assignments"""
+    return {
+        **assignment_engine.stats(),
+        "recent": [asdict(assignment) for assignment in reversed(assignment_engine.recent)]
+    }
+
+@router.get("/duplicates")
+async def recent_duplicates():
+    """Near-duplicate dispatch counters with the most recent duplicates"""
+    return {
+        **incident_deduplicator.stats(),
+        "recent": [asdict(duplicate) for duplicate in reversed(incident_deduplicator.recent)]
+    }
+
+@router.post("/duplicates/{incident_id}/confirm")
+async def confirm_duplicate(incident_id: str, confirmation: DuplicateConfirmation):
+    """
+    Confirm that an incident repeats another, withholding its unit
+
+    The incident is marked `duplicate` and leaves the assignment queue, or
+    its unit is released if one was already assigned. Flagged duplicates
+    keep their unit until this is called.
+    """
+    if confirmation.duplicate_of == incident_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="An incident cannot repeat itself")
+    try:
+        withdrawn = await emergency_service.confirm_duplicate(incident_id, confirmation.duplicate_of)
+    except Exception as e:
+        record_error(logger, "dispatch", "Error confirming duplicate %s: %s", incident_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not record the duplicate"
+        )
+    if withdrawn is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown incident")
+    return {"incident_id": incident_id, "duplicate_of": confirmation.duplicate_of, "withdrawn": withdrawn}
+
+@router.get("/feed")
+async def live_dispatch_feed(
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[str] = Query(None, description="Event id to resume after, for clients that cannot send Last-Event-ID")
+):
+    """
+    Server-sent `dispatch` events for incidents logged on this worker
+
+    Reconnect with the Last-Event-ID header (or `after`) to receive what
+    was missed. A `reset` event means events were lost and the console
+    should reload incidents from the database.
+    """
+    if not dispatch_feed.has_room():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Dispatch feed is full")
+    return StreamingResponse(
+        dispatch_feed.stream(last_event_id or after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/feed/stats")
+async def dispatch_feed_stats():
+    """Connected consoles and events published on this worker"""
+    return dispatch_feed.stats()
+
+async def _logged(dataset: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Headers are already sent, so a failure can only cut the stream short
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        record_error(logger, "export", "Export of %s failed: %s", dataset, e)
+        raise
+
+@router.get("/export/{dataset}")
+async def export_records(
+    dataset: str,
+    format: str = Query("ndjson", description="ndjson or parquet"),
+    since: Optional[datetime] = Query(None, description="Only rows created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only rows created before this time"),
+    dispatch_only: bool = Query(False, description="Only conversation turns that triggered a dispatch"),
+    cursor: Optional[str] = Query(None, description="Resume after the row this cursor was built from")
+):
+    """
+    Stream every conversation turn or incident, oldest first
+
+    `dataset` is "conversations" or "incidents". Rows are read from the
+    database a page at a time, so exports of any size use constant memory.
+    An interrupted NDJSON export resumes with the cursor of its last line,
+    which scripts/export_records.py builds for you.
+    """
+    try:
+        query = ExportQuery(
+            dataset,
+            since=utc_timestamp(since),
+            until=utc_timestamp(until),
+            dispatch_only=dispatch_only,
+            after=decode_cursor(cursor) if cursor else None
+        )
+        if format == "parquet":
+            require_pyarrow()
+        chunks = record_exporter.stream(query, format)
+    except InvalidExportRequest as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+    return StreamingResponse(
+        _logged(dataset, chunks),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'}
+    )
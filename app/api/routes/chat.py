@@ -1,11 +1,50 @@
+import logging
+from typing import Dict, List, Tuple
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from app.services.chat_service import chat_service
 from app.services.emergency_service import emergency_service
+from app.services.session_store import session_store
 from app.api.dependencies import get_current_user
+from app.api.routing import ORJSONRoute
 from app.models.schemas import ChatRequest, ChatResponse
+from app.utils.geo import coordinates_from
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
 
 # Remove dependencies from router level
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=ORJSONRoute)
+
+async def _resolve_session(request: ChatRequest, user_id: str) -> Tuple[str, List[Dict]]:
+    """
+    Find the conversation history for a request
+
+    Uses the server-side session when the client sends a known session_id,
+    otherwise restarts the user's default session seeded with any history
+    the client sent.
+    """
+    if request.session_id:
+        history = await session_store.get_history(request.session_id, user_id)
+        if history is not None:
+            return request.session_id, history
+
+    # The only conversion of client history; the session store and the
+    # prompt builder use these dicts without copying them again
+    history = [{"role": msg.role, "content": msg.content} for msg in request.conversation_history]
+    session_id = await session_store.start(user_id, history)
+    return session_id, history
+
+async def _record_turn(session_id: str, user_id: str, message: str, reply: str) -> None:
+    """Append a completed turn to the session"""
+    try:
+        await session_store.append(session_id, user_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": reply}
+        ])
+    except Exception as e:
+        record_error(logger, "session", "Error saving chat session: %s", e)
 
 @router.post("", response_model=ChatResponse)
 async def chat_with_medilocator(
@@ -14,13 +53,28 @@ async def chat_with_medilocator(
 ):
     """Main endpoint for the Medilocator chat interface"""
     try:
+        session_id, conversation_history = await _resolve_session(request, current_user["id"])
+
         # Process chat message
         chat_response = await chat_service.process_chat_message(
             message=request.message,
-            conversation_history=[msg.dict() for msg in request.conversation_history],
-            user_location=request.user_location
+            conversation_history=conversation_history,
+            user_location=request.user_location,
+            user_id=current_user["id"]
         )
+        chat_response.session_id = session_id
         
+        # Log emergency first if dispatch was triggered
+        if chat_response.dispatch_triggered and chat_response.emergency_details:
+            await emergency_service.log_emergency(
+                chat_response.emergency_details,
+                current_user["id"],
+                coordinates_from(request.user_location)
+            )
+
+        # A slow session store must not hold up the incident
+        await _record_turn(session_id, current_user["id"], request.message, chat_response.reply)
+
         # Log the conversation
         emergency_service.log_conversation(
             user_id=current_user["id"],
@@ -29,14 +83,7 @@ async def chat_with_medilocator(
             dispatch_triggered=chat_response.dispatch_triggered
         )
         
-        # Log emergency if dispatch was triggered
-        if chat_response.dispatch_triggered and chat_response.emergency_details:
-            emergency_service.log_emergency(
-                chat_response.emergency_details,
-                current_user["id"]
-            )
-        
-        return chat_response
+        return _json_response(chat_response)
         
     except Exception as e:
         # Log the error
@@ -46,4 +93,74 @@ async def chat_with_medilocator(
             assistant_reply=f"Error: {str(e)}",
             dispatch_triggered=False
         )
-        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+
+def _json_response(chat_response: ChatResponse) -> Response:
+    """
+    Serialize a reply in one pass
+
+    Returning a Response skips FastAPI re-validating the model and running
+    it through jsonable_encoder; response_model still documents the shape.
+    """
+    return Response(content=chat_response.model_dump_json(), media_type="application/json")
+
+def _sse(event: str, data: str) -> str:
+    """Format a single server-sent event"""
+    return f"event: {event}\ndata: {data}\n\n"
+
+@router.post("/stream")
+async def stream_chat_with_medilocator(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Streaming variant of the chat endpoint (Server-Sent Events)
+
+    Emits `token` events as reply text arrives, a `dispatch` event as soon
+    as the model's dispatch JSON is complete, and a final `done` event
+    carrying the full ChatResponse.
+    """
+    session_id, conversation_history = await _resolve_session(request, current_user["id"])
+
+    async def event_stream():
+        final_response = None
+        emergency_logged = False
+
+        async for event, payload in chat_service.stream_chat_message(
+            message=request.message,
+            conversation_history=conversation_history,
+            user_location=request.user_location,
+            user_id=current_user["id"]
+        ):
+            if event == "token":
+                yield _sse("token", orjson.dumps({"text": payload}).decode())
+            elif event == "dispatch":
+                payload.session_id = session_id
+                # Log the incident the moment it is detected, before the
+                # rest of the reply has been streamed
+                if not emergency_logged and payload.emergency_details:
+                    await emergency_service.log_emergency(
+                        payload.emergency_details,
+                        current_user["id"],
+                        coordinates_from(request.user_location)
+                    )
+                    emergency_logged = True
+                yield _sse("dispatch", payload.model_dump_json())
+            elif event == "done":
+                final_response = payload
+                final_response.session_id = session_id
+
+        await _record_turn(session_id, current_user["id"], request.message, final_response.reply)
+        emergency_service.log_conversation(
+            user_id=current_user["id"],
+            user_message=request.message,
+            assistant_reply=final_response.reply,
+            dispatch_triggered=final_response.dispatch_triggered
+        )
+        yield _sse("done", final_response.model_dump_json())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,42 @@
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from app.core.config import settings
+from app.api.dependencies import get_current_user
+from app.services.emergency_history import InvalidPageRequest, emergency_history, etag_matches
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/user", tags=["emergencies"])
+
+@router.get("/emergencies")
+async def get_user_emergencies(
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    limit: int = Query(settings.emergency_page_size, ge=1, le=settings.emergency_page_size_max),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the current user's emergencies, newest first
+
+    Returns {"emergencies": [...], "next_cursor": ...}; pass next_cursor back
+    as `cursor` for the next page. Send the ETag as If-None-Match to get a
+    304 when the page has not changed.
+    """
+    try:
+        page = await emergency_history.get_page(current_user["id"], fields, limit, cursor)
+    except InvalidPageRequest as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        record_error(logger, "emergency", "Error getting user emergencies: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Emergency history is temporarily unavailable"
+        )
+
+    headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, page.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
@@ -0,0 +1,37 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.core.config import settings
+from app.api.dependencies import get_current_user
+from app.models.schemas import NearbyFacilitiesResponse
+from app.services.facility_locator import facility_locator
+
+router = APIRouter(prefix="/facilities", tags=["facilities"])
+
+@router.get("/nearby", response_model=NearbyFacilitiesResponse)
+async def nearby_facilities(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(settings.facilities_default_radius_km, gt=0, le=settings.facilities_max_radius_km),
+    limit: int = Query(10, ge=1, le=settings.facilities_max_results),
+    capability: List[str] = Query([], description="Required capability; repeat for several"),
+    type: Optional[str] = Query(None, description="Facility type, e.g. hospital or clinic"),
+    open_now: bool = Query(False, description="Only facilities open at this moment"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Medical facilities within radius_km of a point, nearest first"""
+    if not facility_locator.loaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Facility data is not loaded"
+        )
+    return {
+        "facilities": facility_locator.nearby(
+            lat,
+            lon,
+            radius_km=radius_km,
+            limit=limit,
+            capabilities=capability,
+            facility_type=type,
+            open_now=open_now
+        )
+    }
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse
+from app.api.dependencies import get_openai_client
 from app.core.config import settings
-from app.api.dependencies import get_current_user
-from app.services.emergency_service import emergency_service
+from app.services.persistence import persistence_scheduler
+from app.services.response_cache import response_cache
+from app.utils.openai_client import OpenAIClient
 
 router = APIRouter(tags=["health"])
 
@@ -14,8 +17,35 @@ async def health_check():
         "version": settings.api_version
     }
 
-@router.get("/user/emergencies")
-async def get_user_emergencies(current_user: dict = Depends(get_current_user)):
-    """Get emergencies for the current user"""
-    emergencies = emergency_service.get_user_emergencies(current_user["id"])
-    return {"emergencies": emergencies}
\ No newline at end of file
+@router.get("/ready")
+async def readiness_check(request: Request):
+    """
+    Readiness probe
+
+    200 once this worker has started its background services and warmed
+    its connection pools, 503 while starting or shutting down. Unlike
+    /health it tells a load balancer whether to send traffic here.
+    """
+    lifecycle = getattr(request.app.state, "lifecycle", "starting")
+    if lifecycle != "ready":
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": lifecycle})
+    return {"status": "ready"}
+
+@router.get("/health/persistence")
+async def persistence_health():
+    """Queue depth and age of the emergency and conversation persistence lanes"""
+    return persistence_scheduler.stats()
+
+@router.get("/health/cache")
+async def cache_health():
+    """Hit/miss counters for the opening-reply cache"""
+    return response_cache.stats()
+
+@router.get("/health/llm")
+async def llm_health(client: OpenAIClient = Depends(get_openai_client)):
+    """Circuit state and recent latency of each configured LLM backend"""
+    return {
+        "backends": client.backend_status(),
+        "hedges_started": client.hedges_started,
+        "hedges_won": client.hedges_won
+    }
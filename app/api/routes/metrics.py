@@ -0,0 +1,9 @@
+from fastapi import APIRouter, Response
+from app.utils.metrics import CONTENT_TYPE_LATEST, render_latest
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
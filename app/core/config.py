@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Optional, List, Dict
 import os
 
 class Settings(BaseSettings):
@@ -7,17 +7,224 @@ class Settings(BaseSettings):
     api_version: str = "1.0.0"
     project_name: str = "Medilocator API"
 
+    # Production server (serve.py)
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    # 0 runs one worker per CPU core available to the process
+    server_workers: int = 0
+    server_backlog: int = 2048
+    # Keep longer than the load balancer's idle timeout so it never reuses
+    # a connection the server has just closed
+    server_keepalive_seconds: int = 75
+    # Time in-flight requests (streamed chats included) get to finish after SIGTERM
+    server_graceful_timeout_seconds: int = 30
+    # Proxies whose X-Forwarded-For / X-Forwarded-Proto headers are trusted
+    server_forwarded_allow_ips: str = "127.0.0.1"
+    # Connections opened to Supabase and to each LLM backend before the
+    # worker reports ready (0 connects on first use)
+    warmup_connections: int = 0
+    warmup_timeout_seconds: float = 10.0
+
+    # Credentials default to empty so modules import without them (tests,
+    # scripts); the app refuses to start while one it needs is missing
+
     # Security
-    jwt_secret: str
+    jwt_secret: str = ""
     algorithm: str = "HS256"
     access_token_expire_days: int = 30
+    # Verified users are cached per worker; a deactivation reaches other
+    # workers once their cached entry expires
+    auth_user_cache_size: int = 10000
+    auth_user_cache_ttl_seconds: float = 60.0
+    last_activity_flush_interval_seconds: float = 30.0
+    # Anonymous sign-in: "supabase" creates every identity with Supabase Auth
+    # before answering; "local" mints the token here and writes the user row
+    # in batches; "pool" hands out identities pre-created with Supabase Auth
+    # and falls back to "local" while the pool is empty
+    anonymous_auth_mode: str = "supabase"
+    identity_pool_size: int = 50
+    identity_pool_refill_concurrency: int = 4
+    identity_pool_retry_seconds: float = 10.0
+    user_provisioning_batch_size: int = 200
+    user_provisioning_flush_interval_seconds: float = 0.25
+    # While inserts fail, wait this long between attempts and queue at most
+    # this many rows; unwritten users are re-created when they next sign in
+    user_provisioning_retry_seconds: float = 5.0
+    user_provisioning_max_pending: int = 10000
 
     # Supabase
-    supabase_url: str
-    supabase_key: str
+    supabase_url: str = ""
+    supabase_key: str = ""
+    # "supabase" for the real database, "memory" for the offline stub backend
+    data_backend: str = "supabase"
+    supabase_timeout_seconds: float = 10.0
+    supabase_max_connections: int = 50
+    supabase_max_keepalive_connections: int = 20
 
     # OpenAI
-    openai_api_key: str
+    openai_api_key: str = ""
+    openai_model: str = "gpt-3.5-turbo"
+    openai_base_url: Optional[str] = None
+    openai_timeout_seconds: float = 30.0
+    openai_connect_timeout_seconds: float = 5.0
+    # Failover between backends replaces SDK-level retries
+    openai_max_retries: int = 0
+    # Upper bound on concurrent upstream calls per worker; extra calls queue
+    openai_max_concurrency: int = 64
+    openai_queue_timeout_seconds: float = 10.0
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 50
+    openai_keepalive_expiry_seconds: float = 30.0
+
+    # LLM backends, tried in order. JSON list of objects with "model" and
+    # optional "name", "base_url" and "api_key"; defaults to the single
+    # backend described by the OPENAI_* settings above
+    llm_backends: List[Dict[str, Optional[str]]] = []
+    llm_hedge_enabled: bool = True
+    # Fire a hedged attempt once a call outlasts this latency percentile
+    llm_hedge_percentile: float = 0.95
+    llm_hedge_initial_delay_seconds: float = 3.0
+    llm_hedge_min_delay_seconds: float = 0.5
+    llm_max_hedges: int = 1
+    llm_latency_window: int = 200
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+
+    # Dispatch straight from the local triage extractor, without the LLM,
+    # when it finds location, incident and victim count in a plain report.
+    # Off by default: triage then only pre-fills details for the model to confirm
+    triage_auto_dispatch: bool = False
+    # Earlier caller turns are re-read on every request; their extractions
+    # are cached per worker
+    triage_cache_size: int = 10000
+
+    # Nearby facilities, loaded from a local CSV or GeoJSON file and reloaded
+    # when it changes
+    facilities_path: Optional[str] = None
+    facilities_reload_interval_seconds: float = 30.0
+    facilities_grid_cell_degrees: float = 0.1
+    facilities_default_radius_km: float = 10.0
+    facilities_max_radius_km: float = 200.0
+    facilities_max_results: int = 50
+    facilities_timezone: str = "Africa/Kampala"
+    # Add the closest open facilities to the prompt when the caller shares coordinates
+    facilities_chat_context: bool = True
+    facilities_chat_context_count: int = 3
+
+    # Offline geocoding of free-text incident locations against a local
+    # gazetteer CSV, reloaded when it changes
+    gazetteer_path: Optional[str] = None
+    gazetteer_reload_interval_seconds: float = 60.0
+    geocoder_cache_size: int = 10000
+    geocoder_min_similarity: float = 0.6
+
+    # Ambulance assignment. Units come from FLEET_PATH (CSV) and the admin API;
+    # incidents queued within one batch interval are assigned together
+    fleet_path: Optional[str] = None
+    dispatch_grid_cell_degrees: float = 0.05
+    dispatch_batch_interval_seconds: float = 0.05
+    dispatch_batch_size: int = 256
+    dispatch_candidates_per_incident: int = 4
+    dispatch_max_search_km: float = 100.0
+    # Key for the /admin endpoints (X-Admin-Key header); they are disabled when unset
+    admin_api_key: Optional[str] = None
+
+    # Near-duplicate dispatches: a new incident is compared with those of the
+    # last window, nearby with similar text or, without coordinates, with
+    # near-identical text. A match only records which incident it repeats;
+    # the unit is withheld only once a dispatcher confirms it
+    dedup_enabled: bool = True
+    dedup_window_seconds: float = 900.0
+    dedup_radius_km: float = 0.5
+    dedup_nearby_similarity: float = 0.2
+    dedup_text_similarity: float = 0.6
+    dedup_bucket_size: int = 32
+
+    # Live dispatch feed for dispatcher consoles (SSE, per worker). Each
+    # console may have this many events waiting before it is caught up from
+    # the history kept for Last-Event-ID resumes
+    dispatch_feed_queue_size: int = 64
+    dispatch_feed_history_size: int = 1000
+    dispatch_feed_max_subscribers: int = 1000
+    dispatch_feed_heartbeat_seconds: float = 15.0
+
+    # Cache for opening replies (kill switch: RESPONSE_CACHE_ENABLED=false)
+    response_cache_enabled: bool = True
+    response_cache_size: int = 1000
+    response_cache_ttl_seconds: float = 600.0
+
+    # Prompt context budget per OpenAI call
+    context_token_budget: int = 1500
+    context_min_recent_messages: int = 6
+    context_summary_max_tokens: int = 200
+
+    # Emergency incident writes (high-priority lane)
+    emergency_write_workers: int = 4
+    emergency_write_max_retries: int = 5
+    emergency_write_retry_base_seconds: float = 0.2
+    emergency_write_timeout_seconds: float = 5.0
+    emergency_confirm_timeout_seconds: float = 3.0
+    emergency_spool_path: str = "var/emergency_spool.jsonl"
+    # Incidents spooled while running are replayed this often, by whichever
+    # worker takes the replay lock, once inserts stop failing
+    emergency_spool_replay_interval_seconds: float = 30.0
+    # On shutdown, incidents still unwritten after this long are spooled to
+    # disk and written by the next worker to start
+    shutdown_drain_timeout_seconds: float = 20.0
+
+    # Emergency history pages; rendered pages are cached briefly per worker
+    # and dropped when that user logs a new incident
+    emergency_page_size: int = 20
+    emergency_page_size_max: int = 100
+    emergency_history_cache_size: int = 10000
+    emergency_history_cache_ttl_seconds: float = 5.0
+
+    # Bulk exports (admin API and scripts/export_records.py) read this many
+    # rows per query; Parquet row groups collect pages up to the second size
+    export_page_size: int = 1000
+    export_row_group_size: int = 50000
+
+    # Conversation logging (write-behind)
+    conversation_log_batch_size: int = 100
+    conversation_log_flush_interval_seconds: float = 1.0
+    conversation_log_max_queue: int = 10000
+    conversation_log_write_timeout_seconds: float = 5.0
+    conversation_log_spool_path: str = "var/conversation_spool.jsonl"
+
+    # Admission control: token buckets per user (per client IP before sign-in)
+    # and a per-worker concurrency limit of which background work (sign-ins,
+    # history, facilities) may use a share, then conversations; the rest is
+    # reserved for callers who were dispatched or gave a complete report
+    admission_enabled: bool = True
+    # "memory" per worker, or "redis" to share buckets across workers
+    admission_backend: str = "memory"
+    admission_redis_url: str = "redis://localhost:6379/0"
+    admission_max_tracked_keys: int = 100000
+    admission_max_concurrency: int = 256
+    admission_conversation_share: float = 0.9
+    admission_background_share: float = 0.6
+    admission_user_rate_per_second: float = 2.0
+    admission_user_burst: int = 20
+    # Generous because many callers share carrier-grade NAT addresses
+    admission_ip_rate_per_second: float = 5.0
+    admission_ip_burst: int = 50
+    # Bucket for those callers, kept separate from and above the user bucket
+    admission_emergency_rate_per_second: float = 5.0
+    admission_emergency_burst: int = 50
+    admission_emergency_ttl_seconds: float = 1800.0
+
+    # Chat sessions ("memory" per worker, or "redis" to share across workers)
+    session_backend: str = "memory"
+    session_redis_url: str = "redis://localhost:6379/0"
+    session_max_sessions: int = 10000
+    session_ttl_seconds: float = 3600.0
+    session_max_messages: int = 50
+    session_max_chars: int = 20000
+
+    # Metrics and logging
+    metrics_enabled: bool = True
+    metrics_loop_lag_interval_seconds: float = 0.5
+    log_level: str = "INFO"
 
     # CORS
     cors_origins: List[str] = ["*"]
@@ -26,18 +233,12 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = False
 
+    def missing_credentials(self) -> List[str]:
+        """Environment variables the API needs that are not set"""
+        required = ["jwt_secret", "openai_api_key"]
+        if self.data_backend == "supabase":
+            required += ["supabase_url", "supabase_key"]
+        return [name.upper() for name in required if not getattr(self, name)]
+
 # Create the settings instance
 settings = Settings()
-
-# Ensure required environment variables are set
-if not settings.supabase_url:
-    raise ValueError("SUPABASE_URL environment variable is required")
-
-if not settings.supabase_key:
-    raise ValueError("SUPABASE_KEY environment variable is required")
-
-if not settings.openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
-
-if not settings.jwt_secret:
-    raise ValueError("JWT_SECRET environment variable is required")
\ No newline at end of file
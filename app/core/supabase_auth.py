@@ -1,17 +1,20 @@
 """
 Supabase authentication utilities
 """
+import logging
 from typing import Optional, Dict, Any
 from fastapi import HTTPException, status
-from supabase import Client
 from app.core.config import settings
-from app.models.database import supabase
+from app.models.repository import Repository, repository
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
 
 class SupabaseAuth:
     """Handles Supabase authentication operations"""
     
-    def __init__(self, supabase_client: Client = supabase):
-        self.supabase = supabase_client
+    def __init__(self, repo: Repository = repository):
+        self.repository = repo
     
     async def get_user(self, token: str) -> Optional[Dict[str, Any]]:
         """
@@ -25,30 +28,23 @@ class SupabaseAuth:
         """
         try:
             # Verify the token with Supabase
-            user = self.supabase.auth.get_user(token)
-            if not user or not user.user:
+            user_id = await self.repository.auth_get_user_id(token)
+            if not user_id:
                 return None
                 
             # Get additional user data from our database
-            response = self.supabase.table("anonymous_users")\
-                .select("*")\
-                .eq("id", user.user.id)\
-                .single()\
-                .execute()
+            user = await self.repository.get_anonymous_user(user_id)
                 
-            if not response.data:
+            if not user:
                 return None
                 
             # Update last activity
-            self.supabase.table("anonymous_users")\
-                .update({"last_activity": "now()"})\
-                .eq("id", user.user.id)\
-                .execute()
+            await self.repository.update_anonymous_user(user_id, {"last_activity": "now()"})
                 
-            return response.data
+            return user
             
         except Exception as e:
-            print(f"Error getting user: {str(e)}")
+            record_error(logger, "auth", "Error getting user: %s", e)
             return None
     
     async def sign_in_anonymously(self) -> Dict[str, Any]:
@@ -64,10 +60,9 @@ class SupabaseAuth:
         """
         try:
             # Sign in anonymously
-            auth_response = self.supabase.auth.sign_in_anonymously()
-            user = auth_response.user
+            auth_user = await self.repository.auth_sign_in_anonymously()
             
-            if not user:
+            if not auth_user:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Failed to create anonymous user"
@@ -75,25 +70,23 @@ class SupabaseAuth:
             
             # Store/update user in our database
             user_data = {
-                "id": user.id,
+                "id": auth_user["user_id"],
                 "is_active": True
             }
             
-            self.supabase.table("anonymous_users")\
-                .upsert(user_data, on_conflict="id")\
-                .execute()
+            await self.repository.upsert_anonymous_user(user_data)
             
             return {
-                "access_token": auth_response.session.access_token,
+                "access_token": auth_user["access_token"],
                 "token_type": "bearer",
                 "user": {
-                    "id": user.id,
+                    "id": auth_user["user_id"],
                     "is_anonymous": True
                 }
             }
             
         except Exception as e:
-            print(f"Error in sign_in_anonymously: {str(e)}")
+            record_error(logger, "auth", "Error in sign_in_anonymously: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to sign in anonymously: {str(e)}"
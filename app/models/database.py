@@ -1,6 +1,83 @@
-from supabase import create_client, Client
-import os
+"""
+Lazily created async Supabase clients
+
+Nothing here runs at import: the supabase package, the pooled transport and
+both clients are created on first use, or at startup by the repository
+warm-up.
+"""
+import asyncio
+from typing import TYPE_CHECKING, Optional
+import httpx
 from app.core.config import settings
 
-# Initialize Supabase client
-supabase: Client = create_client(settings.supabase_url, settings.supabase_key)
\ No newline at end of file
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+# Pooled HTTP transport shared by every Supabase client on this worker
+_http_client: Optional[httpx.AsyncClient] = None
+_db_client: Optional["AsyncClient"] = None
+_auth_client: Optional["AsyncClient"] = None
+_lock: Optional[asyncio.Lock] = None
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.supabase_max_connections,
+                max_keepalive_connections=settings.supabase_max_keepalive_connections
+            ),
+            timeout=httpx.Timeout(settings.supabase_timeout_seconds)
+        )
+    return _http_client
+
+async def _create_client() -> "AsyncClient":
+    # Imported here; the package takes a noticeable share of startup time
+    from supabase import AsyncClientOptions, acreate_client
+    options = AsyncClientOptions(
+        httpx_client=_get_http_client(),
+        persist_session=False,
+        auto_refresh_token=False,
+        postgrest_client_timeout=settings.supabase_timeout_seconds
+    )
+    return await acreate_client(settings.supabase_url, settings.supabase_key, options=options)
+
+async def get_supabase() -> "AsyncClient":
+    """
+    Get the Supabase client used for table access
+
+    This client never signs in, so queries always run with the service key.
+    """
+    global _db_client, _lock
+    if _db_client is None:
+        if _lock is None:
+            _lock = asyncio.Lock()
+        async with _lock:
+            if _db_client is None:
+                _db_client = await _create_client()
+    return _db_client
+
+async def get_supabase_auth() -> "AsyncClient":
+    """
+    Get the Supabase client used for Auth calls
+
+    Kept separate from the table client because signing in switches the
+    client's session, which would otherwise leak into database queries.
+    """
+    global _auth_client, _lock
+    if _auth_client is None:
+        if _lock is None:
+            _lock = asyncio.Lock()
+        async with _lock:
+            if _auth_client is None:
+                _auth_client = await _create_client()
+    return _auth_client
+
+async def close_supabase() -> None:
+    """Close the pooled Supabase connections"""
+    global _http_client, _db_client, _auth_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _db_client = None
+    _auth_client = None
@@ -0,0 +1,424 @@
+"""
+Async data-access layer for the Medilocator tables
+
+Every read and write against `anonymous_users`, `conversation_messages`
+and `emergency_incidents` goes through a Repository, so request handlers
+never block the event loop on a database round trip. Set
+DATA_BACKEND=memory to use the in-process stub instead of Supabase.
+"""
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.models.database import get_supabase, get_supabase_auth, close_supabase
+from app.utils.metrics import observe_db
+
+class Repository(ABC):
+    """Interface shared by the Supabase and in-memory backends"""
+
+    @abstractmethod
+    async def auth_sign_in_anonymously(self) -> Optional[Dict[str, Any]]:
+        """
+        Create an anonymous identity with the auth provider
+
+        Returns:
+            Optional[Dict]: {'user_id': str, 'access_token': str} or None
+        """
+
+    @abstractmethod
+    async def auth_get_user_id(self, token: str) -> Optional[str]:
+        """Resolve an auth provider token to its user ID"""
+
+    @abstractmethod
+    async def get_anonymous_user(self, user_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def upsert_anonymous_user(self, user_data: Dict) -> None:
+        ...
+
+    @abstractmethod
+    async def insert_anonymous_users(self, rows: List[Dict]) -> None:
+        """Create user rows in one statement; ids that already exist are left untouched"""
+
+    @abstractmethod
+    async def update_anonymous_user(self, user_id: str, values: Dict) -> None:
+        ...
+
+    @abstractmethod
+    async def touch_anonymous_users(self, user_ids: List[str], last_activity: str) -> None:
+        """Set last_activity for many users in one statement"""
+
+    @abstractmethod
+    async def insert_conversation_messages(self, rows: List[Dict]) -> List[Dict]:
+        """Insert one or more conversation rows in a single statement"""
+
+    @abstractmethod
+    async def insert_emergency_incident(self, row: Dict) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def update_emergency_incident(self, incident_id: str, values: Dict) -> bool:
+        """Update one incident; returns False if no row has that id (yet)"""
+
+    @abstractmethod
+    async def list_user_emergencies(
+        self,
+        user_id: str,
+        columns: List[str],
+        limit: int,
+        before: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """
+        One page of a user's incidents, newest first
+
+        Ordered by (created_at, id) descending. `before` is the (created_at, id)
+        of the last row of the previous page; only older rows are returned.
+        Relies on the (user_id, created_at desc, id desc) index.
+        """
+
+    @abstractmethod
+    async def list_unlocated_emergencies(self, limit: int, after_id: Optional[str] = None) -> List[Dict]:
+        """
+        Incidents with no coordinates yet, as {id, location} in id order
+
+        `after_id` is the last id of the previous batch; used by backfills.
+        """
+
+    @abstractmethod
+    async def export_rows(
+        self,
+        table: str,
+        columns: List[str],
+        limit: int,
+        after: Optional[Tuple[str, Any]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        equals: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """
+        One page of any table for bulk exports, oldest first
+
+        Ordered by (created_at, id) ascending. `after` is the (created_at, id)
+        of the last row of the previous page. `since` is inclusive, `until`
+        exclusive, and `equals` holds column values every row must match.
+        Relies on a (created_at, id) index on the table.
+        """
+
+    async def warm_up(self, connections: int) -> None:
+        """Open pooled connections before the first request needs them"""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class SupabaseRepository(Repository):
+    """Repository backed by the async supabase-py client"""
+
+    @observe_db("auth", "sign_in_anonymously")
+    async def auth_sign_in_anonymously(self) -> Optional[Dict[str, Any]]:
+        client = await get_supabase_auth()
+        auth_response = await client.auth.sign_in_anonymously()
+        if not auth_response.user:
+            return None
+        return {
+            "user_id": auth_response.user.id,
+            "access_token": auth_response.session.access_token if auth_response.session else None
+        }
+
+    @observe_db("auth", "get_user")
+    async def auth_get_user_id(self, token: str) -> Optional[str]:
+        client = await get_supabase_auth()
+        user = await client.auth.get_user(token)
+        if not user or not user.user:
+            return None
+        return user.user.id
+
+    @observe_db("anonymous_users", "select")
+    async def get_anonymous_user(self, user_id: str) -> Optional[Dict]:
+        client = await get_supabase()
+        response = await client.table("anonymous_users")\
+            .select("*")\
+            .eq("id", user_id)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+
+    @observe_db("anonymous_users", "upsert")
+    async def upsert_anonymous_user(self, user_data: Dict) -> None:
+        client = await get_supabase()
+        await client.table("anonymous_users")\
+            .upsert(user_data, on_conflict="id")\
+            .execute()
+
+    @observe_db("anonymous_users", "insert_many")
+    async def insert_anonymous_users(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        client = await get_supabase()
+        await client.table("anonymous_users")\
+            .upsert(rows, on_conflict="id", ignore_duplicates=True, returning="minimal")\
+            .execute()
+
+    @observe_db("anonymous_users", "update")
+    async def update_anonymous_user(self, user_id: str, values: Dict) -> None:
+        client = await get_supabase()
+        await client.table("anonymous_users")\
+            .update(values)\
+            .eq("id", user_id)\
+            .execute()
+
+    @observe_db("anonymous_users", "update_many")
+    async def touch_anonymous_users(self, user_ids: List[str], last_activity: str) -> None:
+        if not user_ids:
+            return
+        client = await get_supabase()
+        await client.table("anonymous_users")\
+            .update({"last_activity": last_activity})\
+            .in_("id", user_ids)\
+            .execute()
+
+    @observe_db("conversation_messages", "insert")
+    async def insert_conversation_messages(self, rows: List[Dict]) -> List[Dict]:
+        if not rows:
+            return []
+        client = await get_supabase()
+        response = await client.table("conversation_messages").insert(rows).execute()
+        return response.data or []
+
+    @observe_db("emergency_incidents", "insert")
+    async def insert_emergency_incident(self, row: Dict) -> Optional[Dict]:
+        client = await get_supabase()
+        table = client.table("emergency_incidents")
+        # Rows carry their own id, so a retried or replayed write is skipped
+        # rather than stored twice
+        query = table.upsert(row, on_conflict="id", ignore_duplicates=True) if "id" in row else table.insert(row)
+        response = await query.execute()
+        return response.data[0] if response.data else None
+
+    @observe_db("emergency_incidents", "update")
+    async def update_emergency_incident(self, incident_id: str, values: Dict) -> bool:
+        client = await get_supabase()
+        result = await client.table("emergency_incidents")\
+            .update(values)\
+            .eq("id", incident_id)\
+            .execute()
+        return bool(result.data)
+
+    @observe_db("emergency_incidents", "select")
+    async def list_user_emergencies(
+        self,
+        user_id: str,
+        columns: List[str],
+        limit: int,
+        before: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        client = await get_supabase()
+        query = client.table("emergency_incidents")\
+            .select(",".join(columns))\
+            .eq("user_id", user_id)
+        if before is not None:
+            created_at, row_id = before
+            # Row-value comparison (created_at, id) < (before) spelled as a logic tree
+            query = query.or_(
+                f'created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{row_id}")'
+            )
+        response = await query\
+            .order("created_at", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data
+
+    @observe_db("emergency_incidents", "select")
+    async def list_unlocated_emergencies(self, limit: int, after_id: Optional[str] = None) -> List[Dict]:
+        client = await get_supabase()
+        query = client.table("emergency_incidents")\
+            .select("id,location")\
+            .is_("latitude", "null")
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        response = await query\
+            .order("id")\
+            .limit(limit)\
+            .execute()
+        return response.data
+
+    @observe_db("export", "select")
+    async def export_rows(
+        self,
+        table: str,
+        columns: List[str],
+        limit: int,
+        after: Optional[Tuple[str, Any]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        equals: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        client = await get_supabase()
+        query = client.table(table).select(",".join(columns))
+        if since is not None:
+            query = query.gte("created_at", since)
+        if until is not None:
+            query = query.lt("created_at", until)
+        for column, value in (equals or {}).items():
+            query = query.eq(column, value)
+        if after is not None:
+            created_at, row_id = after
+            # Row-value comparison (created_at, id) > (after) spelled as a logic tree
+            query = query.or_(
+                f'created_at.gt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.gt."{row_id}")'
+            )
+        response = await query\
+            .order("created_at")\
+            .order("id")\
+            .limit(limit)\
+            .execute()
+        return response.data
+
+    async def warm_up(self, connections: int) -> None:
+        client = await get_supabase()
+        await get_supabase_auth()
+        # Concurrent reads each hold a connection, which then stays pooled
+        await asyncio.gather(*(
+            client.table("anonymous_users").select("id").limit(1).execute()
+            for _ in range(connections)
+        ))
+
+    async def close(self) -> None:
+        await close_supabase()
+
+class InMemoryRepository(Repository):
+    """Offline stub backend that keeps every table in process memory"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict]] = {
+            "anonymous_users": [],
+            "conversation_messages": [],
+            "emergency_incidents": []
+        }
+        self.auth_tokens: Dict[str, str] = {}
+
+    def _insert(self, table: str, row: Dict) -> Dict:
+        stored = {"id": str(uuid.uuid4()), "created_at": datetime.utcnow().isoformat(), **row}
+        self.tables[table].append(stored)
+        return dict(stored)
+
+    def _find_user(self, user_id: str) -> Optional[Dict]:
+        for row in self.tables["anonymous_users"]:
+            if row["id"] == user_id:
+                return row
+        return None
+
+    async def auth_sign_in_anonymously(self) -> Optional[Dict[str, Any]]:
+        user_id = str(uuid.uuid4())
+        access_token = uuid.uuid4().hex
+        self.auth_tokens[access_token] = user_id
+        return {"user_id": user_id, "access_token": access_token}
+
+    async def auth_get_user_id(self, token: str) -> Optional[str]:
+        return self.auth_tokens.get(token)
+
+    async def get_anonymous_user(self, user_id: str) -> Optional[Dict]:
+        row = self._find_user(user_id)
+        return dict(row) if row else None
+
+    async def upsert_anonymous_user(self, user_data: Dict) -> None:
+        row = self._find_user(user_data["id"])
+        if row:
+            row.update(user_data)
+        else:
+            self._insert("anonymous_users", user_data)
+
+    async def insert_anonymous_users(self, rows: List[Dict]) -> None:
+        for row in rows:
+            if not self._find_user(row["id"]):
+                self._insert("anonymous_users", row)
+
+    async def update_anonymous_user(self, user_id: str, values: Dict) -> None:
+        row = self._find_user(user_id)
+        if row:
+            row.update(values)
+
+    async def touch_anonymous_users(self, user_ids: List[str], last_activity: str) -> None:
+        wanted = set(user_ids)
+        for row in self.tables["anonymous_users"]:
+            if row["id"] in wanted:
+                row["last_activity"] = last_activity
+
+    async def insert_conversation_messages(self, rows: List[Dict]) -> List[Dict]:
+        return [self._insert("conversation_messages", row) for row in rows]
+
+    async def insert_emergency_incident(self, row: Dict) -> Optional[Dict]:
+        if "id" in row and any(stored["id"] == row["id"] for stored in self.tables["emergency_incidents"]):
+            return None
+        return self._insert("emergency_incidents", row)
+
+    async def update_emergency_incident(self, incident_id: str, values: Dict) -> bool:
+        for row in self.tables["emergency_incidents"]:
+            if row["id"] == incident_id:
+                row.update(values)
+                return True
+        return False
+
+    async def list_user_emergencies(
+        self,
+        user_id: str,
+        columns: List[str],
+        limit: int,
+        before: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        rows = [
+            row for row in self.tables["emergency_incidents"]
+            if row.get("user_id") == user_id
+            and (before is None or (row["created_at"], row["id"]) < before)
+        ]
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return [{column: row.get(column) for column in columns} for row in rows[:limit]]
+
+    async def list_unlocated_emergencies(self, limit: int, after_id: Optional[str] = None) -> List[Dict]:
+        rows = sorted(
+            (
+                row for row in self.tables["emergency_incidents"]
+                if row.get("latitude") is None and (after_id is None or row["id"] > after_id)
+            ),
+            key=lambda row: row["id"]
+        )
+        return [{"id": row["id"], "location": row.get("location")} for row in rows[:limit]]
+
+    async def export_rows(
+        self,
+        table: str,
+        columns: List[str],
+        limit: int,
+        after: Optional[Tuple[str, Any]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        equals: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        rows = sorted(
+            (
+                row for row in self.tables[table]
+                if (after is None or (row["created_at"], row["id"]) > after)
+                and (since is None or row["created_at"] >= since)
+                and (until is None or row["created_at"] < until)
+                and all(row.get(column) == value for column, value in (equals or {}).items())
+            ),
+            key=lambda row: (row["created_at"], row["id"])
+        )
+        return [{column: row.get(column) for column in columns} for row in rows[:limit]]
+
+def create_repository(backend: str) -> Repository:
+    """Build the repository for the configured data backend"""
+    if backend == "supabase":
+        return SupabaseRepository()
+    if backend == "memory":
+        return InMemoryRepository()
+    raise ValueError(f"Unknown data backend: {backend}")
+
+# Shared repository instance
+repository = create_repository(settings.data_backend)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -8,6 +8,8 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Returned by a previous reply; when set, conversation_history can be omitted
+    session_id: Optional[str] = None
     conversation_history: List[ChatMessage] = []
     user_location: Optional[Dict[str, Any]] = None
 
@@ -16,6 +18,47 @@ class ChatResponse(BaseModel):
     emergency_details: Optional[Dict[str, Any]] = None
     dispatch_triggered: bool = False
     requires_location: bool = False
+    session_id: Optional[str] = None
+
+class NearbyFacility(BaseModel):
+    """A medical facility near the requested point"""
+    id: str
+    name: str
+    type: str
+    latitude: float
+    longitude: float
+    capabilities: List[str] = []
+    hours: str
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    distance_km: float
+
+class NearbyFacilitiesResponse(BaseModel):
+    facilities: List[NearbyFacility]
+
+class UnitUpdate(BaseModel):
+    """Position report or status change for an ambulance unit"""
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    capabilities: Optional[List[str]] = None
+    available: Optional[bool] = None
+
+class UnitRelease(BaseModel):
+    """Where a unit becomes free; defaults to its last reported position"""
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class DuplicateConfirmation(BaseModel):
+    """The incident a dispatcher confirmed this one repeats"""
+    duplicate_of: str = Field(..., min_length=1, max_length=64)
+
+class UnitStatus(BaseModel):
+    id: str
+    latitude: float
+    longitude: float
+    capabilities: List[str] = []
+    available: bool
+    incident_id: Optional[str] = None
 
 class AnonymousUser(BaseModel):
     """Anonymous user model"""
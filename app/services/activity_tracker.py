@@ -0,0 +1,82 @@
+"""
+Debounced last_activity updates
+
+Authenticated requests record the user in memory instead of writing to
+`anonymous_users` each time. A background task periodically writes every
+user seen since the last flush in a handful of bulk updates.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Set
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.utils.metrics import QUEUE_DEPTH, record_error
+
+logger = logging.getLogger(__name__)
+
+# Keeps the `id=in.(...)` filter well under URL length limits
+FLUSH_CHUNK_SIZE = 200
+
+class ActivityTracker:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        flush_interval: float = settings.last_activity_flush_interval_seconds
+    ):
+        self.repository = repo
+        self.flush_interval = flush_interval
+        self._pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        """Number of users with an unwritten activity update"""
+        return len(self._pending)
+
+    def touch(self, user_id: str) -> None:
+        """Record activity for a user; repeated touches coalesce"""
+        self._pending.add(user_id)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and write any pending updates"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write last_activity for every user touched since the last flush"""
+        if not self._pending:
+            return
+
+        user_ids: List[str] = list(self._pending)
+        self._pending.clear()
+        last_activity = datetime.utcnow().isoformat()
+
+        for start in range(0, len(user_ids), FLUSH_CHUNK_SIZE):
+            chunk = user_ids[start:start + FLUSH_CHUNK_SIZE]
+            try:
+                await self.repository.touch_anonymous_users(chunk, last_activity)
+            except Exception as e:
+                record_error(logger, "activity", "Error updating last activity: %s", e)
+                # Retry on the next flush; newer touches are already coalesced
+                self._pending.update(chunk)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+activity_tracker = ActivityTracker()
+
+QUEUE_DEPTH.labels("activity_updates").set_function(lambda: activity_tracker.depth)
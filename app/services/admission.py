@@ -0,0 +1,226 @@
+"""
+Admission control and load shedding
+
+Every request is given a priority before it reaches a route:
+
+    EMERGENCY     chat from a caller who has been dispatched or has given
+                  a complete, first-hand report (marked by the chat service)
+    CONVERSATION  any other chat turn
+    BACKGROUND    new sign-ins, history reads, facility lookups
+
+Requests are first charged to a token bucket: per user when they carry a
+valid token, otherwise per client IP, which is what limits floods of new
+sign-ins. Admitted requests then count against a per-worker concurrency
+limit. Each class may only use part of it, so BACKGROUND work is shed
+first, then CONVERSATION, and the slots above the CONVERSATION share are
+held for EMERGENCY. EMERGENCY requests are charged to a separate, larger
+bucket, so a marked caller is not slowed by their earlier turns but still
+cannot flood the worker.
+
+Bucket and emergency state live in memory per worker, or in Redis
+(ADMISSION_BACKEND=redis) so that every worker sees the same limits.
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.core.config import settings
+from app.core.security import verify_token
+from app.utils.cache import TTLCache
+from app.utils.metrics import QUEUE_DEPTH
+
+EMERGENCY = 0
+CONVERSATION = 1
+BACKGROUND = 2
+EXEMPT = -1
+PRIORITY_NAMES = {EMERGENCY: "emergency", CONVERSATION: "conversation", BACKGROUND: "background"}
+
+# Path prefixes with a fixed class; everything else is BACKGROUND
+ROUTE_CLASSES = (
+    ("/api/v1/chat", CONVERSATION),
+    ("/api/v1/health", EXEMPT),
+    ("/api/v1/ready", EXEMPT),
+    ("/api/v1/admin", EXEMPT),
+    ("/metrics", EXEMPT),
+    ("/docs", EXEMPT),
+    ("/redoc", EXEMPT),
+    ("/openapi.json", EXEMPT)
+)
+
+class AdmissionBackend(ABC):
+    """Storage interface for token buckets and emergency marks"""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> bool:
+        """Take one token from a bucket; False if it is empty"""
+
+    @abstractmethod
+    async def mark_emergency(self, user_id: str, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def is_emergency(self, user_id: str) -> bool:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class InMemoryAdmissionBackend(AdmissionBackend):
+    """Per-worker buckets, least recently used evicted beyond max_keys"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._emergencies: TTLCache[bool] = TTLCache(maxsize=max_keys, ttl=settings.admission_emergency_ttl_seconds)
+
+    async def take(self, key: str, rate: float, burst: int) -> bool:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    async def mark_emergency(self, user_id: str, ttl: float) -> None:
+        self._emergencies.set(user_id, True, ttl=ttl)
+
+    async def is_emergency(self, user_id: str) -> bool:
+        return user_id in self._emergencies
+
+class RedisAdmissionBackend(AdmissionBackend):
+    """Buckets and marks shared between workers through Redis"""
+
+    # Refill, take and store in one round trip; idle buckets expire once full
+    TAKE_SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or burst
+    local at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("ADMISSION_BACKEND=redis requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> bool:
+        allowed = await self._take(keys=[f"medilocator:bucket:{key}"], args=[rate, burst, time.time()])
+        return bool(allowed)
+
+    async def mark_emergency(self, user_id: str, ttl: float) -> None:
+        await self.client.set(f"medilocator:emergency:{user_id}", 1, ex=max(1, int(ttl)))
+
+    async def is_emergency(self, user_id: str) -> bool:
+        return bool(await self.client.exists(f"medilocator:emergency:{user_id}"))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+class AdmissionController:
+    def __init__(
+        self,
+        backend: AdmissionBackend,
+        max_concurrency: int = settings.admission_max_concurrency,
+        conversation_share: float = settings.admission_conversation_share,
+        background_share: float = settings.admission_background_share
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        # Concurrency each class may use before it is shed; what the
+        # conversation share leaves is reserved for EMERGENCY
+        self.limits = {
+            EMERGENCY: max_concurrency,
+            CONVERSATION: max(1, int(max_concurrency * conversation_share)),
+            BACKGROUND: max(1, int(max_concurrency * background_share))
+        }
+        self.in_flight = 0
+        # Bearer token -> user id, so classification skips repeat JWT decodes
+        self._subjects: TTLCache[str] = TTLCache(maxsize=settings.auth_user_cache_size, ttl=settings.auth_user_cache_ttl_seconds)
+
+    @staticmethod
+    def route_class(path: str) -> int:
+        for prefix, priority in ROUTE_CLASSES:
+            if path.startswith(prefix):
+                return priority
+        return BACKGROUND
+
+    def subject(self, token: str) -> Optional[str]:
+        """User id of a valid bearer token, or None"""
+        user_id = self._subjects.get(token)
+        if user_id is None:
+            try:
+                user_id = verify_token(token).get("sub")
+            except Exception:
+                return None
+            if not user_id:
+                return None
+            self._subjects.set(token, user_id)
+        return user_id
+
+    async def classify(self, path: str, token: Optional[str], client_ip: str) -> Tuple[int, str]:
+        """Priority of a request and the bucket key it is charged to"""
+        priority = self.route_class(path)
+        if priority == EXEMPT:
+            return priority, ""
+        user_id = self.subject(token) if token else None
+        if user_id is None:
+            return priority, f"ip:{client_ip}"
+        if priority == CONVERSATION and await self.backend.is_emergency(user_id):
+            return EMERGENCY, f"emergency:{user_id}"
+        return priority, f"user:{user_id}"
+
+    async def allow_rate(self, priority: int, key: str) -> bool:
+        if priority == EMERGENCY:
+            return await self.backend.take(
+                key, settings.admission_emergency_rate_per_second, settings.admission_emergency_burst
+            )
+        if key.startswith("ip:"):
+            return await self.backend.take(key, settings.admission_ip_rate_per_second, settings.admission_ip_burst)
+        return await self.backend.take(key, settings.admission_user_rate_per_second, settings.admission_user_burst)
+
+    def try_acquire(self, priority: int) -> bool:
+        """Take a concurrency slot if this class still has headroom"""
+        if self.in_flight >= self.limits[priority]:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    async def mark_emergency(self, user_id: str) -> None:
+        """Give a caller's chat requests EMERGENCY priority for a while"""
+        await self.backend.mark_emergency(user_id, settings.admission_emergency_ttl_seconds)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+def create_admission_backend(backend: str) -> AdmissionBackend:
+    """Build the admission backend for the configured name"""
+    if backend == "memory":
+        return InMemoryAdmissionBackend(max_keys=settings.admission_max_tracked_keys)
+    if backend == "redis":
+        return RedisAdmissionBackend(settings.admission_redis_url)
+    raise ValueError(f"Unknown admission backend: {backend}")
+
+admission_controller = AdmissionController(create_admission_backend(settings.admission_backend))
+
+QUEUE_DEPTH.labels("admitted_requests").set_function(lambda: admission_controller.in_flight)
@@ -1,49 +1,109 @@
+import logging
+import uuid
 from typing import Optional, Dict, Tuple
 from datetime import datetime, timedelta
-from supabase import Client
 from app.core.config import settings
-from app.models.database import supabase
+from app.models.repository import Repository, repository
 from app.core.security import create_access_token
 from app.models.schemas import Token
+from app.services.activity_tracker import ActivityTracker, activity_tracker
+from app.services.user_provisioning import IdentityPool, UserProvisioner, identity_pool, user_provisioner
+from app.utils.cache import TTLCache
+from app.utils.metrics import SIGN_INS, record_error
+
+logger = logging.getLogger(__name__)
 
 class AuthService:
-    def __init__(self, supabase_client: Client = supabase):
-        self.supabase = supabase_client
+    def __init__(
+        self,
+        repo: Repository = repository,
+        tracker: ActivityTracker = activity_tracker,
+        provisioner: UserProvisioner = user_provisioner,
+        pool: IdentityPool = identity_pool,
+        mode: str = settings.anonymous_auth_mode
+    ):
+        self.repository = repo
+        self.activity_tracker = tracker
+        self.provisioner = provisioner
+        self.identity_pool = pool
+        self.mode = mode
+        # Verified users keyed by token subject
+        self.user_cache: TTLCache[Dict] = TTLCache(
+            maxsize=settings.auth_user_cache_size,
+            ttl=settings.auth_user_cache_ttl_seconds
+        )
 
     async def sign_in_anonymously(self) -> Tuple[Optional[Dict], Optional[str]]:
+        """Sign in anonymously, per ANONYMOUS_AUTH_MODE"""
+        if self.mode in ("local", "pool"):
+            return self._sign_in_locally(), None
+        return await self._sign_in_with_supabase()
+
+    def _sign_in_locally(self) -> Dict:
+        """
+        Mint a token without waiting on the database or Supabase Auth
+
+        Uses a pooled Supabase identity when one is available, else a fresh
+        id. The user row is created by the batched provisioner; until then
+        the user is served from the cache and the provisioner queue.
+        """
+        user_id = self.identity_pool.take() if self.mode == "pool" else None
+        SIGN_INS.labels("pool" if user_id else "local").inc()
+        user_id = user_id or str(uuid.uuid4())
+
+        now = datetime.utcnow().isoformat()
+        user_data = {
+            "id": user_id,
+            "created_at": now,
+            "last_activity": now,
+            "is_active": True
+        }
+        self.provisioner.add(user_data)
+        self.user_cache.set(user_id, user_data)
+
+        return {
+            "access_token": create_access_token(
+                data={"sub": user_id},
+                expires_delta=timedelta(days=settings.access_token_expire_days)
+            ),
+            "token_type": "bearer",
+            "user_id": user_id
+        }
+
+    async def _sign_in_with_supabase(self) -> Tuple[Optional[Dict], Optional[str]]:
         """Sign in anonymously using Supabase Auth"""
         try:
             # Sign in anonymously
-            auth_response = self.supabase.auth.sign_in_anonymously()
-            user = auth_response.user
+            auth_user = await self.repository.auth_sign_in_anonymously()
             
-            if not user:
+            if not auth_user:
                 return None, "Failed to create anonymous user"
+
+            user_id = auth_user["user_id"]
                 
             # Create a token for the user
             access_token = create_access_token(
-                data={"sub": user.id},
+                data={"sub": user_id},
                 expires_delta=timedelta(days=settings.access_token_expire_days)
             )
             
             # Store additional user data in the database
             user_data = {
-                "id": user.id,
+                "id": user_id,
                 "created_at": datetime.utcnow().isoformat(),
                 "last_activity": datetime.utcnow().isoformat(),
                 "is_active": True
             }
             
             # Insert or update the user in the database
-            self.supabase.table("anonymous_users").upsert(
-                user_data,
-                on_conflict="id"
-            ).execute()
+            await self.repository.upsert_anonymous_user(user_data)
+            self.user_cache.set(user_id, user_data)
+            SIGN_INS.labels("supabase").inc()
             
             return {
                 "access_token": access_token,
                 "token_type": "bearer",
-                "user_id": user.id
+                "user_id": user_id
             }, None
             
         except Exception as e:
@@ -61,40 +121,65 @@ class AuthService:
 
             user_id = payload["sub"]
 
-            # Get user data from our database
-            response = self.supabase.table("anonymous_users")\
-                .select("*")\
-                .eq("id", user_id)\
-                .single()\
-                .execute()
+            user = self.user_cache.get(user_id) or self.provisioner.pending_user(user_id)
+            if user is None:
+                # Get user data from our database
+                user = await self.repository.get_anonymous_user(user_id)
 
-            if not response.data:
+                if not user:
+                    if self.mode == "supabase":
+                        return None
+                    # Minted by another worker whose batch is not written
+                    # yet; the signature already proves we issued it
+                    user = self._provision_lazily(user_id)
+
+                self.user_cache.set(user_id, user)
+
+            if user.get("is_active") is False:
                 return None
 
-            # Update last activity
-            self.supabase.table("anonymous_users")\
-                .update({"last_activity": datetime.utcnow().isoformat()})\
-                .eq("id", user_id)\
-                .execute()
+            # Update last activity (written in periodic bulk updates)
+            self.activity_tracker.touch(user_id)
 
-            return response.data
+            return user
 
         except Exception as e:
-            print(f"Error getting current user: {e}")
+            record_error(logger, "auth", "Error getting current user: %s", e)
             return None
 
+    def _provision_lazily(self, user_id: str) -> Dict:
+        now = datetime.utcnow().isoformat()
+        user_data = {"id": user_id, "created_at": now, "last_activity": now, "is_active": True}
+        # Inserts skip existing ids, so a race with the minting worker is harmless
+        self.provisioner.add(user_data)
+        return user_data
+
     async def get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
         try:
-            response = self.supabase.table("anonymous_users")\
-                .select("*")\
-                .eq("id", user_id)\
-                .single()\
-                .execute()
-            return response.data
+            return await self.repository.get_anonymous_user(user_id)
         except Exception as e:
-            print(f"Error getting user by ID: {e}")
+            record_error(logger, "auth", "Error getting user by ID: %s", e)
             return None
 
+    async def deactivate_user(self, user_id: str) -> bool:
+        """Deactivate a user and drop them from the verified-user cache"""
+        try:
+            pending = self.provisioner.pending_user(user_id)
+            if pending is not None:
+                # Not inserted yet; make sure it is created inactive
+                pending["is_active"] = False
+            await self.repository.update_anonymous_user(user_id, {"is_active": False})
+            return True
+        except Exception as e:
+            record_error(logger, "auth", "Error deactivating user: %s", e)
+            return False
+        finally:
+            self.invalidate_user(user_id)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Forget any cached copy of a user"""
+        self.user_cache.pop(user_id)
+
 # Initialize the auth service
 auth_service = AuthService()
\ No newline at end of file
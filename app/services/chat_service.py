@@ -1,11 +1,120 @@
 import json
-from typing import List, Dict, Any
+import logging
+import textwrap
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from app.utils.openai_client import openai_client
 from app.models.schemas import ChatResponse
+from app.core.config import settings
+from app.services.admission import admission_controller
+from app.services.context_builder import context_builder
+from app.services.facility_locator import facility_locator
+from app.services.response_cache import response_cache
+from app.services.triage import LOCATION_REQUEST_RE, TriageResult, triage_extractor
+from app.utils.metrics import DISPATCHES, record_error
+
+logger = logging.getLogger(__name__)
+
+# Every dispatch confirmation starts with this, whether from the model or triage
+DISPATCH_CONFIRMATION_PREFIX = "Help is on the way"
+
+FALLBACK_REPLY = "I'm having trouble connecting right now. Please call emergency services directly at 911 immediately and provide your location and the nature of the emergency."
+
+class DispatchStreamParser:
+    """
+    Incremental parser for streamed completions
+
+    Forwards plain text as soon as it arrives and holds back anything from
+    an opening brace onwards, tracking brace depth (string and escape
+    aware) so the dispatch JSON is recognised the moment the object closes.
+    """
+
+    def __init__(self):
+        self.text_parts: List[str] = []
+        self.dispatch: Optional[Dict[str, Any]] = None
+        self._held: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of streamed text
+
+        Returns:
+            List of ("token", str) and ("dispatch", dict) events in order
+        """
+        events: List[Tuple[str, Any]] = []
+        plain_start = 0
+
+        for i, char in enumerate(chunk):
+            if self._depth == 0:
+                if char == "{" and self.dispatch is None:
+                    if i > plain_start:
+                        events.append(self._emit_text(chunk[plain_start:i]))
+                    self._held = ["{"]
+                    self._depth = 1
+                    self._in_string = False
+                    self._escaped = False
+                continue
+
+            self._held.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    plain_start = i + 1
+                    events.extend(self._close_object())
+
+        if self._depth == 0 and plain_start < len(chunk):
+            remainder = chunk[plain_start:]
+            if self.dispatch is None or remainder.strip():
+                events.append(self._emit_text(remainder))
+
+        return events
+
+    def finish(self) -> List[Tuple[str, Any]]:
+        """Flush any held-back text once the stream ends"""
+        if self._depth > 0:
+            self._depth = 0
+            held, self._held = "".join(self._held), []
+            return [self._emit_text(held)]
+        return []
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    def _emit_text(self, text: str) -> Tuple[str, str]:
+        self.text_parts.append(text)
+        return ("token", text)
+
+    def _close_object(self) -> List[Tuple[str, Any]]:
+        held, self._held = "".join(self._held), []
+        try:
+            data = json.loads(held)
+        except json.JSONDecodeError:
+            data = None
+
+        if isinstance(data, dict) and "emergency_details" in data:
+            self.dispatch = data
+            return [("dispatch", data)]
+
+        # Not a dispatch object, release it to the caller as ordinary text
+        return [self._emit_text(held)]
 
 class ChatService:
     # System prompt for Medilocator
-    SYSTEM_PROMPT = """
+    SYSTEM_PROMPT = textwrap.dedent("""
     You are Medilocator, a critical emergency medical response assistant. Your primary goal is to extract specific, actionable information from the user as quickly and calmly as possible to dispatch an ambulance.
 
     **CRITICAL RULES:**
@@ -33,55 +142,158 @@ class ChatService:
     }
 
     If you don't have all the required information, respond with normal text to continue gathering information.
-    """
+    """).strip()
 
     @staticmethod
     async def process_chat_message(
         message: str,
         conversation_history: List[Dict],
-        user_location: Dict[str, Any] = None
+        user_location: Dict[str, Any] = None,
+        user_id: Optional[str] = None
     ) -> ChatResponse:
         """Process chat message through OpenAI and return structured response"""
         try:
+            # Dispatch immediately if the caller already gave everything we need
+            triage = triage_extractor.extract_conversation(message, conversation_history)
+            if ChatService._should_auto_dispatch(triage, message, conversation_history):
+                DISPATCHES.labels("triage").inc()
+                response = ChatService._triage_dispatch_response(triage)
+                await ChatService._prioritize_caller(user_id, triage, response)
+                return response
+
+            # Serve common opening replies from cache
+            cache_key = response_cache.key_for(message, conversation_history, user_location)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                await ChatService._prioritize_caller(user_id, triage, cached)
+                return cached
+
             # Prepare messages for OpenAI
-            messages = ChatService._prepare_messages(message, conversation_history, user_location)
+            messages = ChatService._prepare_messages(message, conversation_history, user_location, triage)
             
             # Call OpenAI API
             response_text = await openai_client.chat_completion(messages)
             
             # Parse the response
-            return ChatService._parse_openai_response(response_text)
+            chat_response = ChatService._fill_details(ChatService._parse_openai_response(response_text), triage)
+            if chat_response.dispatch_triggered:
+                DISPATCHES.labels("llm").inc()
+            response_cache.set(cache_key, chat_response)
+            await ChatService._prioritize_caller(user_id, triage, chat_response)
+            return chat_response
             
         except Exception as e:
-            return ChatResponse(
-                reply="I'm having trouble connecting right now. Please call emergency services directly at 911 immediately and provide your location and the nature of the emergency.",
-                emergency_details=None,
-                dispatch_triggered=False,
-                requires_location=False
-            )
+            record_error(logger, "chat", "Error processing chat: %s", e)
+            return ChatService._fallback_response()
+
+    @staticmethod
+    async def stream_chat_message(
+        message: str,
+        conversation_history: List[Dict],
+        user_location: Dict[str, Any] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a chat reply as it is generated
+
+        Yields:
+            ("token", str) for each piece of reply text,
+            ("dispatch", ChatResponse) as soon as the dispatch JSON closes,
+            and finally ("done", ChatResponse) with the complete reply
+        """
+        triage = triage_extractor.extract_conversation(message, conversation_history)
+        if ChatService._should_auto_dispatch(triage, message, conversation_history):
+            DISPATCHES.labels("triage").inc()
+            response = ChatService._triage_dispatch_response(triage)
+            await ChatService._prioritize_caller(user_id, triage, response)
+            yield "dispatch", response
+            yield "done", response
+            return
+
+        cache_key = response_cache.key_for(message, conversation_history, user_location)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            await ChatService._prioritize_caller(user_id, triage, cached)
+            yield "token", cached.reply
+            yield "done", cached
+            return
+
+        parser = DispatchStreamParser()
+        messages = ChatService._prepare_messages(message, conversation_history, user_location, triage)
+        completed = False
+        dispatch_response: Optional[ChatResponse] = None
+
+        try:
+            async for chunk in openai_client.chat_completion_stream(messages):
+                for event, payload in parser.feed(chunk):
+                    if event != "dispatch":
+                        yield event, payload
+                        continue
+                    try:
+                        dispatch_response = ChatService._fill_details(ChatService._dispatch_response(payload), triage)
+                    except ValueError as e:
+                        # Nothing usable to dispatch; tell the caller to phone
+                        # for help rather than cut the stream
+                        record_error(logger, "chat", "Malformed dispatch in chat stream: %s", e)
+                        yield "token", FALLBACK_REPLY
+                        continue
+                    DISPATCHES.labels("llm").inc()
+                    yield event, dispatch_response
+            for event, payload in parser.finish():
+                yield event, payload
+            completed = True
+        except Exception as e:
+            record_error(logger, "chat", "Error processing chat: %s", e)
+            if not parser.text_parts and parser.dispatch is None:
+                yield "token", FALLBACK_REPLY
+                yield "done", ChatService._fallback_response()
+                return
+
+        if parser.dispatch is not None:
+            chat_response = dispatch_response or ChatService._fallback_response()
+        else:
+            chat_response = ChatService._parse_openai_response(parser.text.strip())
+            if completed:
+                response_cache.set(cache_key, chat_response)
+        await ChatService._prioritize_caller(user_id, triage, chat_response)
+        yield "done", chat_response
+
+    @staticmethod
+    async def _prioritize_caller(user_id: Optional[str], triage: TriageResult, response: ChatResponse) -> None:
+        """
+        Let admission control favour a caller's next turns
+
+        Only once they were dispatched or gave a complete, first-hand
+        report; a stray keyword is not enough.
+        """
+        if not user_id:
+            return
+        if not (response.dispatch_triggered or (triage.is_complete and not triage.tentative)):
+            return
+        try:
+            await admission_controller.mark_emergency(user_id)
+        except Exception as e:
+            record_error(logger, "admission", "Error marking emergency caller: %s", e)
 
     @staticmethod
     def _prepare_messages(
         user_message: str,
         conversation_history: List[Dict],
-        user_location: Dict[str, Any] = None
+        user_location: Dict[str, Any] = None,
+        triage: Optional[TriageResult] = None
     ) -> List[Dict]:
-        """Prepare messages for OpenAI API"""
-        messages = [{"role": "system", "content": ChatService.SYSTEM_PROMPT}]
-        
-        # Add location context if available
-        if user_location:
-            location_context = f"User location data: {user_location}. Use this to help confirm their address."
-            messages.append({"role": "system", "content": location_context})
-        
-        # Add conversation history
-        for msg in conversation_history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add the current user message
-        messages.append({"role": "user", "content": user_message})
-        
-        return messages
+        """Prepare messages for OpenAI API within the context token budget"""
+        nearby = None
+        if user_location and settings.facilities_chat_context:
+            nearby = facility_locator.describe_nearby(user_location)
+        return context_builder.build(
+            ChatService.SYSTEM_PROMPT,
+            conversation_history,
+            user_message,
+            user_location,
+            known_details=triage.describe() if triage and not triage.is_empty else None,
+            nearby_facilities=nearby
+        )
 
     @staticmethod
     def _parse_openai_response(response_text: str) -> ChatResponse:
@@ -90,28 +302,91 @@ class ChatService:
         if response_text.strip().startswith('{') and 'emergency_details' in response_text:
             try:
                 dispatch_data = json.loads(response_text)
-                return ChatResponse(
-                    reply=dispatch_data['confirmation'],
-                    emergency_details=dispatch_data['emergency_details'],
-                    dispatch_triggered=True,
-                    requires_location=False
-                )
             except json.JSONDecodeError:
                 # If JSON parsing fails, treat as normal response
                 pass
+            else:
+                try:
+                    return ChatService._dispatch_response(dispatch_data)
+                except ValueError as e:
+                    record_error(logger, "chat", "Malformed dispatch in chat reply: %s", e)
+                    return ChatService._fallback_response()
         
         # Normal text response
-        return ChatResponse(
+        return ChatResponse.model_construct(
             reply=response_text,
             emergency_details=None,
             dispatch_triggered=False,
             requires_location=ChatService._should_request_location(response_text)
         )
 
+    @staticmethod
+    def _dispatch_response(dispatch_data: Dict[str, Any]) -> ChatResponse:
+        """Build the response for a parsed dispatch JSON object"""
+        # Responses are built with model_construct, skipping validation, so
+        # the fields taken from the model's JSON are checked here
+        if not isinstance(dispatch_data, dict):
+            raise ValueError("Malformed dispatch JSON")
+        details = dispatch_data.get('emergency_details')
+        confirmation = dispatch_data.get('confirmation')
+        if not isinstance(details, dict) or not isinstance(confirmation, (str, type(None))):
+            raise ValueError("Malformed dispatch JSON")
+        return ChatResponse.model_construct(
+            reply=confirmation or f"{DISPATCH_CONFIRMATION_PREFIX}. An ambulance has been dispatched.",
+            emergency_details=details,
+            dispatch_triggered=True,
+            requires_location=False
+        )
+
+    @staticmethod
+    def _fallback_response() -> ChatResponse:
+        """Reply sent when no usable answer could be produced"""
+        return ChatResponse.model_construct(
+            reply=FALLBACK_REPLY,
+            emergency_details=None,
+            dispatch_triggered=False,
+            requires_location=False
+        )
+
+    @staticmethod
+    def _should_auto_dispatch(triage: TriageResult, message: str, conversation_history: List[Dict]) -> bool:
+        """
+        Decide whether to dispatch from local triage alone
+
+        Requires all three fields, an incident that is reported rather than
+        asked about or heard of, that the new message supplied at least one
+        of them, and that this conversation has not already been dispatched.
+        """
+        if not settings.triage_auto_dispatch or not triage.is_complete or triage.tentative:
+            return False
+        if len(conversation_history) > 0:
+            if triage_extractor.extract(message).is_empty:
+                return False
+            for msg in conversation_history:
+                if msg["role"] == "assistant" and msg["content"].startswith(DISPATCH_CONFIRMATION_PREFIX):
+                    return False
+        return True
+
+    @staticmethod
+    def _triage_dispatch_response(triage: TriageResult) -> ChatResponse:
+        """Build a dispatch response from locally extracted details, without the LLM"""
+        return ChatService._dispatch_response({
+            "confirmation": f"{DISPATCH_CONFIRMATION_PREFIX}. An ambulance has been dispatched to {triage.location}. Please wait for further instructions.",
+            "emergency_details": triage.to_details()
+        })
+
+    @staticmethod
+    def _fill_details(response: ChatResponse, triage: TriageResult) -> ChatResponse:
+        """Fill any dispatch fields the model left blank from the local triage"""
+        if response.dispatch_triggered and isinstance(response.emergency_details, dict):
+            for field, value in triage.to_details().items():
+                if value and not response.emergency_details.get(field):
+                    response.emergency_details[field] = value
+        return response
+
     @staticmethod
     def _should_request_location(response_text: str) -> bool:
         """Simple heuristic to detect if the AI is asking for location"""
-        location_keywords = ['location', 'address', 'where are you', 'your location', 'where is this']
-        return any(keyword in response_text.lower() for keyword in location_keywords)
+        return LOCATION_REQUEST_RE.search(response_text) is not None
 
 chat_service = ChatService()
\ No newline at end of file
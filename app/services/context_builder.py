@@ -0,0 +1,135 @@
+"""
+Token-budgeted prompt construction
+
+Every OpenAI call gets the system prompt, the caller's location and the
+newest turns of the conversation. Once the conversation outgrows the
+budget, older turns are folded into a short summary of what the caller
+has already told us, so the prompt size stays flat however long the
+conversation runs.
+"""
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# Chat format overhead per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 chars/token"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+def format_location(user_location: Dict[str, Any]) -> str:
+    """Render the client's location payload compactly, skipping empty and nested values"""
+    parts = []
+    for field, value in user_location.items():
+        if value is None or value == "" or isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, float):
+            value = round(value, 5)
+        parts.append(f"{field}={value}")
+    return ", ".join(parts)
+
+class ContextBuilder:
+    def __init__(
+        self,
+        budget_tokens: int = settings.context_token_budget,
+        min_recent_messages: int = settings.context_min_recent_messages,
+        summary_max_tokens: int = settings.context_summary_max_tokens
+    ):
+        self.budget_tokens = budget_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+
+    def build(
+        self,
+        system_prompt: str,
+        conversation_history: List[Dict],
+        user_message: str,
+        user_location: Optional[Dict[str, Any]] = None,
+        known_details: Optional[str] = None,
+        nearby_facilities: Optional[str] = None
+    ) -> List[Dict]:
+        """Assemble the message list for one upstream call within the token budget"""
+        head = [{"role": "system", "content": system_prompt}]
+        if user_location:
+            location = format_location(user_location)
+            if location:
+                head.append({
+                    "role": "system",
+                    "content": f"User location data: {location}. Use this to help confirm their address."
+                })
+        if nearby_facilities:
+            head.append({"role": "system", "content": nearby_facilities})
+        if known_details:
+            head.append({"role": "system", "content": known_details})
+        tail = {"role": "user", "content": user_message}
+
+        remaining = self.budget_tokens - sum(message_tokens(msg) for msg in head) - message_tokens(tail)
+
+        # Count newest first, only as far back as the budget reaches, so a
+        # long history costs no more than the part that is sent
+        costs: List[int] = []
+        total = 0
+        for msg in reversed(conversation_history):
+            costs.append(message_tokens(msg))
+            total += costs[-1]
+            if total > remaining:
+                # Leave room for the summary of whatever gets compacted
+                remaining -= self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+                break
+
+        # Newest turns first; the most recent few are kept even over budget.
+        # History messages are already {"role", "content"} dicts and are sent as is
+        kept: List[Dict] = []
+        for index, msg in enumerate(reversed(conversation_history)):
+            cost = costs[index] if index < len(costs) else message_tokens(msg)
+            if len(kept) >= self.min_recent_messages and cost > remaining:
+                break
+            kept.append(msg)
+            remaining -= cost
+        kept.reverse()
+        split = len(conversation_history) - len(kept)
+
+        messages = head
+        if split > 0:
+            summary = self.summarize(conversation_history[:split])
+            if summary:
+                messages.append({"role": "system", "content": summary})
+        messages.extend(kept)
+        messages.append(tail)
+        return messages
+
+    def summarize(self, older_messages: List[Dict]) -> str:
+        """Compact turns that no longer fit into a short note of what the caller said"""
+        statements = [msg["content"].strip() for msg in older_messages if msg["role"] == "user"]
+        if not statements:
+            return ""
+
+        # The opening statement usually describes the emergency, so it is
+        # always kept (truncated to half the budget); the rest of the budget
+        # goes to the most recent statements
+        char_limit = self.summary_max_tokens * 2
+        first = statements[0][:char_limit]
+        used = count_tokens(first)
+        recent: List[str] = []
+        for statement in reversed(statements[1:]):
+            cost = count_tokens(statement) + 1
+            if used + cost > self.summary_max_tokens:
+                break
+            recent.append(statement)
+            used += cost
+        recent.reverse()
+
+        return "Earlier in this conversation the caller said: " + " | ".join([first] + recent)
+
+context_builder = ContextBuilder()
@@ -0,0 +1,274 @@
+"""
+Write-behind logging for conversation turns
+
+Rows are queued in memory and written by a background task in multi-row
+inserts, flushed when a batch fills up or the flush interval passes. When
+the database is slow or unavailable the batch is appended to a local
+JSON-lines spool file, which is replayed once writes succeed again. The
+spool is shared by every worker and guarded by file locks.
+"""
+import asyncio
+import logging
+import json
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.utils.file_lock import acquire_lock, file_lock, release_lock
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+class ConversationLogWriter:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        batch_size: int = settings.conversation_log_batch_size,
+        flush_interval: float = settings.conversation_log_flush_interval_seconds,
+        max_queue: int = settings.conversation_log_max_queue,
+        write_timeout: float = settings.conversation_log_write_timeout_seconds,
+        spool_path: str = settings.conversation_log_spool_path
+    ):
+        self.repository = repo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.write_timeout = write_timeout
+        self.spool_path = spool_path
+        # (enqueued_at, row) pairs, oldest first
+        self._queue: Deque[Tuple[float, Dict]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._spool_lock: Optional[asyncio.Lock] = None
+        self._overflow: List[Dict] = []
+        # Loop time before which spool replays are skipped after a failure
+        self._replay_not_before = 0.0
+        # Set by a scheduler to hold writes back while higher-priority work is pending
+        self.defer_while: Optional[Callable[[], bool]] = None
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.batches_written = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of rows waiting to be written"""
+        return len(self._queue)
+
+    @property
+    def oldest_age(self) -> float:
+        """Seconds the oldest queued row has been waiting"""
+        if not self._queue:
+            return 0.0
+        return time.monotonic() - self._queue[0][0]
+
+    def enqueue(self, row: Dict) -> None:
+        """Queue a row for the next batch without waiting on the database"""
+        if len(self._queue) >= self.max_queue:
+            # Never block the caller; overflow goes straight to the spool
+            self._overflow.append(row)
+        else:
+            self._queue.append((time.monotonic(), row))
+
+        if self._wakeup is not None and (
+            len(self._queue) >= self.batch_size or self._overflow
+        ):
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        """Start the background flush task"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._spool_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task after draining everything queued"""
+        if self._task is None:
+            return
+        # Let an insert in progress finish rather than cancel it mid-batch
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write every queued row now"""
+        if self._spool_lock is None:
+            self._spool_lock = asyncio.Lock()
+        await self._spill_overflow()
+        while self._queue:
+            if not await self._write_batch(self._take_batch()):
+                # The database is failing; spool the rest rather than wait
+                # out a timeout per batch
+                rest = [row for _, row in self._queue]
+                self._queue.clear()
+                await self._spool(rest)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self._wait_for_priority_work()
+                await self._spill_overflow()
+                wrote_ok = True
+                while self._queue:
+                    wrote_ok = await self._write_batch(self._take_batch())
+                    if not wrote_ok:
+                        break
+                if wrote_ok and not self._stopping:
+                    await self._replay_spool()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                record_error(logger, "conversation_log", "Error flushing conversation log: %s", e)
+
+    async def _wait_for_priority_work(self) -> None:
+        """Yield the database to higher-priority writes, for at most one interval"""
+        if self.defer_while is None:
+            return
+        deadline = time.monotonic() + self.flush_interval
+        while self.defer_while() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    def _take_batch(self) -> List[Dict]:
+        count = min(self.batch_size, len(self._queue))
+        return [self._queue.popleft()[1] for _ in range(count)]
+
+    async def _write_batch(self, batch: List[Dict]) -> bool:
+        """Insert a batch, spooling it to disk if the database fails"""
+        try:
+            await asyncio.wait_for(
+                self.repository.insert_conversation_messages(batch),
+                timeout=self.write_timeout
+            )
+            self.rows_written += len(batch)
+            self.batches_written += 1
+            self._replay_not_before = 0.0
+            return True
+        except asyncio.CancelledError:
+            # The batch is already off the queue; keep it for the next start
+            self._append_spool(batch)
+            self.rows_spooled += len(batch)
+            raise
+        except Exception as e:
+            record_error(logger, "conversation_log", "Error logging conversation batch, spooling %d rows: %s", len(batch), e)
+            await self._spool(batch)
+            self._backoff_replay()
+            return False
+
+    def _backoff_replay(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._replay_not_before = loop.time() + self.flush_interval * 10
+
+    async def _spill_overflow(self) -> None:
+        if self._overflow:
+            overflow, self._overflow = self._overflow, []
+            await self._spool(overflow)
+
+    async def _spool(self, rows: List[Dict]) -> None:
+        async with self._spool_lock:
+            await asyncio.to_thread(self._append_spool, rows)
+        self.rows_spooled += len(rows)
+
+    def _append_spool(self, rows: List[Dict]) -> None:
+        directory = os.path.dirname(self.spool_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with file_lock(self.spool_path + ".lock"), open(self.spool_path, "a", encoding="utf-8") as spool:
+            for row in rows:
+                spool.write(json.dumps(row, default=str) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+
+    async def _replay_spool(self) -> None:
+        """Re-insert spooled rows once the database accepts writes again"""
+        replay_path = self.spool_path + ".replay"
+        if not os.path.exists(self.spool_path) and not os.path.exists(replay_path):
+            return
+        if asyncio.get_running_loop().time() < self._replay_not_before:
+            return
+
+        async with self._spool_lock:
+            # Another worker is replaying; it picks up our spilled rows too
+            replay_lock = acquire_lock(replay_path + ".lock", blocking=False)
+            if replay_lock is None:
+                return
+            try:
+                await self._replay_claimed(replay_path)
+            finally:
+                release_lock(replay_lock)
+
+    async def _replay_claimed(self, replay_path: str) -> None:
+        if not await asyncio.to_thread(self._claim_spool, replay_path):
+            return
+        rows = await asyncio.to_thread(self._read_spool, replay_path)
+
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                await asyncio.wait_for(
+                    self.repository.insert_conversation_messages(batch),
+                    timeout=self.write_timeout
+                )
+            except Exception as e:
+                record_error(logger, "conversation_spool", "Error replaying conversation spool: %s", e)
+                await asyncio.to_thread(self._rewrite_spool, replay_path, rows[start:])
+                self._backoff_replay()
+                return
+            self.rows_written += len(batch)
+            self.batches_written += 1
+
+        os.remove(replay_path)
+
+    def _claim_spool(self, replay_path: str) -> bool:
+        """
+        Claim the spool so new spills start a fresh file; a leftover replay
+        file from an interrupted run is finished first
+
+        Returns:
+            bool: True if there is a replay file to write
+        """
+        with file_lock(self.spool_path + ".lock"):
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return False
+                os.replace(self.spool_path, replay_path)
+        return True
+
+    @staticmethod
+    def _read_spool(path: str) -> List[Dict]:
+        rows = []
+        with open(path, encoding="utf-8") as spool:
+            for line in spool:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    record_error(logger, "conversation_spool", "Skipping unreadable conversation spool line")
+        return rows
+
+    @staticmethod
+    def _rewrite_spool(path: str, rows: List[Dict]) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as spool:
+            for row in rows:
+                spool.write(json.dumps(row, default=str) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(tmp_path, path)
+
+conversation_log_writer = ConversationLogWriter()
@@ -0,0 +1,482 @@
+"""
+Ambulance assignment engine
+
+Keeps the live fleet in a FleetIndex, a grid of cells holding the
+available units, so finding the nearest suitable unit means scanning a
+few rings of cells around the incident. Located incidents wait in a
+priority queue (most urgent first, then oldest). Every batch interval the
+engine takes a burst of them and assigns globally rather than one at a
+time. It collects a few candidate units per incident, then walks all
+(priority, distance) pairs in order, so two nearby incidents do not both
+claim the same closest unit while a slightly farther one sits idle.
+
+Assignments are written back to the incident row (assigned_unit_id,
+status "assigned"), retried with backoff and spooled with the incident
+writes if the database still refuses them. Fleet positions and availability are updated through
+the admin API, or loaded from FLEET_PATH on start.
+"""
+import asyncio
+import csv
+import heapq
+import itertools
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.services.triage import STATUS_PHRASES
+from app.utils.geo import KM_PER_DEGREE, haversine_km
+from app.utils.metrics import ASSIGNMENT_BATCH, ASSIGNMENT_WAIT, ASSIGNMENTS, QUEUE_DEPTH, record_error
+
+logger = logging.getLogger(__name__)
+
+CRITICAL = 0
+URGENT = 1
+PRIORITY_NAMES = {CRITICAL: "critical", URGENT: "urgent"}
+
+# Reported states that put an incident ahead of the queue
+CRITICAL_RE = re.compile(
+    r"\b(?:" + "|".join(
+        re.escape(phrase)
+        for name in ("not breathing", "unconscious", "bleeding", "trapped")
+        for phrase in STATUS_PHRASES[name]
+    ) + r")\b",
+    re.IGNORECASE
+)
+
+# Capability critical incidents prefer (advanced life support)
+ADVANCED_CAPABILITY = "als"
+
+def incident_priority(emergency_details: Dict) -> int:
+    """CRITICAL when the caller reports a life-threatening state, else URGENT"""
+    text = f"{emergency_details.get('user_reported_status') or ''} {emergency_details.get('incident') or ''}"
+    return CRITICAL if CRITICAL_RE.search(text) else URGENT
+
+@dataclass
+class Unit:
+    id: str
+    latitude: float
+    longitude: float
+    capabilities: Tuple[str, ...] = ()
+    available: bool = True
+    incident_id: Optional[str] = None
+    updated_at: float = field(default_factory=time.monotonic)
+
+@dataclass(order=True)
+class PendingIncident:
+    priority: int
+    sequence: int
+    id: str = field(compare=False)
+    latitude: float = field(compare=False)
+    longitude: float = field(compare=False)
+    queued_at: float = field(compare=False)
+
+@dataclass
+class Assignment:
+    incident_id: str
+    unit_id: str
+    distance_km: float
+    priority: int
+    wait_seconds: float
+
+class FleetIndex:
+    """Grid index of units; only available units are kept in the cells"""
+
+    def __init__(self, cell_degrees: float = settings.dispatch_grid_cell_degrees):
+        self.cell_degrees = cell_degrees
+        self.cell_km = cell_degrees * KM_PER_DEGREE
+        self.units: Dict[str, Unit] = {}
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int(math.floor((latitude + 90.0) / self.cell_degrees)),
+            int(math.floor((longitude + 180.0) / self.cell_degrees))
+        )
+
+    def _add_to_cell(self, unit: Unit) -> None:
+        self.cells.setdefault(self._cell(unit.latitude, unit.longitude), set()).add(unit.id)
+
+    def _remove_from_cell(self, unit: Unit) -> None:
+        cell = self._cell(unit.latitude, unit.longitude)
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(unit.id)
+            if not members:
+                del self.cells[cell]
+
+    @property
+    def available_count(self) -> int:
+        return sum(len(members) for members in self.cells.values())
+
+    def upsert(
+        self,
+        unit_id: str,
+        latitude: float,
+        longitude: float,
+        capabilities: Optional[Iterable[str]] = None,
+        available: Optional[bool] = None
+    ) -> Unit:
+        """Add a unit or update its position, capabilities or availability"""
+        unit = self.units.get(unit_id)
+        if unit is None:
+            unit = Unit(id=unit_id, latitude=latitude, longitude=longitude)
+            self.units[unit_id] = unit
+        elif unit.available:
+            self._remove_from_cell(unit)
+
+        unit.latitude = latitude
+        unit.longitude = longitude
+        unit.updated_at = time.monotonic()
+        if capabilities is not None:
+            unit.capabilities = tuple(sorted({item.strip().lower() for item in capabilities if item.strip()}))
+        if available is not None:
+            unit.available = available
+            if available:
+                unit.incident_id = None
+        if unit.available:
+            self._add_to_cell(unit)
+        return unit
+
+    def remove(self, unit_id: str) -> bool:
+        unit = self.units.pop(unit_id, None)
+        if unit is None:
+            return False
+        if unit.available:
+            self._remove_from_cell(unit)
+        return True
+
+    def occupy(self, unit_id: str, incident_id: str) -> None:
+        unit = self.units[unit_id]
+        if unit.available:
+            self._remove_from_cell(unit)
+        unit.available = False
+        unit.incident_id = incident_id
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        count: int,
+        max_km: float,
+        capability: Optional[str] = None
+    ) -> List[Tuple[float, str]]:
+        """
+        Up to `count` available units within max_km, nearest first
+
+        Scans rings of cells outwards and stops once no unscanned cell can
+        be closer than the count-th best unit found so far.
+        """
+        center_row, center_column = self._cell(latitude, longitude)
+        # Longitude cells shrink away from the equator; size rings by the
+        # narrowest column the search can reach
+        widest_latitude = min(89.0, abs(latitude) + max_km / KM_PER_DEGREE)
+        column_km = self.cell_km * max(0.01, math.cos(math.radians(widest_latitude)))
+        ring_km = min(self.cell_km, column_km)
+        max_ring = int(max_km / ring_km) + 1
+
+        found: List[Tuple[float, str]] = []
+        for ring in range(max_ring + 1):
+            # Every cell in this ring is at least (ring - 1) whole cells away
+            if ring > 1:
+                floor_km = (ring - 1) * ring_km
+                if floor_km > max_km or (len(found) >= count and floor_km > found[count - 1][0]):
+                    break
+            for row, column in self._ring(center_row, center_column, ring):
+                members = self.cells.get((row, column))
+                if not members:
+                    continue
+                for unit_id in members:
+                    unit = self.units[unit_id]
+                    if capability and capability not in unit.capabilities:
+                        continue
+                    distance = haversine_km(latitude, longitude, unit.latitude, unit.longitude)
+                    if distance <= max_km:
+                        found.append((distance, unit_id))
+            found.sort()
+        return found[:count]
+
+    @staticmethod
+    def _ring(row: int, column: int, ring: int) -> Iterable[Tuple[int, int]]:
+        if ring == 0:
+            yield row, column
+            return
+        for offset in range(-ring, ring + 1):
+            yield row - ring, column + offset
+            yield row + ring, column + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, column - ring
+            yield row + offset, column + ring
+
+class AssignmentEngine:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        batch_interval: float = settings.dispatch_batch_interval_seconds,
+        batch_size: int = settings.dispatch_batch_size,
+        candidates_per_incident: int = settings.dispatch_candidates_per_incident,
+        max_search_km: float = settings.dispatch_max_search_km,
+        fleet_path: Optional[str] = settings.fleet_path
+    ):
+        self.repository = repo
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.candidates_per_incident = candidates_per_incident
+        self.max_search_km = max_search_km
+        self.fleet_path = fleet_path
+        self.fleet = FleetIndex()
+        self._queue: List[PendingIncident] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writes: Set[asyncio.Task] = set()
+        # Set by the emergency service to spool assignments that could not be written
+        self.spool_update: Optional[Callable[[str, Dict], Awaitable[None]]] = None
+        self.recent: List[Assignment] = []
+        self.assigned = 0
+        self.unlocated = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict:
+        return {
+            "units": len(self.fleet.units),
+            "available_units": self.fleet.available_count,
+            "pending_incidents": self.pending,
+            "assigned": self.assigned,
+            "unlocated": self.unlocated
+        }
+
+    def submit(self, incident_id: str, latitude: float, longitude: float, priority: int = URGENT) -> None:
+        """Queue a located incident for assignment"""
+        heapq.heappush(self._queue, PendingIncident(
+            priority=priority,
+            sequence=next(self._sequence),
+            id=incident_id,
+            latitude=latitude,
+            longitude=longitude,
+            queued_at=time.monotonic()
+        ))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def update_unit(
+        self,
+        unit_id: str,
+        latitude: float,
+        longitude: float,
+        capabilities: Optional[Iterable[str]] = None,
+        available: Optional[bool] = None
+    ) -> Unit:
+        """Register a unit or update it, waking the engine if it is free"""
+        unit = self.fleet.upsert(unit_id, latitude, longitude, capabilities, available)
+        if unit.available and self._queue and self._wakeup is not None:
+            self._wakeup.set()
+        return unit
+
+    def release(self, unit_id: str, latitude: Optional[float] = None, longitude: Optional[float] = None) -> Optional[Unit]:
+        """Mark a unit available again, optionally at a new position"""
+        unit = self.fleet.units.get(unit_id)
+        if unit is None:
+            return None
+        return self.update_unit(
+            unit_id,
+            unit.latitude if latitude is None else latitude,
+            unit.longitude if longitude is None else longitude,
+            available=True
+        )
+
+    def withdraw(self, incident_id: str) -> bool:
+        """
+        Stop assigning an incident: drop it from the queue, or free the unit
+        already assigned to it
+
+        Returns:
+            bool: True if it was queued or held a unit
+        """
+        for position, pending in enumerate(self._queue):
+            if pending.id == incident_id:
+                self._queue[position] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+                return True
+        for unit in self.fleet.units.values():
+            if not unit.available and unit.incident_id == incident_id:
+                self.release(unit.id)
+                return True
+        return False
+
+    def assign_pending(self) -> List[Assignment]:
+        """
+        Assign units to the most urgent queued incidents
+
+        Takes up to batch_size incidents, gathers candidate units for each,
+        and assigns pairs in (priority, distance) order so nearby incidents
+        do not contend for the same unit. Incidents with no free unit in
+        range go back on the queue.
+        """
+        if not self._queue or not self.fleet.cells:
+            return []
+        started = time.perf_counter()
+
+        batch = [heapq.heappop(self._queue) for _ in range(min(self.batch_size, len(self._queue)))]
+        pairs = []
+        for position, incident in enumerate(batch):
+            for distance, unit_id in self._candidates(incident):
+                pairs.append((incident.priority, distance, position, unit_id))
+        pairs.sort()
+
+        assigned: Dict[int, Assignment] = {}
+        taken: Set[str] = set()
+        now = time.monotonic()
+        for priority, distance, position, unit_id in pairs:
+            if position in assigned or unit_id in taken:
+                continue
+            incident = batch[position]
+            taken.add(unit_id)
+            assigned[position] = Assignment(
+                incident_id=incident.id,
+                unit_id=unit_id,
+                distance_km=distance,
+                priority=priority,
+                wait_seconds=now - incident.queued_at
+            )
+            self.fleet.occupy(unit_id, incident.id)
+
+        # Incidents whose candidates all went elsewhere get one more look
+        # at what is still free, most urgent first
+        for position, incident in enumerate(batch):
+            if position in assigned:
+                continue
+            candidates = self._candidates(incident, count=1)
+            if candidates:
+                distance, unit_id = candidates[0]
+                assigned[position] = Assignment(
+                    incident_id=incident.id,
+                    unit_id=unit_id,
+                    distance_km=distance,
+                    priority=incident.priority,
+                    wait_seconds=now - incident.queued_at
+                )
+                self.fleet.occupy(unit_id, incident.id)
+            else:
+                heapq.heappush(self._queue, incident)
+
+        results = list(assigned.values())
+        for assignment in results:
+            label = PRIORITY_NAMES[assignment.priority]
+            ASSIGNMENT_WAIT.labels(label).observe(assignment.wait_seconds)
+            ASSIGNMENTS.labels(label).inc()
+        self.assigned += len(results)
+        self.recent = (self.recent + results)[-100:]
+        ASSIGNMENT_BATCH.observe(time.perf_counter() - started)
+        return results
+
+    def _candidates(self, incident: PendingIncident, count: Optional[int] = None) -> List[Tuple[float, str]]:
+        count = count or self.candidates_per_incident
+        if incident.priority == CRITICAL:
+            preferred = self.fleet.nearest(
+                incident.latitude, incident.longitude, count, self.max_search_km, ADVANCED_CAPABILITY
+            )
+            if preferred:
+                return preferred
+        return self.fleet.nearest(incident.latitude, incident.longitude, count, self.max_search_km)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        if self.fleet_path:
+            try:
+                await asyncio.to_thread(self.load_fleet, self.fleet_path)
+            except Exception as e:
+                record_error(logger, "dispatch", "Error loading fleet from %s: %s", self.fleet_path, e)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def load_fleet(self, path: str) -> int:
+        """Load units from a CSV with id, latitude, longitude and ;-separated capabilities"""
+        loaded = 0
+        with open(path, encoding="utf-8", newline="") as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    self.fleet.upsert(
+                        row["id"],
+                        float(row["latitude"]),
+                        float(row["longitude"]),
+                        capabilities=(row.get("capabilities") or "").split(";"),
+                        available=True
+                    )
+                    loaded += 1
+                except (KeyError, ValueError):
+                    logger.warning("Skipping unreadable fleet row: %s", row)
+        logger.info("Loaded %d units from %s", loaded, path)
+        return loaded
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Let a burst of incidents arrive so they are assigned together
+            await asyncio.sleep(self.batch_interval)
+            while True:
+                assignments = self.assign_pending()
+                for assignment in assignments:
+                    task = asyncio.create_task(self._record(assignment))
+                    self._writes.add(task)
+                    task.add_done_callback(self._writes.discard)
+                if len(assignments) < self.batch_size:
+                    break
+
+    async def _record(self, assignment: Assignment) -> None:
+        values = {
+            "assigned_unit_id": assignment.unit_id,
+            "status": "assigned",
+            "assigned_at": datetime.utcnow().isoformat()
+        }
+        # The incident insert may still be retrying in the persistence lane,
+        # or the database may be failing; both get the same backoff
+        retries = settings.emergency_write_max_retries
+        for attempt in range(retries + 1):
+            try:
+                if await self.repository.update_emergency_incident(assignment.incident_id, values):
+                    return
+            except Exception as e:
+                record_error(
+                    logger, "dispatch", "Error recording assignment of %s to %s (attempt %d): %s",
+                    assignment.unit_id, assignment.incident_id, attempt + 1, e
+                )
+            if attempt < retries:
+                await asyncio.sleep(settings.emergency_write_retry_base_seconds * 2 ** attempt)
+
+        record_error(
+            logger, "dispatch", "Could not record assignment of %s to %s; spooling it",
+            assignment.unit_id, assignment.incident_id
+        )
+        if self.spool_update is None:
+            return
+        try:
+            await self.spool_update(assignment.incident_id, values)
+        except Exception as e:
+            record_error(logger, "dispatch", "Error spooling assignment of %s: %s", assignment.incident_id, e)
+
+assignment_engine = AssignmentEngine()
+
+QUEUE_DEPTH.labels("unassigned_incidents").set_function(lambda: assignment_engine.pending)
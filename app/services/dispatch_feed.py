@@ -0,0 +1,176 @@
+"""
+Live dispatch feed
+
+Dispatcher consoles follow new incidents over server-sent events instead
+of polling emergency_incidents. Each incident logged on this worker is
+published once. It is serialized to an SSE message a single time, kept in
+a ring buffer of the last DISPATCH_FEED_HISTORY_SIZE messages and appended
+to every subscriber's queue. Fan-out costs one append per console and
+no database reads.
+
+A queue holds at most DISPATCH_FEED_QUEUE_SIZE messages. When a console
+stops reading and its queue fills, the queue is dropped. Once the console
+reads again it is caught up from the ring buffer in a single write, or,
+if it has fallen further behind than the buffer reaches, sent a `reset`
+event telling it to reload. The publisher never waits on a console, and a
+stalled console holds no more than its queue.
+
+Event ids are "<worker epoch>-<sequence>". A console that reconnects with
+Last-Event-ID resumes after that event if it is still in this worker's
+buffer, and is sent a `reset` otherwise.
+"""
+import asyncio
+import itertools
+import logging
+import secrets
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+import orjson
+from app.core.config import settings
+from app.utils.metrics import FEED_CATCH_UPS, FEED_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+# Ask EventSource clients to reconnect after two seconds
+RETRY_MESSAGE = b"retry: 2000\n\n"
+# Comment line that keeps idle connections open through proxies
+HEARTBEAT_MESSAGE = b": keepalive\n\n"
+
+class FeedSubscriber:
+    def __init__(self, after: int):
+        self.queue: Deque[Tuple[int, bytes]] = deque()
+        self.wakeup = asyncio.Event()
+        # Sequence of the last message handed to this subscriber
+        self.after = after
+        # Set while it has to be caught up from the ring buffer
+        self.behind = False
+        self.closed = False
+
+class DispatchFeed:
+    def __init__(
+        self,
+        queue_size: int = settings.dispatch_feed_queue_size,
+        history_size: int = settings.dispatch_feed_history_size,
+        max_subscribers: int = settings.dispatch_feed_max_subscribers,
+        heartbeat_seconds: float = settings.dispatch_feed_heartbeat_seconds
+    ):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_seconds = heartbeat_seconds
+        # Distinguishes this worker's event ids from those of other workers
+        # and earlier runs
+        self.epoch = secrets.token_hex(4)
+        self._history: Deque[Tuple[int, bytes]] = deque(maxlen=history_size)
+        self._sequence = itertools.count(1)
+        self._newest = 0
+        self._subscribers: Set[FeedSubscriber] = set()
+        self.published = 0
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "history": len(self._history),
+            "last_event_id": f"{self.epoch}-{self._newest}" if self._newest else None
+        }
+
+    def has_room(self) -> bool:
+        return len(self._subscribers) < self.max_subscribers
+
+    def publish(self, event: str, payload: Dict) -> str:
+        """Serialize an event once and hand it to every subscriber; returns its id"""
+        sequence = next(self._sequence)
+        event_id = f"{self.epoch}-{sequence}"
+        message = b"id: %s\nevent: %s\ndata: %s\n\n" % (event_id.encode(), event.encode(), orjson.dumps(payload))
+        self._history.append((sequence, message))
+        self._newest = sequence
+        self.published += 1
+        for subscriber in self._subscribers:
+            if subscriber.behind:
+                continue
+            if len(subscriber.queue) >= self.queue_size:
+                # Drop the backlog; the ring buffer still has it
+                subscriber.queue.clear()
+                subscriber.behind = True
+            else:
+                subscriber.queue.append((sequence, message))
+            subscriber.wakeup.set()
+        return event_id
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> FeedSubscriber:
+        """Register a console, to be caught up after last_event_id if it has one"""
+        subscriber = FeedSubscriber(self._newest)
+        if last_event_id:
+            subscriber.after = self._resume_point(last_event_id)
+            if subscriber.after != self._newest:
+                subscriber.behind = True
+                subscriber.wakeup.set()
+        self._subscribers.add(subscriber)
+        FEED_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: FeedSubscriber) -> None:
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+            FEED_SUBSCRIBERS.dec()
+
+    def _resume_point(self, last_event_id: str) -> int:
+        """Sequence to resume after, or -1 when the id is not from this worker's run"""
+        epoch, _, sequence = last_event_id.strip().partition("-")
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self._newest:
+            return -1
+        return int(sequence)
+
+    def _catch_up(self, subscriber: FeedSubscriber) -> bytes:
+        """Everything after the subscriber's last message, or a reset if the buffer no longer reaches it"""
+        subscriber.behind = False
+        after, subscriber.after = subscriber.after, self._newest
+        if after >= self._newest:
+            return b""
+        oldest = self._history[0][0] if self._history else self._newest + 1
+        if after + 1 < oldest:
+            FEED_CATCH_UPS.labels("reset").inc()
+            reset = orjson.dumps({"reason": "events were missed; reload incidents"})
+            return b"id: %s-%d\nevent: reset\ndata: %s\n\n" % (self.epoch.encode(), self._newest, reset)
+        FEED_CATCH_UPS.labels("replayed").inc()
+        return b"".join(message for _, message in itertools.islice(self._history, after + 1 - oldest, None))
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        SSE byte chunks for one console until it disconnects
+
+        Subscribes on first iteration, so a response that is never sent
+        leaves nothing registered. Messages that queued up while the
+        previous chunk was being sent go out together.
+        """
+        subscriber = self.subscribe(last_event_id)
+        try:
+            yield RETRY_MESSAGE
+            while not subscriber.closed:
+                if not subscriber.wakeup.is_set():
+                    try:
+                        await asyncio.wait_for(subscriber.wakeup.wait(), self.heartbeat_seconds)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT_MESSAGE
+                        continue
+                subscriber.wakeup.clear()
+                if subscriber.behind:
+                    chunk = self._catch_up(subscriber)
+                elif subscriber.queue:
+                    subscriber.after = subscriber.queue[-1][0]
+                    chunk = b"".join(message for _, message in subscriber.queue)
+                    subscriber.queue.clear()
+                else:
+                    continue
+                if chunk:
+                    yield chunk
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close(self) -> None:
+        """End every open stream"""
+        for subscriber in self._subscribers:
+            subscriber.closed = True
+            subscriber.wakeup.set()
+
+dispatch_feed = DispatchFeed()
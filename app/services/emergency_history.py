@@ -0,0 +1,140 @@
+"""
+Paginated emergency history
+
+Pages are fetched with keyset pagination on (created_at, id), so each page
+costs one bounded index range scan however long the history grows. Only
+the requested columns are selected. A rendered page is serialized once,
+tagged with a hash of its bytes and cached briefly, so polling clients
+that send If-None-Match are answered without a query or re-serialization.
+"""
+import base64
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.utils.cache import TTLCache
+
+# Columns a client may ask for; id and created_at are always included
+# because the cursor is built from them
+EMERGENCY_FIELDS = (
+    "id",
+    "created_at",
+    "location",
+    "latitude",
+    "longitude",
+    "incident",
+    "victim_count",
+    "user_reported_status",
+    "status",
+    "assigned_unit_id"
+)
+
+_ROW_ID_RE = re.compile(r"^[\w-]{1,64}$")
+
+class InvalidPageRequest(ValueError):
+    """Raised for an unknown field or a cursor that cannot be decoded"""
+
+@dataclass
+class HistoryPage:
+    etag: str
+    body: bytes
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode and validate a cursor; values are embedded in the database filter"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("invalid cursor")
+    if not isinstance(row_id, str) or not _ROW_ID_RE.match(row_id):
+        raise InvalidPageRequest("invalid cursor")
+    return created_at, row_id
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Columns to select, in a stable order"""
+    if not fields:
+        return list(EMERGENCY_FIELDS)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(EMERGENCY_FIELDS)
+    if unknown:
+        raise InvalidPageRequest(f"unknown fields: {', '.join(sorted(unknown))}")
+    requested.update(("id", "created_at"))
+    return [field for field in EMERGENCY_FIELDS if field in requested]
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+class EmergencyHistory:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        cache_size: int = settings.emergency_history_cache_size,
+        cache_ttl: float = settings.emergency_history_cache_ttl_seconds
+    ):
+        self.repository = repo
+        self.cache_ttl = cache_ttl
+        # (user_id, columns, limit, cursor) -> (rendered_at, page)
+        self.pages: TTLCache[Tuple[float, HistoryPage]] = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # user_id -> time of the user's last incident write on this worker
+        self.last_write: TTLCache[float] = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop every cached page for a user; called after they log an incident"""
+        self.last_write.set(user_id, time.monotonic())
+
+    async def get_page(
+        self,
+        user_id: str,
+        fields: Optional[str] = None,
+        limit: int = settings.emergency_page_size,
+        cursor: Optional[str] = None
+    ) -> HistoryPage:
+        """
+        Fetch one page of a user's incidents, newest first
+
+        Returns:
+            HistoryPage: The serialized page
+            {"emergencies": [...], "next_cursor": str | None} and its ETag
+
+        Raises:
+            InvalidPageRequest: For unknown fields or a malformed cursor
+        """
+        columns = parse_fields(fields)
+        limit = max(1, min(limit, settings.emergency_page_size_max))
+        before = decode_cursor(cursor) if cursor else None
+
+        key = (user_id, tuple(columns), limit, cursor)
+        cached = self.pages.get(key)
+        if cached is not None:
+            rendered_at, page = cached
+            written_at = self.last_write.get(user_id)
+            if written_at is None or rendered_at > written_at:
+                return page
+
+        rendered_at = time.monotonic()
+        # One extra row tells us whether another page exists
+        rows = await self.repository.list_user_emergencies(user_id, columns, limit + 1, before)
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        body = json.dumps(
+            {"emergencies": rows[:limit], "next_cursor": next_cursor},
+            separators=(",", ":"),
+            default=str
+        ).encode()
+        page = HistoryPage(etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body=body)
+        self.pages.set(key, (rendered_at, page))
+        return page
+
+emergency_history = EmergencyHistory()
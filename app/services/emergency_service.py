@@ -1,50 +1,133 @@
-from typing import List, Optional, Dict
+import logging
+import uuid
+from typing import Optional, Dict, Tuple
 from datetime import datetime
-from app.models.database import supabase
+from app.models.repository import Repository, repository
+from app.services.dispatch_engine import PRIORITY_NAMES, AssignmentEngine, assignment_engine, incident_priority
+from app.services.dispatch_feed import DispatchFeed, dispatch_feed
+from app.services.emergency_history import EmergencyHistory, emergency_history
+from app.services.geocoder import Geocoder, geocoder
+from app.services.incident_dedup import IncidentDeduplicator, incident_deduplicator
+from app.services.persistence import PersistenceScheduler, persistence_scheduler
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
 
 class EmergencyService:
-    @staticmethod
-    def log_emergency(emergency_data: Dict, user_id: str) -> Optional[Dict]:
-        """Log emergency to Supabase"""
+    def __init__(
+        self,
+        repo: Repository = repository,
+        persistence: PersistenceScheduler = persistence_scheduler,
+        history: EmergencyHistory = emergency_history,
+        assignments: AssignmentEngine = assignment_engine,
+        locations: Geocoder = geocoder,
+        duplicates: IncidentDeduplicator = incident_deduplicator,
+        feed: DispatchFeed = dispatch_feed
+    ):
+        self.repository = repo
+        self.persistence = persistence
+        self.history = history
+        self.assignments = assignments
+        self.geocoder = locations
+        self.duplicates = duplicates
+        self.feed = feed
+        # Assignments the engine cannot write are kept with the incident writes
+        self.assignments.spool_update = self.persistence.spool_update
+
+    async def log_emergency(
+        self,
+        emergency_data: Dict,
+        user_id: str,
+        coordinates: Optional[Tuple[float, float]] = None
+    ) -> Optional[Dict]:
+        """
+        Log emergency to Supabase through the high-priority persistence lane
+
+        The incident is located from the caller's coordinates, or else by
+        geocoding its free-text location offline; located incidents are
+        queued for ambulance assignment. One that looks like a repeat of a
+        recent incident is flagged with duplicate_of but still queued; only
+        a dispatcher's confirmation withdraws it. Dispatcher consoles on the
+        live feed see the incident before it is written.
+        """
         try:
+            location_source = "device" if coordinates is not None else None
+            if coordinates is None:
+                match = await self.geocoder.resolve(emergency_data.get("location"))
+                if match is not None:
+                    coordinates = (match.latitude, match.longitude)
+                    location_source = "gazetteer"
+
             emergency_log = {
+                "id": str(uuid.uuid4()),
                 "user_id": user_id,
                 "location": emergency_data.get("location", ""),
                 "incident": emergency_data.get("incident", ""),
                 "victim_count": emergency_data.get("victim_count", ""),
                 "user_reported_status": emergency_data.get("user_reported_status", ""),
+                "latitude": coordinates[0] if coordinates else None,
+                "longitude": coordinates[1] if coordinates else None,
+                "location_source": location_source,
                 "created_at": datetime.utcnow().isoformat(),
                 "status": "dispatched"
             }
             
-            response = supabase.table("emergency_incidents").insert(emergency_log).execute()
-            return response.data[0] if response.data else None
+            priority = incident_priority(emergency_data)
+            duplicate = self.duplicates.check(
+                emergency_log["id"],
+                emergency_log["incident"],
+                emergency_log["location"],
+                emergency_log["latitude"],
+                emergency_log["longitude"],
+                priority
+            )
+            if duplicate is not None:
+                emergency_log["duplicate_of"] = duplicate.original_id
+
+            # Queue for a unit straight away rather than after the insert
+            # confirms; the id is generated here so the assignment can be
+            # written back to the row
+            if coordinates is None:
+                self.assignments.unlocated += 1
+            else:
+                self.assignments.submit(emergency_log["id"], *coordinates, priority)
+            self.feed.publish("dispatch", {**emergency_log, "priority": PRIORITY_NAMES[priority]})
+
+            stored = await self.persistence.persist_emergency(emergency_log)
+            self.history.invalidate(user_id)
+            return stored
         except Exception as e:
-            print(f"Error logging emergency: {e}")
+            record_error(logger, "emergency", "Error logging emergency: %s", e)
             return None
 
-    @staticmethod
-    def get_user_emergencies(user_id: str) -> List[Dict]:
-        """Get emergencies for a specific user"""
-        try:
-            response = supabase.table("emergency_incidents")\
-                .select("*")\
-                .eq("anonymous_user_id", user_id)\
-                .order("created_at", desc=True)\
-                .execute()
-            return response.data
-        except Exception as e:
-            print(f"Error getting user emergencies: {e}")
-            return []
+    async def confirm_duplicate(self, incident_id: str, duplicate_of: str) -> Optional[bool]:
+        """
+        Apply a dispatcher's confirmation that an incident repeats another
+
+        Marks the incident as a duplicate, then takes it out of the
+        assignment queue or frees the unit it was given.
+
+        Returns:
+            Optional[bool]: None if the incident is not stored, else whether
+            it was still queued or holding a unit
+        """
+        if not await self.repository.update_emergency_incident(
+            incident_id, {"status": "duplicate", "duplicate_of": duplicate_of}
+        ):
+            return None
+        withdrawn = self.assignments.withdraw(incident_id)
+        self.duplicates.confirm(incident_id, duplicate_of)
+        logger.info("Incident %s confirmed as a repeat of %s", incident_id, duplicate_of)
+        return withdrawn
 
-    @staticmethod
     def log_conversation(
+        self,
         user_id: str,
         user_message: str,
         assistant_reply: str,
         dispatch_triggered: bool = False
-    ) -> Optional[Dict]:
-        """Log conversation to Supabase"""
+    ) -> None:
+        """Queue a conversation turn for batched logging to Supabase"""
         try:
             conversation_log = {
                 "user_id": user_id,
@@ -54,10 +137,8 @@ class EmergencyService:
                 "created_at": datetime.utcnow().isoformat()
             }
             
-            response = supabase.table("conversation_messages").insert(conversation_log).execute()
-            return response.data[0] if response.data else None
+            self.persistence.submit_conversation(conversation_log)
         except Exception as e:
-            print(f"Error logging conversation: {e}")
-            return None
+            record_error(logger, "conversation_log", "Error logging conversation: %s", e)
 
 emergency_service = EmergencyService()
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Bulk export of conversations and incidents
+
+Rows are read with keyset pagination on (created_at, id), oldest first, one
+page per query, and each page is serialized and handed on before the next
+is fetched. Memory stays at one page (one row group for Parquet) however
+many rows match. Any exported row can restart an export right after it:
+its cursor is encode_cursor(row), which the export script derives from the
+last row it wrote.
+"""
+import base64
+import io
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import orjson
+from app.core.config import settings
+from app.models.repository import Repository, repository
+
+# Exported tables under their public names, with their columns and the
+# Arrow type each column is written as in Parquet
+EXPORT_TABLES = {
+    "conversations": (
+        "conversation_messages",
+        (
+            ("id", "string"),
+            ("created_at", "timestamp"),
+            ("user_id", "string"),
+            ("user_message", "string"),
+            ("assistant_reply", "string"),
+            ("dispatch_triggered", "bool")
+        )
+    ),
+    "incidents": (
+        "emergency_incidents",
+        (
+            ("id", "string"),
+            ("created_at", "timestamp"),
+            ("user_id", "string"),
+            ("location", "string"),
+            ("latitude", "float64"),
+            ("longitude", "float64"),
+            ("location_source", "string"),
+            ("incident", "string"),
+            ("victim_count", "string"),
+            ("user_reported_status", "string"),
+            ("status", "string"),
+            ("assigned_unit_id", "string"),
+            ("assigned_at", "timestamp"),
+            ("duplicate_of", "string")
+        )
+    )
+}
+
+# Every stored incident is a dispatch, so only conversations need a filter
+DISPATCH_FILTERS = {
+    "conversations": {"dispatch_triggered": True},
+    "incidents": {}
+}
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+_ROW_ID_RE = re.compile(r"^[\w-]{1,64}$")
+
+class InvalidExportRequest(ValueError):
+    """Raised for an unknown dataset or format, or a cursor that cannot be decoded"""
+
+@dataclass
+class ExportQuery:
+    """
+    What to export, and how far an export has got
+
+    `after` and `rows` advance as each chunk is handed out, so once a chunk
+    has been written, `cursor` resumes right after it. `limit` caps the rows
+    one export returns.
+    """
+    dataset: str
+    since: Optional[str] = None
+    until: Optional[str] = None
+    dispatch_only: bool = False
+    after: Optional[Tuple[str, Any]] = None
+    limit: Optional[int] = None
+    rows: int = 0
+    table: str = field(init=False)
+    columns: List[str] = field(init=False)
+
+    def __post_init__(self):
+        if self.dataset not in EXPORT_TABLES:
+            raise InvalidExportRequest(f"unknown dataset: {self.dataset}")
+        self.table, schema = EXPORT_TABLES[self.dataset]
+        self.columns = [name for name, _ in schema]
+
+    @property
+    def cursor(self) -> Optional[str]:
+        if self.after is None:
+            return None
+        return encode_cursor({"created_at": self.after[0], "id": self.after[1]})
+
+    def advance(self, last_row: Dict, count: int) -> None:
+        self.after = (last_row["created_at"], last_row["id"])
+        self.rows += count
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    """Decode and validate a cursor; values are embedded in the database filter"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise InvalidExportRequest("invalid cursor")
+    # conversation ids may be serial integers, incident ids are UUIDs
+    if isinstance(row_id, bool) or not (isinstance(row_id, int) or (isinstance(row_id, str) and _ROW_ID_RE.match(row_id))):
+        raise InvalidExportRequest("invalid cursor")
+    return created_at, row_id
+
+def utc_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Filter bound in the naive UTC form created_at is written in"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+def require_pyarrow():
+    """pyarrow and pyarrow.parquet, which only Parquet exports need"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet exports require the 'pyarrow' package")
+    return pyarrow, pyarrow.parquet
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back in chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class RecordExporter:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        page_size: int = settings.export_page_size,
+        row_group_size: int = settings.export_row_group_size
+    ):
+        self.repository = repo
+        self.page_size = page_size
+        self.row_group_size = row_group_size
+
+    async def pages(self, query: ExportQuery) -> AsyncIterator[List[Dict]]:
+        """Every matching row, one page at a time"""
+        equals = DISPATCH_FILTERS[query.dataset] if query.dispatch_only else None
+        after = query.after
+        remaining = query.limit
+        while remaining is None or remaining > 0:
+            page_size = self.page_size if remaining is None else min(self.page_size, remaining)
+            rows = await self.repository.export_rows(
+                query.table, query.columns, page_size, after, query.since, query.until, equals
+            )
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    async def ndjson(self, query: ExportQuery) -> AsyncIterator[bytes]:
+        """One JSON object per line, one chunk per page"""
+        async for rows in self.pages(query):
+            chunk = b"\n".join(map(orjson.dumps, rows)) + b"\n"
+            query.advance(rows[-1], len(rows))
+            yield chunk
+
+    async def parquet(self, query: ExportQuery) -> AsyncIterator[bytes]:
+        """A Parquet file, streamed a row group at a time"""
+        pa, pq = require_pyarrow()
+        schema = arrow_schema(pa, query.dataset)
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        try:
+            group: List = []
+            grouped = 0
+            async for rows in self.pages(query):
+                group.append(arrow_table(pa, schema, rows))
+                grouped += len(rows)
+                last_row = rows[-1]
+                if grouped >= self.row_group_size:
+                    writer.write_table(pa.concat_tables(group), row_group_size=grouped)
+                    query.advance(last_row, grouped)
+                    group, grouped = [], 0
+                    yield sink.take()
+            if group:
+                writer.write_table(pa.concat_tables(group), row_group_size=grouped)
+                query.advance(last_row, grouped)
+        finally:
+            writer.close()
+        yield sink.take()
+
+    def stream(self, query: ExportQuery, format: str) -> AsyncIterator[bytes]:
+        if format == "ndjson":
+            return self.ndjson(query)
+        if format == "parquet":
+            return self.parquet(query)
+        raise InvalidExportRequest(f"unknown format: {format}")
+
+def arrow_schema(pa, dataset: str):
+    types = {
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "float64": pa.float64(),
+        "timestamp": pa.timestamp("us", tz="UTC")
+    }
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_TABLES[dataset][1]])
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    # created_at is written as naive UTC
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+def arrow_table(pa, schema, rows: List[Dict]):
+    """One page of rows as an Arrow table in the dataset's schema"""
+    columns = {}
+    for column in schema:
+        values = [row.get(column.name) for row in rows]
+        if pa.types.is_timestamp(column.type):
+            values = [_timestamp(value) for value in values]
+        elif pa.types.is_string(column.type):
+            values = [None if value is None else str(value) for value in values]
+        elif pa.types.is_floating(column.type):
+            values = [None if value in (None, "") else float(value) for value in values]
+        columns[column.name] = values
+    return pa.Table.from_pydict(columns, schema=schema)
+
+record_exporter = RecordExporter()
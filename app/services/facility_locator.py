@@ -0,0 +1,372 @@
+"""
+Nearby medical facility lookup
+
+Facilities are loaded from a local CSV or GeoJSON file into an immutable
+FacilityIndex: columnar numpy arrays sorted by grid cell (row-major), so a
+query reads one contiguous slice per grid row inside the search box, then
+ranks the candidates with a vectorized haversine. Capabilities are bitmasks
+and opening hours are minute ranges, so every filter is a numpy expression.
+
+The file is polled for changes; a new index is built off the event loop and
+swapped in with a single assignment, so queries never wait on a reload.
+
+CSV columns (GeoJSON uses the same names as Point feature properties):
+    id, name, type, latitude, longitude, capabilities, hours, phone, address
+`capabilities` is ";"-separated (e.g. "emergency;maternity;trauma") and
+`hours` is "24/7" or "HH:MM-HH:MM" local time (overnight ranges allowed).
+"""
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+import numpy as np
+from app.core.config import settings
+from app.utils.geo import KM_PER_DEGREE, coordinates_from, haversine_km_many
+from app.utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+# Opening-minute marker for facilities that never close
+ALWAYS_OPEN = -1
+
+MAX_CAPABILITIES = 64
+
+@dataclass(frozen=True)
+class Facility:
+    id: str
+    name: str
+    type: str
+    latitude: float
+    longitude: float
+    capabilities: Tuple[str, ...] = ()
+    hours: str = "24/7"
+    phone: Optional[str] = None
+    address: Optional[str] = None
+
+def parse_hours(hours: Optional[str]) -> Tuple[int, int]:
+    """Turn "24/7" or "HH:MM-HH:MM" into (opens, closes) minutes of the day"""
+    if not hours or hours.strip().lower() in ("24/7", "24h", "24 hours"):
+        return ALWAYS_OPEN, ALWAYS_OPEN
+    opens, closes = hours.split("-")
+
+    def minutes(value: str) -> int:
+        hour, _, minute = value.strip().partition(":")
+        return int(hour) * 60 + int(minute or 0)
+
+    return minutes(opens), minutes(closes)
+
+def _facility_from(record: Dict[str, Any], latitude: Any, longitude: Any) -> Facility:
+    capabilities = record.get("capabilities") or ()
+    if isinstance(capabilities, str):
+        capabilities = capabilities.split(";")
+    return Facility(
+        id=str(record.get("id") or record.get("name")),
+        name=str(record.get("name") or ""),
+        type=str(record.get("type") or "facility").strip().lower(),
+        latitude=float(latitude),
+        longitude=float(longitude),
+        capabilities=tuple(sorted({item.strip().lower() for item in capabilities if item.strip()})),
+        hours=str(record.get("hours") or "24/7"),
+        phone=record.get("phone") or None,
+        address=record.get("address") or None
+    )
+
+def load_facilities(path: str) -> List[Facility]:
+    """Read facilities from a CSV or GeoJSON file; rows without valid coordinates are skipped"""
+    facilities: List[Facility] = []
+    skipped = 0
+    if path.lower().endswith((".geojson", ".json")):
+        with open(path, encoding="utf-8") as handle:
+            features = json.load(handle).get("features", [])
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            try:
+                if geometry.get("type") != "Point":
+                    raise ValueError("not a point")
+                longitude, latitude = geometry["coordinates"][:2]
+                facilities.append(_facility_from(feature.get("properties") or {}, latitude, longitude))
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+    else:
+        with open(path, encoding="utf-8", newline="") as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    facilities.append(_facility_from(row, row["latitude"], row["longitude"]))
+                except (KeyError, TypeError, ValueError):
+                    skipped += 1
+    if skipped:
+        logger.warning("Skipped %d facilities without valid coordinates in %s", skipped, path)
+    return facilities
+
+class FacilityIndex:
+    """Immutable grid index over a set of facilities"""
+
+    def __init__(self, facilities: Sequence[Facility], cell_degrees: float = settings.facilities_grid_cell_degrees):
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360.0 / cell_degrees)) + 1
+
+        valid = [
+            facility for facility in facilities
+            if -90.0 <= facility.latitude <= 90.0 and -180.0 <= facility.longitude <= 180.0
+        ]
+        lats = np.fromiter((facility.latitude for facility in valid), dtype=np.float64, count=len(valid))
+        lons = np.fromiter((facility.longitude for facility in valid), dtype=np.float64, count=len(valid))
+        keys = self._cell_rows(lats) * self.columns + self._cell_columns(lons)
+
+        # Sorting by cell key makes each grid row's cells contiguous
+        order = np.argsort(keys, kind="stable")
+        self.facilities: List[Facility] = [valid[i] for i in order]
+        self.keys = keys[order]
+        self.lats_rad = np.radians(lats[order])
+        self.lons_rad = np.radians(lons[order])
+
+        self.capability_bits: Dict[str, int] = {}
+        for facility in self.facilities:
+            for capability in facility.capabilities:
+                if capability not in self.capability_bits and len(self.capability_bits) < MAX_CAPABILITIES:
+                    self.capability_bits[capability] = 1 << len(self.capability_bits)
+        self.capability_masks = np.fromiter(
+            (
+                sum(self.capability_bits.get(capability, 0) for capability in facility.capabilities)
+                for facility in self.facilities
+            ),
+            dtype=np.uint64,
+            count=len(self.facilities)
+        )
+
+        self.types = np.array([facility.type for facility in self.facilities], dtype=object)
+
+        hours = []
+        for facility in self.facilities:
+            try:
+                hours.append(parse_hours(facility.hours))
+            except ValueError:
+                logger.warning("Unreadable hours %r for facility %s; treating as always open", facility.hours, facility.id)
+                hours.append((ALWAYS_OPEN, ALWAYS_OPEN))
+        hours_array = np.array(hours, dtype=np.int16).reshape(-1, 2)
+        self.opens = hours_array[:, 0]
+        self.closes = hours_array[:, 1]
+
+    def __len__(self) -> int:
+        return len(self.facilities)
+
+    def _cell_rows(self, lats: np.ndarray) -> np.ndarray:
+        return np.floor((lats + 90.0) / self.cell_degrees).astype(np.int64)
+
+    def _cell_columns(self, lons: np.ndarray) -> np.ndarray:
+        return np.floor((lons + 180.0) / self.cell_degrees).astype(np.int64)
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Positions of facilities in grid cells overlapping the search box"""
+        lat_delta = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + lat_delta)))
+        lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+
+        row_range = self._cell_rows(np.array([lat - lat_delta, lat + lat_delta]))
+        if lon_delta >= 180.0:
+            column_range = np.array([0, self.columns - 1])
+        else:
+            column_range = self._cell_columns(np.array([max(-180.0, lon - lon_delta), min(180.0, lon + lon_delta)]))
+
+        # A search box covering most rows is cheaper as a full scan
+        if row_range[1] - row_range[0] > 512:
+            return np.arange(len(self.facilities))
+
+        rows = np.arange(row_range[0], row_range[1] + 1)
+        starts = np.searchsorted(self.keys, rows * self.columns + column_range[0], side="left")
+        ends = np.searchsorted(self.keys, rows * self.columns + column_range[1], side="right")
+        spans = [(start, end) for start, end in zip(starts, ends) if end > start]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in spans])
+
+    def capability_mask(self, capabilities: Sequence[str]) -> Optional[int]:
+        """Bitmask for the required capabilities, or None if any is unknown"""
+        mask = 0
+        for capability in capabilities:
+            bit = self.capability_bits.get(capability.strip().lower())
+            if bit is None:
+                return None
+            mask |= bit
+        return mask
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        limit: int,
+        capabilities: Sequence[str] = (),
+        facility_type: Optional[str] = None,
+        open_at_minute: Optional[int] = None
+    ) -> List[Tuple[Facility, float]]:
+        """Facilities within radius_km that pass every filter, nearest first"""
+        if not self.facilities:
+            return []
+
+        required = self.capability_mask(capabilities)
+        if required is None:
+            return []
+
+        candidates = self._candidates(lat, lon, radius_km)
+        if required:
+            masks = self.capability_masks[candidates]
+            candidates = candidates[(masks & np.uint64(required)) == np.uint64(required)]
+        if facility_type:
+            candidates = candidates[self.types[candidates] == facility_type.strip().lower()]
+        if open_at_minute is not None and len(candidates):
+            opens = self.opens[candidates]
+            closes = self.closes[candidates]
+            is_open = (
+                (opens == ALWAYS_OPEN)
+                | ((opens <= closes) & (opens <= open_at_minute) & (open_at_minute < closes))
+                | ((opens > closes) & ((open_at_minute >= opens) | (open_at_minute < closes)))
+            )
+            candidates = candidates[is_open]
+        if not len(candidates):
+            return []
+
+        distances = haversine_km_many(lat, lon, self.lats_rad[candidates], self.lons_rad[candidates])
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+
+        if len(candidates) > limit:
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            candidates, distances = candidates[nearest], distances[nearest]
+        ranked = np.argsort(distances, kind="stable")
+        return [(self.facilities[candidates[i]], float(distances[i])) for i in ranked]
+
+class FacilityLocator:
+    def __init__(
+        self,
+        path: Optional[str] = settings.facilities_path,
+        cell_degrees: float = settings.facilities_grid_cell_degrees,
+        reload_interval: float = settings.facilities_reload_interval_seconds,
+        timezone: str = settings.facilities_timezone
+    ):
+        self.path = path
+        self.cell_degrees = cell_degrees
+        self.reload_interval = reload_interval
+        self.timezone = ZoneInfo(timezone)
+        self.index = FacilityIndex([], cell_degrees)
+        self.loaded_mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_mtime is not None
+
+    async def start(self) -> None:
+        """Load the facility file and start watching it for changes"""
+        if not self.path or self._task is not None:
+            return
+        await self.reload()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the index if the file changed since the last load
+
+        The old index keeps serving until the new one is ready, and stays in
+        place if the file cannot be read.
+
+        Returns:
+            bool: True if a new index was swapped in
+        """
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self.loaded_mtime:
+                return False
+            index = await asyncio.to_thread(self._build_index, self.path)
+        except Exception as e:
+            record_error(logger, "facilities", "Error loading facilities from %s: %s", self.path, e)
+            return False
+        self.index = index
+        self.loaded_mtime = mtime
+        logger.info("Loaded %d facilities from %s", len(index), self.path)
+        return True
+
+    def _build_index(self, path: str) -> FacilityIndex:
+        return FacilityIndex(load_facilities(path), self.cell_degrees)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    def minute_of_day(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now(self.timezone)
+        return now.hour * 60 + now.minute
+
+    def nearby(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float = settings.facilities_default_radius_km,
+        limit: int = 10,
+        capabilities: Sequence[str] = (),
+        facility_type: Optional[str] = None,
+        open_now: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Facilities within radius_km matching the filters, nearest first"""
+        results = self.index.query(
+            lat,
+            lon,
+            radius_km,
+            limit,
+            capabilities,
+            facility_type,
+            self.minute_of_day() if open_now else None
+        )
+        return [
+            {**asdict(facility), "distance_km": round(distance, 3)}
+            for facility, distance in results
+        ]
+
+    def describe_nearby(self, user_location: Optional[Dict[str, Any]]) -> Optional[str]:
+        """One-line summary of the closest open facilities for the chat prompt"""
+        coordinates = coordinates_from(user_location)
+        if coordinates is None or not len(self.index):
+            return None
+
+        # Widen the search until enough facilities are found
+        radius = settings.facilities_default_radius_km
+        minute = self.minute_of_day()
+        while True:
+            results = self.index.query(
+                *coordinates,
+                radius_km=radius,
+                limit=settings.facilities_chat_context_count,
+                open_at_minute=minute
+            )
+            if len(results) >= settings.facilities_chat_context_count or radius >= settings.facilities_max_radius_km:
+                break
+            radius = min(radius * 2, settings.facilities_max_radius_km)
+        if not results:
+            return None
+
+        described = "; ".join(
+            f"{facility.name} ({facility.type}, {distance:.1f} km)"
+            for facility, distance in results
+        )
+        return f"Nearest open medical facilities to the caller: {described}. Mention them only if the caller asks where to go."
+
+facility_locator = FacilityLocator()
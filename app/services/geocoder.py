@@ -0,0 +1,332 @@
+"""
+Offline geocoding of free-text incident locations
+
+Places and landmarks are loaded from a local gazetteer file into a
+GazetteerIndex: every name and alias is normalized, split into word
+trigrams, and posted to an inverted index from trigram to names. A lookup
+counts shared trigrams once over the whole text to shortlist candidate
+names. Each shortlisted name is then scored against the word windows of
+the text by Dice similarity. The best match is the one explaining the most
+words, so "the Total station on Jinja Road" resolves to the fuel station
+rather than the road. Results, misses included, go in an LRU cache that is
+cleared whenever the gazetteer is reloaded.
+
+No network calls are made. The file is polled for changes like the
+facility file.
+
+CSV columns:
+    name, latitude, longitude, type, aliases
+`aliases` is ";"-separated (e.g. "total jinja rd;total station jinja road").
+"""
+import asyncio
+import csv
+import logging
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from app.core.config import settings
+from app.utils.cache import TTLCache
+from app.utils.metrics import GEOCODE_LOOKUPS, record_error
+
+logger = logging.getLogger(__name__)
+
+# Words that locate rather than name a place
+STOPWORDS = frozenset((
+    "a", "an", "and", "the", "of", "at", "on", "in", "by", "to", "near", "nearby",
+    "next", "opposite", "opp", "behind", "beside", "along", "around", "close",
+    "just", "after", "before", "off", "from", "area", "side", "here",
+    "i", "im", "am", "is", "my", "our", "we", "are"
+))
+
+ABBREVIATIONS = {
+    "rd": "road",
+    "st": "street",
+    "ave": "avenue",
+    "hosp": "hospital",
+    "sch": "school",
+    "stn": "station",
+    "mkt": "market",
+    "univ": "university"
+}
+
+# Longest run of words compared against a name
+MAX_WINDOW_WORDS = 6
+
+# Names shortlisted per lookup by shared trigram count
+SHORTLIST_SIZE = 32
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    latitude: float
+    longitude: float
+    type: str = "place"
+    aliases: Tuple[str, ...] = ()
+
+@dataclass(frozen=True)
+class GeocodeMatch:
+    place: Place
+    matched_text: str
+    score: float
+
+    @property
+    def latitude(self) -> float:
+        return self.place.latitude
+
+    @property
+    def longitude(self) -> float:
+        return self.place.longitude
+
+def normalize_words(text: str) -> List[str]:
+    """Lowercase ASCII words with abbreviations expanded and stopwords dropped"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    words = (ABBREVIATIONS.get(word, word) for word in _NON_WORD_RE.split(text))
+    return [word for word in words if word and word not in STOPWORDS]
+
+def word_trigrams(words: Iterable[str]) -> Set[str]:
+    """pg_trgm-style trigrams: each word padded with two spaces before and one after"""
+    trigrams = set()
+    for word in words:
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def load_gazetteer(path: str) -> List[Place]:
+    """Read places from a CSV; rows without valid coordinates are skipped"""
+    places: List[Place] = []
+    skipped = 0
+    with open(path, encoding="utf-8", newline="") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                latitude, longitude = float(row["latitude"]), float(row["longitude"])
+                if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+                    raise ValueError("coordinates out of range")
+                places.append(Place(
+                    name=row["name"].strip(),
+                    latitude=latitude,
+                    longitude=longitude,
+                    type=(row.get("type") or "place").strip().lower(),
+                    aliases=tuple(alias.strip() for alias in (row.get("aliases") or "").split(";") if alias.strip())
+                ))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                skipped += 1
+    if skipped:
+        logger.warning("Skipped %d unreadable gazetteer rows in %s", skipped, path)
+    return places
+
+class GazetteerIndex:
+    """Immutable trigram index over place names and aliases"""
+
+    def __init__(self, places: Sequence[Place]):
+        self.places = list(places)
+        # One entry per distinct normalized name or alias
+        self.entry_place: List[int] = []
+        self.entry_words: List[Tuple[str, ...]] = []
+        self.entry_trigrams: List[frozenset] = []
+
+        postings: Dict[str, List[int]] = {}
+        seen: Set[Tuple[int, Tuple[str, ...]]] = set()
+        for place_number, place in enumerate(self.places):
+            for name in (place.name, *place.aliases):
+                words = tuple(normalize_words(name))
+                if not words or (place_number, words) in seen:
+                    continue
+                seen.add((place_number, words))
+                entry = len(self.entry_place)
+                trigrams = frozenset(word_trigrams(words))
+                self.entry_place.append(place_number)
+                self.entry_words.append(words)
+                self.entry_trigrams.append(trigrams)
+                for trigram in trigrams:
+                    postings.setdefault(trigram, []).append(entry)
+        # Common trigrams post to thousands of names; counting them as
+        # arrays keeps a lookup to one bincount
+        self.postings: Dict[str, np.ndarray] = {
+            trigram: np.array(entries, dtype=np.int32) for trigram, entries in postings.items()
+        }
+        self.entry_sizes = np.fromiter(
+            (len(trigrams) for trigrams in self.entry_trigrams), dtype=np.int32, count=len(self.entry_trigrams)
+        )
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def lookup(self, text: str, min_similarity: float = settings.geocoder_min_similarity) -> Optional[GeocodeMatch]:
+        """Best place named in the text, or None if nothing is similar enough"""
+        words = normalize_words(text)
+        if not words or not self.postings:
+            return None
+
+        matched = [self.postings[trigram] for trigram in word_trigrams(words) if trigram in self.postings]
+        if not matched:
+            return None
+        shared = np.bincount(np.concatenate(matched), minlength=len(self.entry_sizes))
+        # Even a window holding every shared trigram could not reach the threshold
+        bound = 2 * shared / (self.entry_sizes + shared)
+        candidates = np.flatnonzero(bound >= min_similarity)
+        if len(candidates) > SHORTLIST_SIZE:
+            top = np.argpartition(shared[candidates], -SHORTLIST_SIZE)[-SHORTLIST_SIZE:]
+            candidates = candidates[top]
+
+        window_trigrams: Dict[Tuple[int, int], frozenset] = {}
+        best: Optional[Tuple[float, float, int, int, int]] = None
+        for entry in candidates.tolist():
+            entry_trigrams = self.entry_trigrams[entry]
+            length = len(self.entry_words[entry])
+            for size in range(max(1, length - 1), min(len(words), length + 1, MAX_WINDOW_WORDS) + 1):
+                for start in range(len(words) - size + 1):
+                    key = (start, size)
+                    trigrams = window_trigrams.get(key)
+                    if trigrams is None:
+                        trigrams = window_trigrams[key] = frozenset(word_trigrams(words[start:start + size]))
+                    similarity = 2 * len(entry_trigrams & trigrams) / (len(entry_trigrams) + len(trigrams))
+                    if similarity < min_similarity:
+                        continue
+                    # Prefer the match that accounts for the most words
+                    candidate = (similarity * min(size, length), similarity, entry, start, size)
+                    if best is None or candidate[:2] > best[:2]:
+                        best = candidate
+
+        if best is None:
+            return None
+        _, similarity, entry, start, size = best
+        return GeocodeMatch(
+            place=self.places[self.entry_place[entry]],
+            matched_text=" ".join(words[start:start + size]),
+            score=round(similarity, 3)
+        )
+
+class Geocoder:
+    def __init__(
+        self,
+        path: Optional[str] = settings.gazetteer_path,
+        reload_interval: float = settings.gazetteer_reload_interval_seconds,
+        cache_size: int = settings.geocoder_cache_size,
+        min_similarity: float = settings.geocoder_min_similarity
+    ):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.min_similarity = min_similarity
+        self.index = GazetteerIndex([])
+        self.loaded_mtime: Optional[float] = None
+        # normalized text -> (match or None,); entries live until the next reload
+        self.cache: TTLCache[Tuple[Optional[GeocodeMatch]]] = TTLCache(maxsize=cache_size, ttl=math.inf)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_mtime is not None
+
+    async def start(self) -> None:
+        """Load the gazetteer and start watching it for changes"""
+        if not self.path or self._task is not None:
+            return
+        await self.reload()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the index if the file changed since the last load
+
+        Returns:
+            bool: True if a new index was swapped in
+        """
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self.loaded_mtime:
+                return False
+            index = await asyncio.to_thread(self._build_index, self.path)
+        except Exception as e:
+            record_error(logger, "geocoder", "Error loading gazetteer from %s: %s", self.path, e)
+            return False
+        self.index = index
+        self.cache.clear()
+        self.loaded_mtime = mtime
+        logger.info("Loaded %d gazetteer places from %s", len(index), self.path)
+        return True
+
+    def load(self) -> int:
+        """Load the gazetteer synchronously (for scripts); returns the place count"""
+        self.index = self._build_index(self.path)
+        self.cache.clear()
+        self.loaded_mtime = os.path.getmtime(self.path)
+        return len(self.index)
+
+    @staticmethod
+    def _build_index(path: str) -> GazetteerIndex:
+        return GazetteerIndex(load_gazetteer(path))
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    def geocode(self, text: Optional[str]) -> Optional[GeocodeMatch]:
+        """Resolve a free-text location to a gazetteer place, or None"""
+        if not text or not self.loaded:
+            return None
+        key = " ".join(normalize_words(text))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[0]
+        index = self.index
+        return self._remember(index, key, index.lookup(text, self.min_similarity))
+
+    async def resolve(self, text: Optional[str]) -> Optional[GeocodeMatch]:
+        """
+        geocode() for the event loop
+
+        Cached texts are answered inline; a miss is looked up in a worker
+        thread so a long location does not stall other requests.
+        """
+        if not text or not self.loaded:
+            return None
+        key = " ".join(normalize_words(text))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[0]
+        index = self.index
+        match = await asyncio.to_thread(index.lookup, text, self.min_similarity)
+        return self._remember(index, key, match)
+
+    def _cached(self, key: str) -> Optional[Tuple[Optional[GeocodeMatch]]]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            GEOCODE_LOOKUPS.labels("cached").inc()
+        return cached
+
+    def _remember(self, index: GazetteerIndex, key: str, match: Optional[GeocodeMatch]) -> Optional[GeocodeMatch]:
+        GEOCODE_LOOKUPS.labels("matched" if match else "unmatched").inc()
+        # A reload during the lookup cleared the cache; keep the old
+        # index's answer out of it
+        if index is self.index:
+            self.cache.set(key, (match,))
+        return match
+
+    def geocode_many(self, texts: Sequence[Optional[str]]) -> List[Optional[GeocodeMatch]]:
+        """Resolve many locations, looking up each distinct text once"""
+        results: Dict[Optional[str], Optional[GeocodeMatch]] = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.geocode(text)
+        return [results[text] for text in texts]
+
+geocoder = Geocoder()
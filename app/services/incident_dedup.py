@@ -0,0 +1,327 @@
+"""
+Near-duplicate incident detection
+
+One crash often brings in several callers, and each conversation ends in
+an incident of its own. Every new dispatch is compared with the incidents
+dispatched on this worker in the last DEDUP_WINDOW_SECONDS. Incidents
+the triage extractor names differently (a fire and a road accident) are
+never duplicates. Otherwise two incidents are duplicates in two cases.
+If both have coordinates, they must be within DEDUP_RADIUS_KM of each
+other and be the same kind of incident or have somewhat similar text. If
+either has no coordinates, their location text must be near-identical.
+
+Candidates come from two indexes, so a lookup never scans the window:
+
+- A grid of cells DEDUP_RADIUS_KM wide. The incident's cell and its
+  eight neighbours hold everything within the radius.
+- MinHash locality-sensitive hashing over character shingles of the
+  location text. Signatures are cut into bands, and incidents sharing a
+  band share a bucket. Only unlocated incidents, or incidents compared
+  with unlocated ones, are looked up by text.
+
+Each cell and bucket keeps only its DEDUP_BUCKET_SIZE most recent
+incidents, so a lookup inspects a bounded number of candidates. These are
+confirmed by the exact Jaccard similarity of their shingle sets.
+
+A duplicate records the incident it repeats in duplicate_of and is still
+queued for a unit of its own; a match is only a hint. Withholding the unit
+takes a dispatcher confirming the duplicate through the admin API.
+"""
+import itertools
+import logging
+import math
+import re
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.triage import incident_name
+from app.utils.geo import KM_PER_DEGREE, haversine_km
+from app.utils.metrics import DUPLICATE_INCIDENTS
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 4
+# 12 bands of 2 rows, of which a text candidate must share 2: locations
+# at Jaccard 0.6 qualify 96% of the time, at 0.3 about 30%
+MINHASH_BANDS = 12
+MINHASH_ROWS = 2
+MIN_BAND_HITS = 2
+
+# Filler words that vary between callers describing the same place
+STOP_WORDS = frozenset(("a", "an", "the", "at", "on", "in", "near", "by", "of", "and", "to", "is", "there"))
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+# Multiply-shift hash family: odd 64-bit multipliers, top 32 bits kept
+_rng = np.random.default_rng(20240601)
+_MULTIPLIERS = _rng.integers(0, 2 ** 63, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_OFFSETS = _rng.integers(0, 2 ** 63, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64)
+
+def shingles(text: str) -> FrozenSet[int]:
+    """
+    Hashed character shingles of text, ignoring case, punctuation, filler
+    words and word order
+    """
+    words = sorted(word for word in _NON_WORD_RE.sub(" ", text.lower()).split() if word not in STOP_WORDS)
+    normalized = " ".join(words).encode()
+    if len(normalized) <= SHINGLE_SIZE:
+        return frozenset((zlib.crc32(normalized),)) if normalized else frozenset()
+    return frozenset(
+        zlib.crc32(normalized[start:start + SHINGLE_SIZE])
+        for start in range(len(normalized) - SHINGLE_SIZE + 1)
+    )
+
+def minhash_bands(shingle_set: FrozenSet[int]) -> List[bytes]:
+    """The MinHash signature of a shingle set, cut into band keys"""
+    values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    signature = ((_MULTIPLIERS[:, None] * values[None, :] + _OFFSETS[:, None]) >> np.uint64(32)).min(axis=1)
+    return [signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].tobytes() for band in range(MINHASH_BANDS)]
+
+def jaccard(first: FrozenSet[int], second: FrozenSet[int]) -> float:
+    if not first or not second:
+        return 0.0
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+@dataclass(eq=False)
+class IndexedIncident:
+    id: str
+    kind: Optional[str]
+    incident_shingles: FrozenSet[int]
+    location_shingles: FrozenSet[int]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    priority: int
+    indexed_at: float
+    keys: List[Hashable] = field(default_factory=list)
+    # The first incident of its group; itself unless it is a duplicate
+    original: Optional["IndexedIncident"] = None
+    duplicates: int = 0
+
+@dataclass
+class DuplicateMatch:
+    incident_id: str
+    original_id: str
+    similarity: float
+    distance_km: Optional[float]
+    # Set once a dispatcher confirms it repeats the original
+    confirmed: bool = False
+
+class IncidentIndex:
+    """Recent incidents by grid cell and MinHash band"""
+
+    def __init__(
+        self,
+        window_seconds: float = settings.dedup_window_seconds,
+        radius_km: float = settings.dedup_radius_km,
+        nearby_similarity: float = settings.dedup_nearby_similarity,
+        text_similarity: float = settings.dedup_text_similarity,
+        bucket_size: int = settings.dedup_bucket_size
+    ):
+        self.window_seconds = window_seconds
+        self.radius_km = radius_km
+        self.nearby_similarity = nearby_similarity
+        self.text_similarity = text_similarity
+        self.bucket_size = bucket_size
+        self.cell_degrees = radius_km / KM_PER_DEGREE
+        self.buckets: Dict[Hashable, Deque[IndexedIncident]] = {}
+        self._window: Deque[IndexedIncident] = deque()
+
+    def __len__(self) -> int:
+        return len(self._window)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int(math.floor((latitude + 90.0) / self.cell_degrees)),
+            int(math.floor((longitude + 180.0) / self.cell_degrees))
+        )
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._window and self._window[0].indexed_at < cutoff:
+            incident = self._window.popleft()
+            for key in incident.keys:
+                bucket = self.buckets.get(key)
+                # It may already have been pushed out by newer incidents
+                if bucket is None or incident not in bucket:
+                    continue
+                bucket.remove(incident)
+                if not bucket:
+                    del self.buckets[key]
+
+    def _candidates(self, incident: IndexedIncident, bands: List[bytes]) -> Iterable[IndexedIncident]:
+        """Incidents in range of this one, and those sharing MIN_BAND_HITS bands with it"""
+        near: List[IndexedIncident] = []
+        if incident.latitude is not None:
+            row, column = self._cell(incident.latitude, incident.longitude)
+            for d_row in (-1, 0, 1):
+                for d_column in (-1, 0, 1):
+                    near.extend(self.buckets.get(("cell", row + d_row, column + d_column), ()))
+        # A located incident already has every located one in range from the
+        # cells, so its text only needs comparing with unlocated ones
+        kind = "band" if incident.latitude is None else "unlocated"
+        hits: Dict[IndexedIncident, int] = {}
+        for band, key in enumerate(bands):
+            for candidate in self.buckets.get((kind, band, key), ()):
+                hits[candidate] = hits.get(candidate, 0) + 1
+        return itertools.chain(near, (candidate for candidate, count in hits.items() if count >= MIN_BAND_HITS))
+
+    def _score(
+        self, incident: IndexedIncident, candidate: IndexedIncident
+    ) -> Optional[Tuple[float, float, Optional[float]]]:
+        """(rank, similarity, distance) if candidate is a likely duplicate, else None"""
+        if incident.kind and candidate.kind and incident.kind != candidate.kind:
+            return None
+        place = jaccard(incident.location_shingles, candidate.location_shingles)
+        if incident.latitude is not None and candidate.latitude is not None:
+            distance = haversine_km(incident.latitude, incident.longitude, candidate.latitude, candidate.longitude)
+            if distance > self.radius_km:
+                return None
+            similarity = max(place, jaccard(incident.incident_shingles, candidate.incident_shingles))
+            # The same kind of incident in range is enough
+            if (incident.kind and incident.kind == candidate.kind) or similarity >= self.nearby_similarity:
+                # Nearest first, and ahead of any match on text alone
+                return 2.0 - distance / self.radius_km, similarity, distance
+            return None
+        if place >= self.text_similarity:
+            return place, place, None
+        return None
+
+    def match(
+        self,
+        incident_id: str,
+        incident: Optional[str],
+        location: Optional[str],
+        latitude: Optional[float],
+        longitude: Optional[float],
+        priority: int,
+        now: Optional[float] = None
+    ) -> Tuple[IndexedIncident, Optional[Tuple[IndexedIncident, float, Optional[float]]]]:
+        """
+        File an incident and find the recent incident it most likely repeats
+
+        Returns:
+            The indexed incident, and (match, similarity, distance_km) for the
+            best likely duplicate (the nearest, or without coordinates the
+            most similar), or None
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        indexed = IndexedIncident(
+            incident_id,
+            incident_name(incident or ""),
+            shingles(incident or ""),
+            shingles(location or ""),
+            latitude,
+            longitude,
+            priority,
+            now
+        )
+        bands = minhash_bands(indexed.location_shingles) if indexed.location_shingles else []
+
+        best = None
+        best_rank = 0.0
+        for candidate in self._candidates(indexed, bands):
+            scored = self._score(indexed, candidate)
+            if scored is not None and scored[0] > best_rank:
+                best_rank, similarity, distance = scored
+                best = (candidate, similarity, distance)
+
+        if latitude is not None:
+            indexed.keys.append(("cell", *self._cell(latitude, longitude)))
+        for band, key in enumerate(bands):
+            indexed.keys.append(("band", band, key))
+            if latitude is None:
+                indexed.keys.append(("unlocated", band, key))
+        for key in indexed.keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = deque(maxlen=self.bucket_size)
+            bucket.append(indexed)
+        self._window.append(indexed)
+        return indexed, best
+
+class IncidentDeduplicator:
+    def __init__(
+        self,
+        index: Optional[IncidentIndex] = None,
+        enabled: bool = settings.dedup_enabled,
+        recent_size: int = 50
+    ):
+        self.index = index if index is not None else IncidentIndex()
+        self.enabled = enabled
+        self.recent: Deque[DuplicateMatch] = deque(maxlen=recent_size)
+        self.checked = 0
+        self.flagged = 0
+        self.confirmed = 0
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "window_incidents": len(self.index),
+            "checked": self.checked,
+            "flagged": self.flagged,
+            "confirmed": self.confirmed
+        }
+
+    def check(
+        self,
+        incident_id: str,
+        incident: Optional[str],
+        location: Optional[str],
+        latitude: Optional[float],
+        longitude: Optional[float],
+        priority: int,
+        now: Optional[float] = None
+    ) -> Optional[DuplicateMatch]:
+        """
+        Compare a new dispatch with recent ones and remember it
+
+        Returns:
+            Optional[DuplicateMatch]: The incident it most likely repeats, or
+            None; the new incident still needs its own unit either way
+        """
+        if not self.enabled:
+            return None
+        self.checked += 1
+        indexed, best = self.index.match(incident_id, incident, location, latitude, longitude, priority, now)
+        if best is None:
+            return None
+        candidate, similarity, distance = best
+        original = candidate.original or candidate
+        indexed.original = original
+        original.duplicates += 1
+
+        self.flagged += 1
+        DUPLICATE_INCIDENTS.labels("flagged").inc()
+        duplicate = DuplicateMatch(
+            incident_id=incident_id,
+            original_id=original.id,
+            similarity=round(similarity, 3),
+            distance_km=None if distance is None else round(distance, 3)
+        )
+        self.recent.append(duplicate)
+        logger.info("Incident %s may repeat %s (similarity %.2f)", incident_id, original.id, similarity)
+        return duplicate
+
+    def confirm(self, incident_id: str, original_id: str) -> Optional[DuplicateMatch]:
+        """
+        Record a dispatcher's confirmation that an incident repeats another
+
+        Returns:
+            Optional[DuplicateMatch]: The match this worker flagged, if any;
+            dispatchers may also confirm repeats it did not catch
+        """
+        self.confirmed += 1
+        DUPLICATE_INCIDENTS.labels("confirmed").inc()
+        for duplicate in self.recent:
+            if duplicate.incident_id == incident_id and duplicate.original_id == original_id:
+                duplicate.confirmed = True
+                return duplicate
+        return None
+
+incident_deduplicator = IncidentDeduplicator()
@@ -0,0 +1,344 @@
+"""
+Priority-tiered persistence
+
+Two lanes share the database. Emergency incidents go through a dedicated
+high-priority lane: a few workers insert them with bounded retries and
+resolve a confirmation future for the caller. Anything that still fails is
+appended to a local spool, which is replayed on start and then every
+replay_interval once writes are succeeding again. Conversation logs
+use the batched write-behind writer, which holds back while emergency
+writes are pending.
+
+Workers share the spool: appends and claims are serialized with a file
+lock, and only one worker replays it at a time. Shutdown waits up to
+drain_timeout for queued incidents and spools whatever is still unwritten,
+so a redeploy never drops one. Incidents carry their own id and inserts
+skip ids already stored, so a row that was both written and spooled is
+stored once. Updates to an incident that could not be written (such as
+its ambulance assignment) are spooled too, and applied after the spooled
+inserts so they find their row.
+"""
+import asyncio
+import logging
+import json
+import os
+import time
+from typing import IO, Dict, List, Optional
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.services.conversation_logger import ConversationLogWriter, conversation_log_writer
+from app.utils.file_lock import acquire_lock, file_lock, release_lock
+from app.utils.metrics import QUEUE_DEPTH, record_error
+
+logger = logging.getLogger(__name__)
+
+class PersistenceScheduler:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        log_writer: ConversationLogWriter = conversation_log_writer,
+        workers: int = settings.emergency_write_workers,
+        max_retries: int = settings.emergency_write_max_retries,
+        retry_base_delay: float = settings.emergency_write_retry_base_seconds,
+        write_timeout: float = settings.emergency_write_timeout_seconds,
+        spool_path: str = settings.emergency_spool_path,
+        replay_interval: float = settings.emergency_spool_replay_interval_seconds,
+        drain_timeout: float = settings.shutdown_drain_timeout_seconds
+    ):
+        self.repository = repo
+        self.log_writer = log_writer
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.write_timeout = write_timeout
+        self.spool_path = spool_path
+        self.replay_interval = replay_interval
+        self.drain_timeout = drain_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._waiting: Dict[int, float] = {}
+        self._replay_task: Optional[asyncio.Task] = None
+        self._replay_loop: Optional[asyncio.Task] = None
+        self._replay_lock: Optional[IO] = None
+        # Monotonic time of the last insert that failed every retry
+        self._last_failure = 0.0
+        self._in_flight = 0
+        self.emergencies_written = 0
+        self.emergencies_retried = 0
+        self.emergencies_spooled = 0
+        self.updates_spooled = 0
+
+        # Conversation batches wait while any incident is queued or being written
+        self.log_writer.defer_while = lambda: self.emergency_depth > 0
+
+    @property
+    def emergency_depth(self) -> int:
+        """Incidents queued or being written"""
+        return len(self._waiting) + self._in_flight
+
+    @property
+    def emergency_oldest_age(self) -> float:
+        """Seconds the oldest queued incident has been waiting"""
+        if not self._waiting:
+            return 0.0
+        return time.monotonic() - min(self._waiting.values())
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Queue depth and age for each lane"""
+        return {
+            "emergency": {
+                "depth": self.emergency_depth,
+                "oldest_age_seconds": round(self.emergency_oldest_age, 3),
+                "written": self.emergencies_written,
+                "retried": self.emergencies_retried,
+                "spooled": self.emergencies_spooled,
+                "updates_spooled": self.updates_spooled
+            },
+            "conversation": {
+                "depth": self.log_writer.depth,
+                "oldest_age_seconds": round(self.log_writer.oldest_age, 3),
+                "written": self.log_writer.rows_written,
+                "spooled": self.log_writer.rows_spooled
+            }
+        }
+
+    async def start(self) -> None:
+        """Start the emergency workers and the conversation writer"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            await self._replay_spool()
+            self._replay_loop = asyncio.create_task(self._replay_periodically())
+        await self.log_writer.start()
+
+    async def stop(self) -> None:
+        """Finish queued incidents first, then drain conversation logs"""
+        if self._queue is not None:
+            self._replay_loop.cancel()
+            await asyncio.gather(self._replay_loop, return_exceptions=True)
+            self._replay_loop = None
+            try:
+                await asyncio.wait_for(self._drain(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                record_error(
+                    logger, "emergency_write",
+                    "Shutdown drain timed out; spooling %d unwritten incidents", self.emergency_depth
+                )
+            # Workers still writing spool their row as they are cancelled
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            self._spool_queued()
+            if self._replay_task is not None:
+                self._replay_task.cancel()
+                self._replay_task = None
+            self._release_replay_lock()
+            self._queue = None
+        await self.log_writer.stop()
+
+    async def _drain(self) -> None:
+        await self._queue.join()
+        if self._replay_task is not None:
+            await self._replay_task
+            self._replay_task = None
+
+    def _spool_queued(self) -> None:
+        """Spool incidents that never reached a worker"""
+        rows = []
+        while not self._queue.empty():
+            row, future = self._queue.get_nowait()
+            self._waiting.pop(id(future), None)
+            rows.append(row)
+            if not future.done():
+                future.set_exception(Exception("Emergency write spooled at shutdown"))
+            self._queue.task_done()
+        if rows:
+            self._append_spool(rows)
+            self.emergencies_spooled += len(rows)
+
+    async def persist_emergency(self, row: Dict, confirm_timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Write an incident through the high-priority lane
+
+        Returns:
+            Optional[Dict]: The stored row once confirmed, or None if it was
+            not confirmed within the timeout (it keeps retrying in the background)
+        """
+        if self._queue is None:
+            # Scheduler not running (e.g. a script); write inline
+            return await self._write_with_retries(row)
+
+        future = self._enqueue(row)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future),
+                timeout=confirm_timeout or settings.emergency_confirm_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Emergency write not confirmed in time; still retrying in the background")
+            return None
+        except Exception:
+            return None
+
+    def _enqueue(self, row: Dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Callers may stop waiting; mark any late failure as retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._waiting[id(future)] = time.monotonic()
+        self._queue.put_nowait((row, future))
+        return future
+
+    def submit_conversation(self, row: Dict) -> None:
+        """Queue a conversation row on the low-priority batched lane"""
+        self.log_writer.enqueue(row)
+
+    async def _worker(self) -> None:
+        while True:
+            row, future = await self._queue.get()
+            self._waiting.pop(id(future), None)
+            self._in_flight += 1
+            try:
+                try:
+                    stored = await self._write_with_retries(row)
+                except asyncio.CancelledError:
+                    # Shutdown stopped waiting; the next start writes it
+                    self._append_spool([row])
+                    self.emergencies_spooled += 1
+                    raise
+                if not future.done():
+                    if stored is not None:
+                        future.set_result(stored)
+                    else:
+                        future.set_exception(Exception("Emergency write failed"))
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _write_with_retries(self, row: Dict) -> Optional[Dict]:
+        """Insert an incident, retrying with backoff and spooling if every attempt fails"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                stored = await asyncio.wait_for(
+                    self.repository.insert_emergency_incident(row),
+                    timeout=self.write_timeout
+                )
+                self.emergencies_written += 1
+                return stored or row
+            except Exception as e:
+                record_error(logger, "emergency_write", "Error logging emergency (attempt %d): %s", attempt + 1, e)
+                if attempt < self.max_retries:
+                    self.emergencies_retried += 1
+                    await asyncio.sleep(self.retry_base_delay * (2 ** attempt))
+
+        await asyncio.to_thread(self._append_spool, [row])
+        self.emergencies_spooled += 1
+        self._last_failure = time.monotonic()
+        return None
+
+    async def spool_update(self, incident_id: str, values: Dict) -> None:
+        """Spool an update to an incident, to be applied on the next replay"""
+        await asyncio.to_thread(self._append_spool, [{"id": incident_id, "update": values}])
+        self.updates_spooled += 1
+        # Hold the replay back as after a failed insert
+        self._last_failure = time.monotonic()
+
+    def _append_spool(self, rows: List[Dict]) -> None:
+        with file_lock(self.spool_path + ".lock"):
+            with open(self.spool_path, "a", encoding="utf-8") as spool:
+                for row in rows:
+                    spool.write(json.dumps(row, default=str) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+
+    async def _replay_periodically(self) -> None:
+        """Replay incidents spooled while running, once writes are succeeding again"""
+        replay_path = self.spool_path + ".replay"
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if self._replay_task is not None and not self._replay_task.done():
+                continue
+            # Rows spooled because the database is down would only fail again
+            if time.monotonic() - self._last_failure < self.replay_interval:
+                continue
+            if not os.path.exists(self.spool_path) and not os.path.exists(replay_path):
+                continue
+            try:
+                await self._replay_spool()
+            except Exception as e:
+                record_error(logger, "emergency_spool", "Error replaying emergency spool: %s", e)
+
+    async def _replay_spool(self) -> None:
+        """Re-queue spooled incidents, from this run or from before the last shutdown"""
+        replay_path = self.spool_path + ".replay"
+        # Only one worker replays; the others leave the spool to it
+        self._replay_lock = await asyncio.to_thread(acquire_lock, replay_path + ".lock", False)
+        if self._replay_lock is None:
+            return
+        await asyncio.to_thread(self._claim_spool, replay_path)
+        if not os.path.exists(replay_path):
+            self._release_replay_lock()
+            return
+        rows = await asyncio.to_thread(self._read_spool, replay_path)
+
+        futures = [self._enqueue(row) for row in rows if "update" not in row]
+        updates = [row for row in rows if "update" in row]
+        # The replay file is only removed once every row is written or re-spooled
+        self._replay_task = asyncio.create_task(self._finish_replay(futures, updates, replay_path))
+
+    async def _finish_replay(self, futures: List[asyncio.Future], updates: List[Dict], replay_path: str) -> None:
+        await asyncio.gather(*futures, return_exceptions=True)
+        failed = []
+        for update in updates:
+            try:
+                found = await asyncio.wait_for(
+                    self.repository.update_emergency_incident(update["id"], update["update"]),
+                    timeout=self.write_timeout
+                )
+            except Exception as e:
+                record_error(logger, "emergency_spool", "Error replaying update to %s: %s", update["id"], e)
+                failed.append(update)
+                continue
+            if not found:
+                record_error(logger, "emergency_spool", "Dropping spooled update to unknown incident %s", update["id"])
+        if failed:
+            await asyncio.to_thread(self._append_spool, failed)
+            self._last_failure = time.monotonic()
+        os.remove(replay_path)
+        self._release_replay_lock()
+
+    def _release_replay_lock(self) -> None:
+        release_lock(self._replay_lock)
+        self._replay_lock = None
+
+    def _claim_spool(self, replay_path: str) -> None:
+        """Move the spool's rows into the replay file, merging with any leftover one"""
+        with file_lock(self.spool_path + ".lock"):
+            if not os.path.exists(self.spool_path):
+                return
+            with open(self.spool_path, encoding="utf-8") as spool, \
+                    open(replay_path, "a", encoding="utf-8") as replay:
+                replay.write(spool.read())
+                replay.flush()
+                os.fsync(replay.fileno())
+            os.remove(self.spool_path)
+
+    @staticmethod
+    def _read_spool(path: str) -> List[Dict]:
+        rows = []
+        with open(path, encoding="utf-8") as spool:
+            for line in spool:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    record_error(logger, "emergency_spool", "Skipping unreadable emergency spool line")
+        return rows
+
+persistence_scheduler = PersistenceScheduler()
+
+QUEUE_DEPTH.labels("emergency_writes").set_function(lambda: persistence_scheduler.emergency_depth)
+QUEUE_DEPTH.labels("conversation_log").set_function(lambda: persistence_scheduler.log_writer.depth)
@@ -0,0 +1,79 @@
+"""
+Cache for opening replies
+
+Most conversations open with near-identical messages ("help", "I need an
+ambulance"). Replies to a first turn with no history, no location and no
+dispatch are cached by normalized message, so repeat openers skip the
+OpenAI round trip. Set RESPONSE_CACHE_ENABLED=false to switch it off.
+"""
+import re
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.models.schemas import ChatResponse
+from app.utils.cache import TTLCache
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+# Longer messages are rarely repeated verbatim and not worth caching
+MAX_CACHEABLE_CHARS = 200
+
+def normalize_message(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub(" ", message.lower())).strip()
+
+class ResponseCache:
+    def __init__(
+        self,
+        enabled: bool = settings.response_cache_enabled,
+        maxsize: int = settings.response_cache_size,
+        ttl: float = settings.response_cache_ttl_seconds
+    ):
+        self.enabled = enabled
+        self.cache: TTLCache[ChatResponse] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def key_for(
+        self,
+        message: str,
+        conversation_history: List[Dict],
+        user_location: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        Cache key for a turn, or None when the turn is not cacheable
+
+        Only opening turns qualify: replies to later turns depend on the
+        conversation, and replies with a location may quote the caller's address.
+        """
+        if not self.enabled or conversation_history or user_location:
+            return None
+        if len(message) > MAX_CACHEABLE_CHARS:
+            return None
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        return f"opening:{normalized}"
+
+    def get(self, key: Optional[str]) -> Optional[ChatResponse]:
+        if key is None or not self.enabled:
+            return None
+        cached = self.cache.get(key)
+        # Dispatches are never cached, so there is no nested dict to share
+        return cached.model_copy() if cached is not None else None
+
+    def set(self, key: Optional[str], response: ChatResponse) -> None:
+        if key is None or not self.enabled or response.dispatch_triggered:
+            return
+        self.cache.set(key, response.model_copy())
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "size": len(self.cache),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses
+        }
+
+response_cache = ResponseCache()
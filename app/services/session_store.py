@@ -0,0 +1,177 @@
+"""
+Server-side chat sessions
+
+Clients send a `session_id` and only the new message; the transcript lives
+here. Sessions are bounded per worker (LRU eviction, idle expiry) and per
+session (message and character caps, oldest turns dropped first). Set
+SESSION_BACKEND=redis to share sessions between workers.
+
+A conversation started without a known session_id goes into the user's
+default session, which is reset each time, so clients that never send a
+session_id hold one session per user rather than one per request.
+"""
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+class SessionBackend(ABC):
+    """Storage interface for session records"""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def put(self, session_id: str, session: Dict) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class InMemorySessionBackend(SessionBackend):
+    """Per-worker session storage with LRU eviction and idle expiry"""
+
+    def __init__(self, max_sessions: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        touched_at, session = entry
+        now = time.monotonic()
+        if now - touched_at > self.ttl:
+            del self._sessions[session_id]
+            return None
+        # Reading a session counts as use for eviction and idle expiry
+        self._sessions[session_id] = (now, session)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def put(self, session_id: str, session: Dict) -> None:
+        self._sessions[session_id] = (time.monotonic(), session)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class RedisSessionBackend(SessionBackend):
+    """Session storage shared between workers through Redis"""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self.ttl = int(ttl)
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"medilocator:session:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        # Reading a session restarts its idle expiry
+        raw = await self.client.getex(self._key(session_id), ex=self.ttl)
+        return json.loads(raw) if raw else None
+
+    async def put(self, session_id: str, session: Dict) -> None:
+        await self.client.set(self._key(session_id), json.dumps(session), ex=self.ttl)
+
+    async def delete(self, session_id: str) -> None:
+        await self.client.delete(self._key(session_id))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+class SessionStore:
+    def __init__(
+        self,
+        backend: SessionBackend,
+        max_messages: int = settings.session_max_messages,
+        max_chars: int = settings.session_max_chars
+    ):
+        self.backend = backend
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+
+    @staticmethod
+    def default_session_id(user_id: str) -> str:
+        """Id of the session a user's conversations start in"""
+        return "u-" + hashlib.sha256(user_id.encode()).hexdigest()[:32]
+
+    async def start(self, user_id: str, messages: Optional[List[Dict]] = None) -> str:
+        """Reset the user's default session, optionally seeded with earlier messages"""
+        session_id = self.default_session_id(user_id)
+        session = {"user_id": user_id, "messages": []}
+        self._extend(session, messages or [])
+        await self.backend.put(session_id, session)
+        return session_id
+
+    async def get_history(self, session_id: str, user_id: str) -> Optional[List[Dict]]:
+        """
+        Get a session's messages
+
+        Returns:
+            Optional[List[Dict]]: The transcript, or None if the session is
+            unknown, expired or belongs to another user
+        """
+        session = await self.backend.get(session_id)
+        if not session or session.get("user_id") != user_id:
+            return None
+        return session["messages"]
+
+    async def append(self, session_id: str, user_id: str, messages: List[Dict]) -> None:
+        """Add messages to a session, trimming it back under its caps"""
+        session = await self.backend.get(session_id)
+        if not session or session.get("user_id") != user_id:
+            session = {"user_id": user_id, "messages": []}
+        self._extend(session, messages)
+        await self.backend.put(session_id, session)
+
+    async def delete(self, session_id: str) -> None:
+        await self.backend.delete(session_id)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def _extend(self, session: Dict, messages: List[Dict]) -> None:
+        # Callers pass freshly built {"role", "content"} dicts, which are kept as is
+        history = session["messages"]
+        history.extend(messages)
+
+        # Drop the oldest turns once either cap is exceeded
+        overflow = len(history) - self.max_messages
+        if overflow > 0:
+            del history[:overflow]
+        total_chars = sum(len(msg["content"]) for msg in history)
+        while len(history) > 1 and total_chars > self.max_chars:
+            total_chars -= len(history.pop(0)["content"])
+
+def create_session_backend(backend: str) -> SessionBackend:
+    """Build the session backend for the configured name"""
+    if backend == "memory":
+        return InMemorySessionBackend(
+            max_sessions=settings.session_max_sessions,
+            ttl=settings.session_ttl_seconds
+        )
+    if backend == "redis":
+        return RedisSessionBackend(settings.session_redis_url, ttl=settings.session_ttl_seconds)
+    raise ValueError(f"Unknown session backend: {backend}")
+
+session_store = SessionStore(create_session_backend(settings.session_backend))
@@ -0,0 +1,296 @@
+"""
+Deterministic triage extraction
+
+Runs before the LLM on every chat turn. A handful of compiled patterns pull
+the incident type, victim count, reported status and a street-style
+location out of what the caller typed. The result pre-fills
+`emergency_details` and tells the model which questions are already
+answered. With TRIAGE_AUTO_DISPATCH on it also dispatches without the
+model when the location, incident and victim count are all present.
+
+Keyword matches are not taken at face value. Negated phrases ("nobody is
+bleeding") and phrases that name a place ("the Fire Station") are
+skipped. An incident mentioned in a question, a hypothetical or a
+second-hand account ("what if", "I heard") is marked tentative, and a
+tentative incident is never dispatched without the model.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+# Canonical incident -> phrases callers use for it. Compiled into a single
+# alternation with one capture group per incident, so one scan finds the
+# first match and `lastindex` says which incident it was.
+INCIDENT_PHRASES = {
+    "road traffic accident": [
+        "car crash", "car accident", "road accident", "traffic accident", "accident on the road",
+        "hit by a car", "hit by a boda", "knocked down", "boda boda accident", "boda accident",
+        "motorcycle accident", "bike accident", "collision", "crashed", "overturned", "run over"
+    ],
+    "cardiac emergency": [
+        "heart attack", "cardiac arrest", "chest pain", "chest pains", "no pulse"
+    ],
+    "breathing difficulty": [
+        "can't breathe", "cannot breathe", "cant breathe", "difficulty breathing", "trouble breathing",
+        "not breathing", "stopped breathing", "choking", "asthma attack", "short of breath"
+    ],
+    "severe bleeding": [
+        "bleeding heavily", "heavy bleeding", "bleeding badly", "losing blood", "lots of blood", "bleeding"
+    ],
+    "unconscious person": [
+        "unconscious", "unresponsive", "passed out", "fainted", "collapsed", "not waking up",
+        "won't wake up"
+    ],
+    "stroke": ["stroke", "face drooping", "slurred speech"],
+    "seizure": ["seizure", "seizures", "convulsing", "convulsions", "fitting"],
+    "labour emergency": [
+        "in labour", "in labor", "giving birth", "water broke", "waters broke", "delivering a baby"
+    ],
+    "burns": ["burned", "burnt", "burns", "on fire", "fire"],
+    "assault": ["stabbed", "stabbing", "shot", "gunshot", "attacked", "beaten up", "assaulted"],
+    "drowning": ["drowning", "drowned"],
+    "poisoning": ["poisoned", "poisoning", "overdose", "overdosed", "swallowed"],
+    "fall": ["fell from", "fallen from", "fell off", "bad fall"],
+    "electrocution": ["electrocuted", "electric shock"],
+    "allergic reaction": ["allergic reaction", "anaphylaxis", "swelling up"],
+}
+
+STATUS_PHRASES = {
+    "not breathing": ["not breathing", "stopped breathing", "no pulse"],
+    "unconscious": ["unconscious", "unresponsive", "not waking up", "passed out", "fainted"],
+    "bleeding": ["bleeding", "losing blood"],
+    "conscious": ["conscious", "awake", "talking", "responsive"],
+    "trapped": ["trapped", "stuck"],
+}
+
+NUMBER_WORDS = {
+    "one": 1, "a": 1, "an": 1, "single": 1, "two": 2, "both": 2, "three": 3, "four": 4,
+    "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20
+}
+
+VICTIM_NOUNS = (
+    r"people|persons?|victims?|casualties|injured|passengers|patients|kids|children|"
+    r"child|babies|baby|adults?|men|man|women|woman|boys?|girls?|students|pedestrians"
+)
+
+# Place suffixes that mark a phrase as an address or landmark
+PLACE_SUFFIXES = (
+    r"road|rd|street|st|avenue|ave|highway|hwy|lane|ln|drive|dr|close|crescent|way|"
+    r"boulevard|blvd|junction|roundabout|market|hospital|station|stage|mall|hotel|church|"
+    r"mosque|school|university|stadium|park|estate|village|trading centre|trading center|"
+    r"bridge|flyover|taxi park|bus park"
+)
+
+def _alternation(phrases: List[str]) -> str:
+    # Longest first so "car crash" wins over "crash"
+    return "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+
+_INCIDENT_NAMES = list(INCIDENT_PHRASES)
+# A phrase followed by a place suffix names a place ("Fire Station", "Crash Road")
+INCIDENT_RE = re.compile(
+    r"\b(?:" + "|".join(f"({_alternation(INCIDENT_PHRASES[name])})" for name in _INCIDENT_NAMES) + r")\b"
+    r"(?!\s+(?:" + PLACE_SUFFIXES + r")\b)",
+    re.IGNORECASE
+)
+
+_STATUS_NAMES = list(STATUS_PHRASES)
+STATUS_RE = re.compile(
+    r"\b(?:" + "|".join(f"({_alternation(STATUS_PHRASES[name])})" for name in _STATUS_NAMES) + r")\b",
+    re.IGNORECASE
+)
+
+VICTIM_RE = re.compile(
+    r"\b(\d{1,3}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")\s+"
+    r"(?:(?:injured|hurt|wounded|unconscious|more)\s+)?(?:" + VICTIM_NOUNS + r")\b",
+    re.IGNORECASE
+)
+ALONE_RE = re.compile(r"\b(?:just me|only me|i am alone|i'm alone|by myself|only one person|one person)\b", re.IGNORECASE)
+# "my father", "our neighbour": each distinct relative counts as one victim
+RELATIVE_RE = re.compile(
+    r"\b(?:my|our|his|her|their)\s+(father|mother|dad|mum|mom|son|daughter|wife|husband|brother|"
+    r"sister|friend|child|baby|grandmother|grandfather|grandma|grandpa|uncle|aunt|neighbou?r|boss|colleague)\b",
+    re.IGNORECASE
+)
+
+# "at Kampala Road", "near the Total station on Jinja Road", "plot 12 Acacia Avenue"
+_PLACE = r"(?i:the\s+)?(?i:plot\s+\d+\w?\s+)?(?:[A-Z0-9][\w'.&-]*\s+){1,4}(?i:" + PLACE_SUFFIXES + r")\b"
+LOCATION_RE = re.compile(
+    r"\b(?i:at|on|near|along|opposite|behind|beside|outside|inside|in front of|next to|by)\s+"
+    r"(" + _PLACE + r"(?:,?\s+(?i:on|at|along|off|near|opposite)\s+" + _PLACE + r")*)"
+)
+
+LOCATION_REQUEST_RE = re.compile(r"location|address|where are you|where is this", re.IGNORECASE)
+
+# A phrase is negated by one of these among the few words before it in its clause
+NEGATIONS = frozenset((
+    "no", "not", "never", "without", "nobody", "none", "nothing", "neither", "nor",
+    "isn't", "isnt", "wasn't", "wasnt", "aren't", "arent", "weren't", "werent",
+    "don't", "dont", "doesn't", "doesnt", "didn't", "didnt", "hasn't", "hasnt", "haven't", "havent"
+))
+NEGATION_WINDOW_WORDS = 3
+_CLAUSE_BREAK_RE = re.compile(r"[.,;:!?\n]|\bbut\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z']+")
+
+# Questions, hypotheticals and second-hand accounts: the caller may not be
+# reporting an incident that is happening
+TENTATIVE_RE = re.compile(
+    r"\b(?:if|suppose|supposing|in case|would|could|might|maybe|whether|"
+    r"heard|hear|hearing|sound|sounds|sounded|noise|afraid|worried|"
+    r"how (?:do|to|can|should)|what (?:do|should))\b",
+    re.IGNORECASE
+)
+_SENTENCE_END_RE = re.compile(r"[.!?\n]")
+
+def _negated(text: str, start: int) -> bool:
+    """True when a negation precedes position start within its clause"""
+    before = text[max(0, start - 60):start]
+    breaks = list(_CLAUSE_BREAK_RE.finditer(before))
+    if breaks:
+        before = before[breaks[-1].end():]
+    words = _WORD_RE.findall(before.lower().replace("\u2019", "'"))
+    return any(word in NEGATIONS for word in words[-NEGATION_WINDOW_WORDS:])
+
+def _affirmed(pattern: re.Pattern, text: str) -> Optional[re.Match]:
+    """First match of pattern in text that is not negated"""
+    for match in pattern.finditer(text):
+        if not _negated(text, match.start()):
+            return match
+    return None
+
+def _tentative(text: str, match: re.Match) -> bool:
+    """True when the sentence around a match is a question, hypothetical or hearsay"""
+    start = 0
+    for end_mark in _SENTENCE_END_RE.finditer(text, 0, match.start()):
+        start = end_mark.end()
+    end_mark = _SENTENCE_END_RE.search(text, match.end())
+    sentence = text[start:end_mark.end() if end_mark else len(text)]
+    return sentence.rstrip().endswith("?") or TENTATIVE_RE.search(sentence) is not None
+
+def incident_name(text: str) -> Optional[str]:
+    """Name of the first incident the text describes, e.g. 'road traffic accident' for 'car crash'"""
+    match = _affirmed(INCIDENT_RE, text)
+    return _INCIDENT_NAMES[match.lastindex - 1] if match else None
+
+@dataclass
+class TriageResult:
+    location: Optional[str] = None
+    incident: Optional[str] = None
+    victim_count: Optional[str] = None
+    user_reported_status: Optional[str] = None
+    # The incident came from a question, hypothetical or second-hand account
+    tentative: bool = False
+
+    @property
+    def is_complete(self) -> bool:
+        """True when every field required for dispatch was found"""
+        return bool(self.location and self.incident and self.victim_count)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.location or self.incident or self.victim_count or self.user_reported_status)
+
+    def missing(self) -> List[str]:
+        missing = []
+        if not self.location:
+            missing.append("location")
+        if not self.incident:
+            missing.append("incident")
+        if not self.victim_count:
+            missing.append("victim_count")
+        return missing
+
+    def to_details(self) -> Dict[str, str]:
+        """Render as the `emergency_details` dict used by dispatch"""
+        return {
+            "location": self.location or "",
+            "incident": self.incident or "",
+            "victim_count": self.victim_count or "",
+            "user_reported_status": self.user_reported_status or "unknown"
+        }
+
+    def describe(self) -> str:
+        """Short note for the model listing what has already been gathered"""
+        known = [
+            f"{field}={value}" for field, value in (
+                ("location", self.location),
+                ("incident", self.incident),
+                ("victim_count", self.victim_count),
+                ("user_reported_status", self.user_reported_status),
+            ) if value
+        ]
+        note = "Details already gathered from the caller: " + ", ".join(known) + "."
+        missing = self.missing()
+        if missing:
+            note += " Still needed: " + ", ".join(missing) + "."
+        if self.tentative:
+            note += " The caller may not be reporting a real incident yet; confirm it is happening before dispatching."
+        return note
+
+class TriageExtractor:
+    def __init__(self, cache_size: int = settings.triage_cache_size):
+        # Message text -> extraction, kept as long as a session lives; entries
+        # are shared, so they are never modified
+        self._earlier: TTLCache[TriageResult] = TTLCache(maxsize=cache_size, ttl=settings.session_ttl_seconds)
+
+    def extract(self, text: str) -> TriageResult:
+        """Extract whatever dispatch details a single message contains"""
+        result = TriageResult()
+
+        match = _affirmed(INCIDENT_RE, text)
+        if match:
+            result.incident = _INCIDENT_NAMES[match.lastindex - 1]
+            result.tentative = _tentative(text, match)
+
+        match = _affirmed(STATUS_RE, text)
+        if match:
+            result.user_reported_status = _STATUS_NAMES[match.lastindex - 1]
+
+        match = VICTIM_RE.search(text)
+        if match:
+            count = match.group(1).lower()
+            result.victim_count = count if count.isdigit() else str(NUMBER_WORDS[count])
+        elif ALONE_RE.search(text):
+            result.victim_count = "1"
+        else:
+            relatives = {relative.lower() for relative in RELATIVE_RE.findall(text)}
+            if relatives:
+                result.victim_count = str(len(relatives))
+
+        match = LOCATION_RE.search(text)
+        if match:
+            result.location = match.group(1).strip()
+
+        return result
+
+    def extract_conversation(self, message: str, conversation_history: List[Dict]) -> TriageResult:
+        """
+        Merge details from the new message and earlier caller turns
+
+        Newer statements win; assistant turns are ignored.
+        """
+        result = self.extract(message)
+        for msg in reversed(conversation_history):
+            if result.is_complete and result.user_reported_status:
+                break
+            if msg["role"] != "user":
+                continue
+            earlier = self._extract_earlier(msg["content"])
+            result.location = result.location or earlier.location
+            if not result.incident and earlier.incident:
+                result.incident = earlier.incident
+                result.tentative = earlier.tentative
+            result.victim_count = result.victim_count or earlier.victim_count
+            result.user_reported_status = result.user_reported_status or earlier.user_reported_status
+        return result
+
+    def _extract_earlier(self, text: str) -> TriageResult:
+        result = self._earlier.get(text)
+        if result is None:
+            result = self.extract(text)
+            self._earlier.set(text, result)
+        return result
+
+triage_extractor = TriageExtractor()
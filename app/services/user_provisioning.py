@@ -0,0 +1,189 @@
+"""
+Off-request provisioning of anonymous users
+
+In the "local" and "pool" sign-in modes the token is returned before the
+user's `anonymous_users` row exists. UserProvisioner collects those rows
+and creates them in batched inserts that skip ids already present. It
+writes as soon as a batch fills, and otherwise within one flush interval.
+Until a row is written, its user is answered from memory. When an insert
+fails it waits retry_interval before the next attempt, however many
+sign-ins arrive, and queues at most max_pending rows. A user whose row was
+dropped is re-created the next time their token is seen.
+
+IdentityPool keeps a few anonymous identities created ahead of time with
+Supabase Auth, topping itself up in the background. Sign-ins then get a
+real auth identity without waiting on the round trip.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from app.core.config import settings
+from app.models.repository import Repository, repository
+from app.utils.metrics import QUEUE_DEPTH, record_error
+
+logger = logging.getLogger(__name__)
+
+class UserProvisioner:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        batch_size: int = settings.user_provisioning_batch_size,
+        flush_interval: float = settings.user_provisioning_flush_interval_seconds,
+        retry_interval: float = settings.user_provisioning_retry_seconds,
+        max_pending: int = settings.user_provisioning_max_pending
+    ):
+        self.repository = repo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_pending = max_pending
+        # user_id -> row, in arrival order
+        self._pending: Dict[str, Dict] = {}
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of user rows not yet written"""
+        return len(self._pending)
+
+    def add(self, user_data: Dict) -> None:
+        """Queue a user row for creation, unless the queue is full"""
+        if user_data["id"] not in self._pending and len(self._pending) >= self.max_pending:
+            if not self.dropped:
+                record_error(logger, "provisioning", "User queue is full; dropping rows until inserts succeed")
+            self.dropped += 1
+            return
+        self._pending.setdefault(user_data["id"], user_data)
+        if len(self._pending) >= self.batch_size and self._full is not None:
+            self._full.set()
+
+    def pending_user(self, user_id: str) -> Optional[Dict]:
+        """The queued row for a user whose row is not written yet"""
+        return self._pending.get(user_id)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and write any pending rows"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> bool:
+        """Write every queued row, batch_size rows per insert; False if an insert failed"""
+        while self._pending:
+            rows: List[Dict] = list(self._pending.values())[:self.batch_size]
+            try:
+                await self.repository.insert_anonymous_users(rows)
+            except Exception as e:
+                # Rows stay queued and are retried on the next flush
+                record_error(logger, "provisioning", "Error creating %d users: %s", len(rows), e)
+                return False
+            for row in rows:
+                self._pending.pop(row["id"], None)
+            self.dropped = 0
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            if not await self.flush():
+                # The database is failing; full batches wait out the backoff too
+                await asyncio.sleep(self.retry_interval)
+                self._full.clear()
+
+class IdentityPool:
+    def __init__(
+        self,
+        repo: Repository = repository,
+        size: int = settings.identity_pool_size,
+        concurrency: int = settings.identity_pool_refill_concurrency,
+        retry_interval: float = settings.identity_pool_retry_seconds
+    ):
+        self.repository = repo
+        self.size = size
+        self.concurrency = concurrency
+        self.retry_interval = retry_interval
+        self._identities: Deque[str] = deque()
+        self._wanted: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> int:
+        return len(self._identities)
+
+    def take(self) -> Optional[str]:
+        """A pre-created user id, or None if the pool is empty"""
+        if not self._identities:
+            return None
+        user_id = self._identities.popleft()
+        if self._wanted is not None:
+            self._wanted.set()
+        return user_id
+
+    async def start(self) -> None:
+        if self._task is None and self.size > 0:
+            self._wanted = asyncio.Event()
+            self._wanted.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Unused identities are simply never handed out
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def refill(self) -> int:
+        """Create identities until the pool is full; returns how many were added"""
+        added = 0
+        while len(self._identities) < self.size:
+            batch = min(self.concurrency, self.size - len(self._identities))
+            results = await asyncio.gather(
+                *(self.repository.auth_sign_in_anonymously() for _ in range(batch)),
+                return_exceptions=True
+            )
+            created = [result["user_id"] for result in results if isinstance(result, dict)]
+            self._identities.extend(created)
+            added += len(created)
+            if len(created) < batch:
+                failure = next((result for result in results if isinstance(result, Exception)), "no user returned")
+                record_error(logger, "identity_pool", "Error creating pooled identities: %s", failure)
+                break
+        return added
+
+    async def _run(self) -> None:
+        while True:
+            await self._wanted.wait()
+            self._wanted.clear()
+            await self.refill()
+            if len(self._identities) < self.size:
+                # Auth is failing or rate limited; back off before retrying
+                await asyncio.sleep(self.retry_interval)
+                self._wanted.set()
+
+user_provisioner = UserProvisioner()
+identity_pool = IdentityPool()
+
+QUEUE_DEPTH.labels("user_provisioning").set_function(lambda: user_provisioner.depth)
+QUEUE_DEPTH.labels("identity_pool").set_function(lambda: identity_pool.available)
@@ -0,0 +1,52 @@
+"""
+Advisory file locks shared between worker processes
+
+Every worker appends to the same spool files. Appends and claims hold a
+blocking lock so a claim never drops a row another worker is appending,
+and replays hold a non-blocking lock so only one worker replays a spool at
+a time. The kernel releases a lock when its holder exits, so a killed
+worker never leaves one behind. Without fcntl (Windows) the locks are
+no-ops, which is fine for a single development process.
+"""
+import os
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def acquire_lock(path: str, blocking: bool = True) -> Optional[IO]:
+    """
+    Lock `path`, creating it if needed
+
+    Returns:
+        Optional[IO]: The open lock file, held until release_lock(), or None
+        if blocking is False and another process holds the lock
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handle = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+    return handle
+
+def release_lock(handle: Optional[IO]) -> None:
+    if handle is not None:
+        # Closing the file releases the lock
+        handle.close()
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold a blocking lock on `path` for the duration of the block"""
+    handle = acquire_lock(path)
+    try:
+        yield
+    finally:
+        release_lock(handle)
@@ -0,0 +1,51 @@
+import math
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Kilometres per degree of latitude (and of longitude at the equator)
+KM_PER_DEGREE = 111.195
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def haversine_km_many(lat: float, lon: float, lats_rad: np.ndarray, lons_rad: np.ndarray) -> np.ndarray:
+    """
+    Distances in kilometres from one point to many
+
+    Args:
+        lat, lon: The origin in degrees
+        lats_rad, lons_rad: Destinations in radians (precomputed by the caller)
+    """
+    phi = math.radians(lat)
+    dphi = lats_rad - phi
+    dlambda = lons_rad - math.radians(lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi) * np.cos(lats_rad) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def coordinates_from(location: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """
+    Pull (latitude, longitude) out of a client location payload
+
+    Accepts latitude/longitude, lat/lon or lat/lng keys, at the top level or
+    under "coords" as browsers report them. Returns None if absent or invalid.
+    """
+    if not location:
+        return None
+    if isinstance(location.get("coords"), dict):
+        location = location["coords"]
+    lat = location.get("latitude", location.get("lat"))
+    lon = location.get("longitude", location.get("lon", location.get("lng")))
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
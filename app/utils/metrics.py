@@ -0,0 +1,198 @@
+"""
+Prometheus metrics
+
+Every metric the API exports is defined here and served at GET /metrics.
+Modules import the metric they update; queue-depth gauges are bound to
+their owners where the singletons are created. Metrics are per worker
+process unless PROMETHEUS_MULTIPROC_DIR is set (see the README).
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY
+)
+from app.core.config import settings
+
+# Upstream calls are slower than in-process work; stretch the top buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "medilocator_http_request_duration_seconds",
+    "Time to serve an HTTP request, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+LLM_LATENCY = Histogram(
+    "medilocator_llm_request_duration_seconds",
+    "Latency of one call to an LLM backend",
+    ["backend", "mode", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+DB_LATENCY = Histogram(
+    "medilocator_db_operation_duration_seconds",
+    "Latency of one Supabase operation, by table",
+    ["table", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+ERRORS = Counter(
+    "medilocator_errors_total",
+    "Errors handled without failing the request, by component",
+    ["component"]
+)
+
+DISPATCHES = Counter(
+    "medilocator_dispatches_total",
+    "Ambulance dispatches triggered, by what decided them",
+    ["source"]
+)
+
+SIGN_INS = Counter(
+    "medilocator_sign_ins_total",
+    "Anonymous sign-ins, by where the identity came from (supabase, pool, local)",
+    ["source"]
+)
+
+SHED_REQUESTS = Counter(
+    "medilocator_shed_requests_total",
+    "Requests refused by admission control, by reason (rate, overload) and priority",
+    ["reason", "priority"]
+)
+
+GEOCODE_LOOKUPS = Counter(
+    "medilocator_geocode_lookups_total",
+    "Free-text location lookups, by outcome (cached, matched, unmatched)",
+    ["outcome"]
+)
+
+QUEUE_DEPTH = Gauge(
+    "medilocator_queue_depth",
+    "Items waiting in an in-process queue",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+
+EVENT_LOOP_LAG = Gauge(
+    "medilocator_event_loop_lag_seconds",
+    "How late the most recent event-loop lag probe woke up",
+    multiprocess_mode="max"
+)
+
+ASSIGNMENT_WAIT = Histogram(
+    "medilocator_assignment_wait_seconds",
+    "Time from an incident entering the assignment queue to a unit being assigned",
+    ["priority"],
+    buckets=LATENCY_BUCKETS
+)
+
+ASSIGNMENT_BATCH = Histogram(
+    "medilocator_assignment_batch_duration_seconds",
+    "Time spent computing one batch of assignments",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+ASSIGNMENTS = Counter(
+    "medilocator_assignments_total",
+    "Incidents assigned a unit, by priority",
+    ["priority"]
+)
+
+DUPLICATE_INCIDENTS = Counter(
+    "medilocator_duplicate_incidents_total",
+    "Dispatches matched to a recent incident (flagged) and repeats confirmed by a dispatcher (confirmed)",
+    ["action"]
+)
+
+FEED_SUBSCRIBERS = Gauge(
+    "medilocator_dispatch_feed_subscribers",
+    "Dispatcher consoles connected to the live dispatch feed",
+    multiprocess_mode="livesum"
+)
+
+FEED_CATCH_UPS = Counter(
+    "medilocator_dispatch_feed_catch_ups_total",
+    "Feed subscribers caught up from the history after falling behind or reconnecting, by outcome (replayed, reset)",
+    ["outcome"]
+)
+
+def record_error(logger: logging.Logger, component: str, message: str, *args) -> None:
+    """Log a handled error and count it against its component"""
+    ERRORS.labels(component=component).inc()
+    logger.error(message, *args)
+
+def observe_db(table: str, operation: str):
+    """Decorator timing a repository coroutine against the database histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "success"
+                return result
+            finally:
+                DB_LATENCY.labels(table, operation, outcome).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render_latest() -> bytes:
+    """Exposition-format snapshot of every metric"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+def mark_process_stopped() -> None:
+    """Drop this worker's live gauges from the multiprocess aggregate"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+class LoopLagMonitor:
+    """
+    Event-loop lag probe
+
+    Sleeps for a fixed interval and records how much later than requested it
+    woke up. Sustained lag means something is blocking the loop.
+    """
+
+    def __init__(self, interval: float = settings.metrics_loop_lag_interval_seconds):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.set(max(0.0, time.perf_counter() - start - self.interval))
+
+loop_lag_monitor = LoopLagMonitor()
+
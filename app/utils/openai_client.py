@@ -1,28 +1,368 @@
-import os
-from typing import List, Dict
-from openai import OpenAI
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, List, Dict, Optional
+import httpx
 from app.core.config import settings
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.metrics import LLM_LATENCY, QUEUE_DEPTH, record_error
+
+logger = logging.getLogger(__name__)
+
+class LLMBackend:
+    """One model/endpoint pair with its own circuit breaker and latency history"""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        http_client: httpx.AsyncClient,
+        api_key: str,
+        base_url: Optional[str] = None
+    ):
+        # Imported here; the SDK takes a noticeable share of startup time
+        from openai import AsyncOpenAI
+        self.name = name
+        self.model = model
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=settings.openai_max_retries
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.llm_breaker_failure_threshold,
+            reset_timeout=settings.llm_breaker_reset_seconds
+        )
+        self.latencies: Deque[float] = deque(maxlen=settings.llm_latency_window)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Recent successful-call latency at the given percentile (0-1)"""
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+    async def complete(self, messages: List[Dict], timeout: float) -> str:
+        """Run one completion, recording its outcome on the breaker"""
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=200,
+                    timeout=timeout
+                ),
+                timeout=timeout
+            )
+            content = response.choices[0].message.content.strip()
+        except asyncio.CancelledError:
+            # Lost a hedge race; not the backend's fault
+            self.breaker.release()
+            LLM_LATENCY.labels(self.name, "complete", "cancelled").observe(time.monotonic() - start)
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            LLM_LATENCY.labels(self.name, "complete", "error").observe(time.monotonic() - start)
+            raise
+        elapsed = time.monotonic() - start
+        self.breaker.record_success()
+        self.latencies.append(elapsed)
+        LLM_LATENCY.labels(self.name, "complete", "success").observe(elapsed)
+        return content
+
+def _backend_configs() -> List[Dict]:
+    if settings.llm_backends:
+        return settings.llm_backends
+    return [{"name": "openai", "model": settings.openai_model, "base_url": settings.openai_base_url}]
 
 class OpenAIClient:
+    """
+    LLM calls with failover and hedging across the configured backends
+
+    The connection pool and SDK clients are built by start() during the app
+    lifespan, or on first use, so importing this module opens nothing.
+    """
+
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
-        if not settings.openai_api_key:
-            raise ValueError("OpenAI API key not configured")
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._backends: Optional[List[LLMBackend]] = None
+        self.max_concurrency = settings.openai_max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    @property
+    def backends(self) -> List[LLMBackend]:
+        if self._backends is None:
+            if not settings.openai_api_key:
+                raise ValueError("OpenAI API key not configured")
+            # One pooled HTTP client shared by every backend on this worker
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.openai_max_connections,
+                    max_keepalive_connections=settings.openai_max_keepalive_connections,
+                    keepalive_expiry=settings.openai_keepalive_expiry_seconds
+                ),
+                timeout=httpx.Timeout(
+                    settings.openai_timeout_seconds,
+                    connect=settings.openai_connect_timeout_seconds
+                )
+            )
+            self._backends = [
+                LLMBackend(
+                    name=config.get("name") or f"backend-{index}",
+                    model=config.get("model") or settings.openai_model,
+                    http_client=self._http_client,
+                    api_key=config.get("api_key") or settings.openai_api_key,
+                    base_url=config.get("base_url")
+                )
+                for index, config in enumerate(_backend_configs())
+            ]
+        return self._backends
+
+    @property
+    def model(self) -> str:
+        return self.backends[0].model
 
-    async def chat_completion(self, messages: List[Dict]) -> str:
-        """Make call to OpenAI Chat Completion API"""
+    async def start(self) -> None:
+        """Build the connection pool and SDK clients before the first call"""
+        self.backends
+
+    async def warm_up(self, connections: int) -> None:
+        """Open pooled connections to every backend"""
+        from openai import APIStatusError
+        results = await asyncio.gather(
+            *(backend.client.models.list() for backend in self.backends for _ in range(connections)),
+            return_exceptions=True
+        )
+        # Any HTTP response, even a 404 from a server without /models,
+        # leaves its connection pooled; only failures to connect count
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, APIStatusError):
+                raise result
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def in_flight(self) -> int:
+        """Number of upstream calls currently holding a concurrency slot"""
+        if self._semaphore is None:
+            return 0
+        return self.max_concurrency - self._semaphore._value
+
+    @property
+    def waiting(self) -> int:
+        """Number of calls queued for a concurrency slot"""
+        return self._waiting
+
+    async def _acquire_slot(self) -> None:
+        """Wait for a concurrency slot, giving up after the queue timeout"""
+        self._waiting += 1
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.1,
-                max_tokens=200,
-                timeout=30
+            await asyncio.wait_for(
+                self.semaphore.acquire(),
+                timeout=settings.openai_queue_timeout_seconds
             )
-            return response.choices[0].message.content.strip()
+        except asyncio.TimeoutError:
+            raise Exception("OpenAI service saturated")
+        finally:
+            self._waiting -= 1
+
+    def _hedge_delay(self, backend: LLMBackend) -> float:
+        """How long to wait on a backend before firing a hedged attempt"""
+        observed = backend.latency_percentile(settings.llm_hedge_percentile)
+        if observed is None:
+            return settings.llm_hedge_initial_delay_seconds
+        return max(settings.llm_hedge_min_delay_seconds, observed)
+
+    async def chat_completion(self, messages: List[Dict], timeout: Optional[float] = None) -> str:
+        """
+        Make call to OpenAI Chat Completion API
+
+        Tries the configured backends in order, skipping any whose circuit is
+        open. A backend that fails hands over to the next immediately; one
+        that is slower than its recent latency percentile gets a hedged
+        attempt on the next backend, and the first success wins.
+        """
+        timeout = timeout or settings.openai_timeout_seconds
+        await self._acquire_slot()
+        try:
+            return await self._hedged_completion(messages, timeout)
         except Exception as e:
-            print(f"OpenAI API error: {e}")
+            record_error(logger, "llm", "OpenAI API error: %s", e)
             raise Exception("OpenAI service unavailable")
+        finally:
+            self.semaphore.release()
+
+    async def _hedged_completion(self, messages: List[Dict], timeout: float) -> str:
+        deadline = time.monotonic() + timeout
+        candidates = [backend for backend in self.backends if backend.breaker.available()]
+        if not candidates:
+            raise Exception("all LLM backends are failing fast (circuits open)")
+        if len(self.backends) == 1:
+            # With a single backend, hedge and fail over onto it again
+            candidates.extend(candidates * settings.llm_max_hedges)
+
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedges = 0
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            while candidates:
+                backend = candidates.pop(0)
+                if backend.breaker.allow():
+                    remaining = max(0.1, deadline - time.monotonic())
+                    pending[asyncio.create_task(backend.complete(messages, remaining))] = backend
+                    return True
+            return False
+
+        try:
+            if not launch():
+                raise Exception("all LLM backends are failing fast (circuits open)")
+
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+
+                can_hedge = (
+                    settings.llm_hedge_enabled
+                    and candidates
+                    and hedges < settings.llm_max_hedges
+                )
+                wait_for = remaining
+                if can_hedge:
+                    newest = list(pending.values())[-1]
+                    wait_for = min(remaining, self._hedge_delay(newest))
+
+                done, _ = await asyncio.wait(
+                    pending.keys(), timeout=wait_for, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    if can_hedge and launch():
+                        hedges += 1
+                        self.hedges_started += 1
+                    continue
+
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedges and backend is not self.backends[0]:
+                            self.hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("LLM backend %s failed: %s", backend.name, last_error)
+
+                # Fail over straight away if nothing else is still running
+                if not pending:
+                    launch()
+
+            raise last_error or Exception("no LLM backend available")
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.keys(), return_exceptions=True)
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a Chat Completion, yielding content deltas as they arrive
+
+        Fails over to the next healthy backend if a stream breaks before
+        producing any content; once text has been sent it cannot be retried.
+        """
+        timeout = timeout or settings.openai_timeout_seconds
+        await self._acquire_slot()
+        try:
+            last_error: Optional[Exception] = None
+            for backend in self.backends:
+                if not backend.breaker.allow():
+                    continue
+                started = False
+                start = time.monotonic()
+                try:
+                    async for delta in self._stream_backend(backend, messages, timeout):
+                        started = True
+                        yield delta
+                    backend.breaker.record_success()
+                    LLM_LATENCY.labels(backend.name, "stream", "success").observe(time.monotonic() - start)
+                    return
+                except (asyncio.CancelledError, GeneratorExit):
+                    backend.breaker.release()
+                    LLM_LATENCY.labels(backend.name, "stream", "cancelled").observe(time.monotonic() - start)
+                    raise
+                except Exception as e:
+                    backend.breaker.record_failure()
+                    LLM_LATENCY.labels(backend.name, "stream", "error").observe(time.monotonic() - start)
+                    last_error = e
+                    logger.warning("LLM backend %s stream failed: %s", backend.name, e)
+                    if started:
+                        raise
+            raise last_error or Exception("all LLM backends are failing fast (circuits open)")
+        except Exception as e:
+            record_error(logger, "llm", "OpenAI API error: %s", e)
+            raise Exception("OpenAI service unavailable")
+        finally:
+            self.semaphore.release()
+
+    @staticmethod
+    async def _stream_backend(backend: LLMBackend, messages: List[Dict], timeout: float) -> AsyncIterator[str]:
+        stream = await asyncio.wait_for(
+            backend.client.chat.completions.create(
+                model=backend.model,
+                messages=messages,
+                temperature=0.1,
+                max_tokens=200,
+                timeout=timeout,
+                stream=True
+            ),
+            timeout=timeout
+        )
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+    def backend_status(self) -> List[Dict]:
+        """Circuit state and recent p50/p95 latency per backend"""
+        return [
+            {
+                "name": backend.name,
+                "model": backend.model,
+                "circuit": backend.breaker.state,
+                "p50_seconds": backend.latency_percentile(0.5),
+                "p95_seconds": backend.latency_percentile(0.95)
+            }
+            for backend in self.backends
+        ]
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._backends = None
 
 # Global OpenAI client instance
-openai_client = OpenAIClient()
\ No newline at end of file
+openai_client = OpenAIClient()
+
+QUEUE_DEPTH.labels("llm_in_flight").set_function(lambda: openai_client.in_flight)
+QUEUE_DEPTH.labels("llm_waiting").set_function(lambda: openai_client.waiting)
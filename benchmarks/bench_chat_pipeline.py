@@ -0,0 +1,154 @@
+"""
+CPU and memory per /chat request outside the upstream call
+
+    python -m benchmarks.bench_chat_pipeline [--iterations N]
+
+Runs the per-request work of the chat route on request bodies with growing
+client-sent histories: validating the body, converting the history,
+seeding the session, building the prompt, building the reply and
+serializing it. "legacy" is the previous pipeline: stdlib JSON decoding,
+msg.dict(), a copy in the session store, triage re-run on every earlier
+caller turn, a copy per kept message in the prompt builder, token counts
+for the whole history, a validated ChatResponse and FastAPI's
+response-model serialization into a JSONResponse. "current" is the
+pipeline the app runs now. Memory is the tracemalloc peak above the
+baseline during one request, which counts the transient copies. The
+triage cache is warm in "current", as it is for a session whose earlier
+turns were read on previous requests.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from app.api.routes.chat import _json_response
+from app.models.schemas import ChatRequest, ChatResponse
+from app.services.chat_service import ChatService
+from app.services.context_builder import MESSAGE_OVERHEAD_TOKENS, ContextBuilder, message_tokens
+from app.services.session_store import InMemorySessionBackend, SessionStore
+from app.services.triage import TriageResult, triage_extractor
+from benchmarks.bench_chat_service import PLAIN_REPLY, history_of
+
+MESSAGE = "we are at the market near the bus park in Wandegeya"
+
+RESPONSE_FIELD = create_model_field(name="Response_chat", type_=ChatResponse, mode="serialization")
+
+class LegacyContextBuilder(ContextBuilder):
+    """The prompt builder as it was: every message counted and copied"""
+
+    def build(self, system_prompt, conversation_history, user_message, user_location=None,
+              known_details=None, nearby_facilities=None) -> List[Dict]:
+        head = [{"role": "system", "content": system_prompt}]
+        if known_details:
+            head.append({"role": "system", "content": known_details})
+        tail = {"role": "user", "content": user_message}
+        remaining = self.budget_tokens - sum(message_tokens(msg) for msg in head) - message_tokens(tail)
+        costs = [message_tokens(msg) for msg in conversation_history]
+        if sum(costs) > remaining:
+            remaining -= self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+        kept: List[Dict] = []
+        split = len(conversation_history)
+        for msg, cost in zip(reversed(conversation_history), reversed(costs)):
+            if len(kept) >= self.min_recent_messages and cost > remaining:
+                break
+            kept.append({"role": msg["role"], "content": msg["content"]})
+            remaining -= cost
+            split -= 1
+        kept.reverse()
+        messages = head
+        if split > 0:
+            summary = self.summarize(conversation_history[:split])
+            if summary:
+                messages.append({"role": "system", "content": summary})
+        messages.extend(kept)
+        messages.append(tail)
+        return messages
+
+def legacy_triage(message: str, conversation_history: List[Dict]) -> TriageResult:
+    """extract_conversation without the per-message cache"""
+    result = triage_extractor.extract(message)
+    for msg in reversed(conversation_history):
+        if result.is_complete and result.user_reported_status:
+            break
+        if msg["role"] != "user":
+            continue
+        earlier = triage_extractor.extract(msg["content"])
+        result.location = result.location or earlier.location
+        result.incident = result.incident or earlier.incident
+        result.victim_count = result.victim_count or earlier.victim_count
+        result.user_reported_status = result.user_reported_status or earlier.user_reported_status
+    return result
+
+legacy_builder = LegacyContextBuilder()
+current_builder = ContextBuilder()
+store = SessionStore(InMemorySessionBackend(max_sessions=1000, ttl=60))
+
+def legacy_request(body: bytes) -> bytes:
+    request = ChatRequest.model_validate(json.loads(body))
+    history = [msg.model_dump() for msg in request.conversation_history]
+    # The session store copied every message
+    session = {"user_id": "u", "messages": [{"role": msg["role"], "content": msg["content"]} for msg in history]}
+    triage = legacy_triage(request.message, history)
+    legacy_builder.build(ChatService.SYSTEM_PROMPT, history, request.message, known_details=triage.describe())
+    response = ChatResponse(reply=PLAIN_REPLY, emergency_details=None, dispatch_triggered=False, requires_location=True)
+    response.session_id = "s"
+    return JSONResponse(_serialize_legacy(response)).body
+
+def _serialize_legacy(response: ChatResponse):
+    # serialize_response is a coroutine; drive it without an event loop
+    coroutine = serialize_response(field=RESPONSE_FIELD, response_content=response, is_coroutine=True)
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("serialize_response suspended")
+
+def current_request(body: bytes) -> bytes:
+    request = ChatRequest.model_validate(orjson.loads(body))
+    history = [{"role": msg.role, "content": msg.content} for msg in request.conversation_history]
+    session = {"user_id": "u", "messages": []}
+    store._extend(session, history)
+    triage = triage_extractor.extract_conversation(request.message, history)
+    current_builder.build(ChatService.SYSTEM_PROMPT, history, request.message, known_details=triage.describe())
+    response = ChatService._parse_openai_response(PLAIN_REPLY)
+    response.session_id = "s"
+    return _json_response(response).body
+
+def cpu_us(func: Callable[[bytes], bytes], body: bytes, iterations: int) -> float:
+    for _ in range(min(50, iterations)):
+        func(body)
+    start = time.process_time_ns()
+    for _ in range(iterations):
+        func(body)
+    return (time.process_time_ns() - start) / iterations / 1000
+
+def peak_kib(func: Callable[[bytes], bytes], body: bytes, repeats: int = 20) -> float:
+    func(body)
+    peaks = []
+    tracemalloc.start()
+    for _ in range(repeats):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func(body)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return min(peaks) / 1024
+
+def run(iterations: int) -> None:
+    print(f"{'history':>8}  {'pipeline':<8} {'cpu us/req':>11} {'peak KiB/req':>13}")
+    for turns in (0, 20, 200, 1000):
+        body = json.dumps({"message": MESSAGE, "conversation_history": history_of(turns)}).encode()
+        # Both pipelines must produce the same reply bytes
+        assert json.loads(legacy_request(body)) == json.loads(current_request(body))
+        rounds = max(20, iterations // max(1, turns // 20))
+        for label, func in (("legacy", legacy_request), ("current", current_request)):
+            print(f"{turns:>8}  {label:<8} {cpu_us(func, body, rounds):11.1f} {peak_kib(func, body):13.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,87 @@
+"""
+Per-call cost of prompt assembly and reply parsing
+
+    python -m benchmarks.bench_chat_service [--iterations N]
+
+Times ChatService._prepare_messages over short and long histories and
+ChatService._parse_openai_response on plain and dispatch replies. Both run
+on every LLM turn, outside the upstream call.
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable
+from app.services.chat_service import ChatService
+from app.services.triage import triage_extractor
+
+TURNS = [
+    ("user", "help please"),
+    ("assistant", "I'm here to help. What is the emergency?"),
+    ("user", "my father fell down and is not waking up"),
+    ("assistant", "I'm sorry. Is he breathing? Where are you right now?"),
+    ("user", "he is breathing but not answering me"),
+    ("assistant", "Stay with him. What is your exact address or a nearby landmark?"),
+]
+
+LOCATION = {"latitude": 0.3476, "longitude": 32.5825, "accuracy": 15}
+
+PLAIN_REPLY = "Stay with him and keep him on his side. What is your exact address?"
+
+DISPATCH_REPLY = json.dumps({
+    "confirmation": "Help is on the way. An ambulance has been dispatched to Wandegeya market. Please wait for further instructions.",
+    "emergency_details": {
+        "location": "Wandegeya market",
+        "incident": "fall, unresponsive",
+        "victim_count": "1",
+        "user_reported_status": "breathing, not responding"
+    },
+    "next_step": "A professional may call you on the number we have on file. Please keep your phone free and unlocked.",
+    "dispatch_triggered": True
+})
+
+def history_of(turns: int):
+    return [
+        {"role": role, "content": content}
+        for role, content in (TURNS * (turns // len(TURNS) + 1))[:turns]
+    ]
+
+def measure(label: str, func: Callable[[], object], iterations: int) -> None:
+    for _ in range(min(100, iterations)):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    mean_us = statistics.fmean(timings) / 1000
+    p50_us = timings[len(timings) // 2] / 1000
+    p99_us = timings[int(len(timings) * 0.99)] / 1000
+    print(f"{label:<44} mean: {mean_us:8.1f} us  p50: {p50_us:8.1f} us  p99: {p99_us:8.1f} us")
+
+def run(iterations: int) -> None:
+    message = "we are at the market near the bus park in Wandegeya"
+    for turns in (0, 6, 40):
+        history = history_of(turns)
+        triage = triage_extractor.extract_conversation(message, history)
+        measure(
+            f"_prepare_messages, {turns} turns",
+            lambda: ChatService._prepare_messages(message, history, None, triage),
+            iterations
+        )
+    history = history_of(6)
+    triage = triage_extractor.extract_conversation(message, history)
+    measure(
+        "_prepare_messages, 6 turns with location",
+        lambda: ChatService._prepare_messages(message, history, LOCATION, triage),
+        iterations
+    )
+
+    measure("_parse_openai_response, plain reply", lambda: ChatService._parse_openai_response(PLAIN_REPLY), iterations)
+    measure("_parse_openai_response, dispatch JSON", lambda: ChatService._parse_openai_response(DISPATCH_REPLY), iterations)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    run(parser.parse_args().iterations)
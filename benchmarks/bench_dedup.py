@@ -0,0 +1,165 @@
+"""
+Near-duplicate incident detection on synthetic caller bursts
+
+    python -m benchmarks.bench_dedup [--minutes N] [--seed N]
+
+Generates a stream of emergencies around a few Ugandan towns. Each
+emergency brings in a burst of one to eight callers over a few minutes,
+who describe it in their own words: a different phrase for the incident,
+the landmark misspelt or reworded, coordinates a little off, or none.
+Unrelated emergencies happen nearby at the same time. The stream runs
+at increasing rates, so the deduplication window holds more and more
+incidents. For each rate it reports:
+
+- precision: the share of flagged duplicates that match the right
+  emergency
+- recall: the share of repeat callers that are caught
+- flagged: how many callers are flagged for a dispatcher to confirm
+- latency: per-check latency once the window is full, for the indexed
+  lookup and for a linear scan of the window with the same scoring
+"""
+import argparse
+import random
+import time
+from typing import Iterable, List, Tuple
+from app.services.dispatch_engine import CRITICAL, URGENT
+from app.services.incident_dedup import IncidentDeduplicator, IncidentIndex
+from benchmarks.bench_facilities import LAT_RANGE, LON_RANGE
+
+# Ways callers describe the same kind of emergency
+INCIDENT_PHRASES = {
+    "crash": ["car accident", "road accident", "car crash", "accident with a car and a boda", "two cars crashed"],
+    "fire": ["house fire", "a building is on fire", "fire in a house", "fire, people inside"],
+    "collapse": ["building collapsed", "wall collapsed on people", "collapsed building"],
+    "medical": ["man collapsed and not breathing", "woman unconscious", "someone fainted and is unconscious"],
+    "drowning": ["child drowning", "person drowned in the lake", "drowning"]
+}
+SYLLABLES = ["ka", "na", "wa", "ki", "bu", "mu", "nte", "se", "ge", "ya", "lo", "ba", "kyo", "zi", "mbe", "ru",
+             "li", "to", "nda", "gu", "we", "sa", "mpa", "ko"]
+LANDMARKS = ["market", "taxi park", "Total station", "Shell station", "roundabout", "bus stage", "church", "primary school",
+             "junction", "trading centre"]
+ROADS = ["Jinja road", "Gayaza road", "Masaka road", "Entebbe road", "Bombo road", "Hoima road"]
+
+def misspell(word: str, rng: random.Random) -> str:
+    if len(word) < 5:
+        return word
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.random()
+    if edit < 0.4:
+        return word[:position] + word[position + 1:]
+    if edit < 0.7:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice("aeiou") + word[position:]
+
+def describe_place(place: str, landmark: str, road: str, rng: random.Random) -> str:
+    """The way one caller names the location"""
+    words = [place, landmark] if rng.random() < 0.6 else [landmark, place]
+    if rng.random() < 0.4:
+        words.append(f"on {road}")
+    if rng.random() < 0.3:
+        words.insert(0, "near the")
+    text = " ".join(words)
+    return " ".join(misspell(word, rng) if rng.random() < 0.15 else word for word in text.split())
+
+def place_name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))).capitalize()
+
+def synthetic_stream(minutes: int, per_minute: int, rng: random.Random) -> List[Tuple]:
+    """
+    (time, emergency, incident, location, latitude, longitude, priority) per
+    caller, in time order
+    """
+    # Each town has its own named neighbourhoods
+    neighbourhoods = []
+    for _ in range(25):
+        town_lat, town_lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        for _ in range(20):
+            neighbourhoods.append((place_name(rng), town_lat + rng.gauss(0, 0.03), town_lon + rng.gauss(0, 0.03)))
+    reports = []
+    for emergency in range(minutes * per_minute):
+        started = rng.uniform(0, minutes * 60)
+        kind = rng.choice(list(INCIDENT_PHRASES))
+        place, place_lat, place_lon = rng.choice(neighbourhoods)
+        # Somewhere within about a kilometre of the neighbourhood centre
+        lat, lon = place_lat + rng.gauss(0, 0.005), place_lon + rng.gauss(0, 0.005)
+        landmark, road = rng.choice(LANDMARKS), rng.choice(ROADS)
+        priority = CRITICAL if kind in ("medical", "drowning") else URGENT
+        callers = 1 if rng.random() < 0.5 else rng.randint(2, 8)
+        for caller in range(callers):
+            at = started + (0 if caller == 0 else rng.expovariate(1 / 90))
+            located = rng.random() < 0.7
+            reports.append((
+                at,
+                emergency,
+                rng.choice(INCIDENT_PHRASES[kind]),
+                describe_place(place, landmark, road, rng),
+                lat + rng.gauss(0, 0.0008) if located else None,
+                lon + rng.gauss(0, 0.0008) if located else None,
+                priority
+            ))
+    reports.sort(key=lambda report: report[0])
+    return reports
+
+class LinearIndex(IncidentIndex):
+    """The same scoring against every incident in the window"""
+
+    def _candidates(self, incident, bands) -> Iterable:
+        return list(self._window)
+
+def replay(reports: List[Tuple], index: IncidentIndex) -> Tuple[dict, List[int]]:
+    """Check every caller in turn; latencies are kept once the window is full"""
+
+    deduplicator = IncidentDeduplicator(index=index, enabled=True)
+    first_caller = {}
+    emergency_of = {}
+    correct = flagged = repeats = 0
+    latencies = []
+    windows = []
+    for number, (at, emergency, incident, location, lat, lon, priority) in enumerate(reports):
+        incident_id = f"i{number}"
+        emergency_of[incident_id] = emergency
+        is_repeat = emergency in first_caller
+        first_caller.setdefault(emergency, incident_id)
+        start = time.perf_counter_ns()
+        duplicate = deduplicator.check(incident_id, incident, location, lat, lon, priority, now=at)
+        elapsed = time.perf_counter_ns() - start
+        if at >= index.window_seconds:
+            latencies.append(elapsed)
+            windows.append(len(index))
+        repeats += is_repeat
+        if duplicate is not None:
+            flagged += 1
+            correct += emergency_of[duplicate.original_id] == emergency
+    stats = deduplicator.stats()
+    stats.update(correct=correct, flagged_total=flagged, repeats=repeats, window=sum(windows) // max(len(windows), 1))
+    return stats, latencies
+
+def percentile_us(latencies: List[int], fraction: float) -> float:
+    return sorted(latencies)[int(fraction * (len(latencies) - 1))] / 1000
+
+def run(minutes: int, seed: int) -> None:
+    print(
+        f"{'per min':>8} {'callers':>8} {'window':>7} {'precision':>9} {'recall':>7} {'flagged':>8}"
+        f" {'p50 us':>7} {'p99 us':>7} {'linear p50':>10} {'linear p99':>10}"
+    )
+    for per_minute in (2, 20, 200):
+        reports = synthetic_stream(minutes, per_minute, random.Random(seed))
+        index = IncidentIndex()
+        stats, latencies = replay(reports, index)
+        # The linear scan is only timed, over the first two minutes after its window fills
+        _, linear = replay([report for report in reports if report[0] < index.window_seconds + 120], LinearIndex())
+        print(
+            f"{per_minute:>8} {len(reports):>8} {stats['window']:>7}"
+            f" {stats['correct'] / max(stats['flagged_total'], 1):>9.3f}"
+            f" {stats['correct'] / max(stats['repeats'], 1):>7.3f}"
+            f" {stats['flagged']:>8}"
+            f" {percentile_us(latencies, 0.5):>7.1f} {percentile_us(latencies, 0.99):>7.1f}"
+            f" {percentile_us(linear, 0.5):>10.1f} {percentile_us(linear, 0.99):>10.1f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=60, help="Simulated minutes per rate")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+    run(args.minutes, args.seed)
@@ -0,0 +1,92 @@
+"""
+Ambulance assignment throughput and quality
+
+    python -m benchmarks.bench_dispatch [--units N] [--incidents N] [--burst N]
+
+Runs a synthetic fleet of N units around a few Ugandan towns against a
+stream of incidents arriving in bursts. Each unit is released at its
+incident's location a few bursts after it is assigned. The stream is
+replayed twice: once with batched assignment, and once with batch size 1,
+which is the greedy nearest-free-unit policy. For each run it reports
+assignments per second and the total and mean unit-to-incident distance.
+"""
+import argparse
+import random
+import time
+from collections import deque
+from typing import List, Tuple
+from app.services.dispatch_engine import CRITICAL, URGENT, AssignmentEngine
+from benchmarks.bench_facilities import LAT_RANGE, LON_RANGE
+
+def synthetic_points(count: int, towns: List[Tuple[float, float]], rng: random.Random) -> List[Tuple[float, float]]:
+    points = []
+    for _ in range(count):
+        if rng.random() < 0.85:
+            lat, lon = rng.choice(towns)
+            points.append((lat + rng.gauss(0, 0.05), lon + rng.gauss(0, 0.05)))
+        else:
+            points.append((rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)))
+    return points
+
+def simulate(units, incidents, burst: int, batch_size: int, busy_bursts: int) -> None:
+    engine = AssignmentEngine(batch_size=batch_size, fleet_path=None)
+    for unit_id, (lat, lon, capabilities) in enumerate(units):
+        engine.fleet.upsert(f"u{unit_id}", lat, lon, capabilities=capabilities, available=True)
+    location = {}
+    busy = deque()
+    distance = 0.0
+    assigned = 0
+
+    start = time.perf_counter()
+    for offset in range(0, len(incidents), burst):
+        for number, (lat, lon, priority) in enumerate(incidents[offset:offset + burst], start=offset):
+            location[f"i{number}"] = (lat, lon)
+            engine.submit(f"i{number}", lat, lon, priority)
+        finished = []
+        while True:
+            results = engine.assign_pending()
+            finished.extend(results)
+            if len(results) < batch_size:
+                break
+        busy.append(finished)
+        for assignment in finished:
+            distance += assignment.distance_km
+        assigned += len(finished)
+        # Units from a few bursts ago finish and become free where they are
+        if len(busy) > busy_bursts:
+            for assignment in busy.popleft():
+                engine.release(assignment.unit_id, *location.pop(assignment.incident_id))
+    elapsed = time.perf_counter() - start
+
+    label = f"batch size {batch_size}"
+    print(
+        f"{label:<16} assigned: {assigned:7d}  left queued: {engine.pending:6d}  "
+        f"{assigned / elapsed:10.0f} assignments/s  "
+        f"total: {distance:10.0f} km  mean: {distance / max(assigned, 1):6.2f} km"
+    )
+
+def run(unit_count: int, incident_count: int, burst: int, batch_size: int) -> None:
+    rng = random.Random(7)
+    towns = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(25)]
+    units = [
+        (lat, lon, ("als",) if rng.random() < 0.3 else ("bls",))
+        for lat, lon in synthetic_points(unit_count, towns, rng)
+    ]
+    incidents = [
+        (lat, lon, CRITICAL if rng.random() < 0.2 else URGENT)
+        for lat, lon in synthetic_points(incident_count, towns, rng)
+    ]
+    # Keep about half the fleet busy at any time
+    busy_bursts = max(1, unit_count // (2 * burst))
+    print(f"{unit_count} units, {incident_count} incidents in bursts of {burst}")
+    simulate(units, incidents, burst, batch_size, busy_bursts)
+    simulate(units, incidents, burst, 1, busy_bursts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--units", type=int, default=2000)
+    parser.add_argument("--incidents", type=int, default=50000)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    run(args.units, args.incidents, args.burst, args.batch_size)
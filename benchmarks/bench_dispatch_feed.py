@@ -0,0 +1,119 @@
+"""
+Live dispatch feed fan-out
+
+    python -m benchmarks.bench_dispatch_feed [--consoles N] [--stalled FRACTION] [--events N] [--burst N]
+
+Connects N consoles to one DispatchFeed in process, without HTTP, and
+publishes incidents in bursts. Most consoles read as fast as they can. A
+fraction stall for two seconds after every read, as a console on a bad
+link would. It reports:
+
+- publish: time to publish one event to every console
+- delivery: time from publish to receipt, timed on a sample of the
+  consoles that keep up; every console counts what it receives
+- queued: the longest any console's queue grew, which the queue size
+  bounds however long a console stalls
+- catch-ups: how often stalled consoles were replayed from the history
+  or sent a reset
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+from typing import Dict, List
+from app.services.dispatch_feed import DispatchFeed
+from app.utils.metrics import FEED_CATCH_UPS
+
+EVENT_ID_RE = re.compile(rb"^id: \w+-(\d+)$", re.MULTILINE)
+
+def sample_incident(number: int, rng: random.Random) -> Dict:
+    return {
+        "id": f"{number:08x}-0000-4000-8000-000000000000",
+        "user_id": f"user-{rng.randrange(100000)}",
+        "location": "Kireka market on Jinja road",
+        "incident": "road traffic accident",
+        "victim_count": str(rng.randint(1, 5)),
+        "user_reported_status": "bleeding",
+        "latitude": 0.3476 + rng.gauss(0, 0.05),
+        "longitude": 32.6476 + rng.gauss(0, 0.05),
+        "location_source": "device",
+        "created_at": "2026-01-01T12:00:00",
+        "status": "dispatched",
+        "priority": "critical"
+    }
+
+async def console(
+    feed: DispatchFeed, stalled: bool, timed: bool, published: Dict[int, float], latencies: List[float], received: List[int]
+) -> None:
+    async for chunk in feed.stream():
+        now = time.perf_counter()
+        received[0] += chunk.count(b"\nevent: dispatch\n")
+        if stalled:
+            await asyncio.sleep(2.0)
+        elif timed:
+            for sequence in EVENT_ID_RE.findall(chunk):
+                latencies.append(now - published[int(sequence)])
+
+def percentile_ms(values: List[float], fraction: float) -> float:
+    return sorted(values)[int(fraction * (len(values) - 1))] * 1000 if values else float("nan")
+
+async def run(consoles: int, stalled_fraction: float, events: int, burst: int) -> None:
+    feed = DispatchFeed()
+    rng = random.Random(11)
+    published: Dict[int, float] = {}
+    latencies: List[float] = []
+    received = [0]
+    stalled = int(consoles * stalled_fraction)
+    tasks = [
+        asyncio.create_task(console(feed, number < stalled, stalled <= number < stalled + 20, published, latencies, received))
+        for number in range(consoles)
+    ]
+    # Let every console subscribe
+    await asyncio.sleep(0.1)
+
+    publish_times = []
+    deepest = 0
+    payloads = [sample_incident(number, rng) for number in range(events)]
+    started = time.perf_counter()
+    for offset in range(0, events, burst):
+        for payload in payloads[offset:offset + burst]:
+            start = time.perf_counter()
+            event_id = feed.publish("dispatch", payload)
+            publish_times.append(time.perf_counter() - start)
+            published[int(event_id.rsplit("-", 1)[1])] = start
+        deepest = max(deepest, max(len(subscriber.queue) for subscriber in feed._subscribers))
+        # Bursts arrive ten times a second
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(2.5)
+
+    feed.close()
+    await asyncio.gather(*tasks)
+    catch_ups = {
+        sample.labels["outcome"]: sample.value
+        for metric in FEED_CATCH_UPS.collect()
+        for sample in metric.samples if sample.name.endswith("_total")
+    }
+    print(f"{consoles} consoles ({stalled} stalled), {events} events in bursts of {burst} over {elapsed:.1f}s")
+    print(
+        f"publish to all: p50 {percentile_ms(publish_times, 0.5):.3f} ms  p99 {percentile_ms(publish_times, 0.99):.3f} ms  "
+        f"({sum(publish_times) / elapsed * 100:.1f}% of the loop)"
+    )
+    print(
+        f"delivery:       p50 {percentile_ms(latencies, 0.5):.3f} ms  p99 {percentile_ms(latencies, 0.99):.3f} ms  "
+        f"({received[0]} events received, {consoles * events} published to all)"
+    )
+    print(
+        f"deepest queue: {deepest} (limit {feed.queue_size})  "
+        f"catch-ups: {catch_ups.get('replayed', 0):.0f} replayed, {catch_ups.get('reset', 0):.0f} reset"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--consoles", type=int, default=500)
+    parser.add_argument("--stalled", type=float, default=0.1, help="Fraction of consoles that read slowly")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--burst", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.consoles, args.stalled, args.events, args.burst))
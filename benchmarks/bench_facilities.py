@@ -0,0 +1,91 @@
+"""
+Nearby-facility query latency
+
+    python -m benchmarks.bench_facilities [--facilities N] [--queries N]
+
+Builds an index over N synthetic facilities scattered across Uganda and
+times nearby queries from random points: plain, with capability and
+open-now filters, and the widening search used for chat context. Also
+times a full index rebuild, which runs off the event loop on reload.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, List
+from app.services.facility_locator import Facility, FacilityIndex
+
+# Rough bounding box of Uganda
+LAT_RANGE = (-1.5, 4.2)
+LON_RANGE = (29.5, 35.0)
+
+CAPABILITIES = ["emergency", "trauma", "maternity", "icu", "surgery", "neonatal", "pharmacy", "outpatient"]
+TYPES = ["hospital", "clinic", "health_centre"]
+HOURS = ["24/7", "24/7", "08:00-17:00", "07:00-22:00", "20:00-06:00"]
+
+def synthetic_facilities(count: int, rng: random.Random) -> List[Facility]:
+    # Cluster most facilities around a few towns, like real data
+    towns = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(40)]
+    facilities = []
+    for i in range(count):
+        if rng.random() < 0.8:
+            lat, lon = rng.choice(towns)
+            lat, lon = lat + rng.gauss(0, 0.08), lon + rng.gauss(0, 0.08)
+        else:
+            lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        facilities.append(Facility(
+            id=f"f{i}",
+            name=f"Facility {i}",
+            type=rng.choice(TYPES),
+            latitude=lat,
+            longitude=lon,
+            capabilities=tuple(sorted(rng.sample(CAPABILITIES, rng.randint(1, 4)))),
+            hours=rng.choice(HOURS)
+        ))
+    return facilities
+
+def measure(label: str, func: Callable[[], object], queries: int) -> None:
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    mean_us = statistics.fmean(timings) / 1000
+    p50_us = timings[len(timings) // 2] / 1000
+    p99_us = timings[int(len(timings) * 0.99)] / 1000
+    print(f"{label:<40} mean: {mean_us:8.1f} us  p50: {p50_us:8.1f} us  p99: {p99_us:8.1f} us")
+
+def run(count: int, queries: int) -> None:
+    rng = random.Random(1)
+    facilities = synthetic_facilities(count, rng)
+
+    start = time.perf_counter()
+    index = FacilityIndex(facilities)
+    print(f"built index over {len(index)} facilities in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def point():
+        return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+    measure("10 km, nearest 10", lambda: index.query(*point(), radius_km=10, limit=10), queries)
+    measure("50 km, nearest 10", lambda: index.query(*point(), radius_km=50, limit=10), queries)
+    measure(
+        "25 km, emergency+maternity, open now",
+        lambda: index.query(*point(), radius_km=25, limit=10, capabilities=["emergency", "maternity"], open_at_minute=23 * 60),
+        queries
+    )
+
+    def widening():
+        lat, lon = point()
+        radius = 10.0
+        while radius < 200 and len(index.query(lat, lon, radius_km=radius, limit=3)) < 3:
+            radius *= 2
+
+    measure("widening search for 3 (chat context)", widening, queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--facilities", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.facilities, args.queries)
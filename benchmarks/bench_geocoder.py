@@ -0,0 +1,62 @@
+"""
+Free-text location geocoding latency
+
+    python -m benchmarks.bench_geocoder [--places N] [--queries N]
+
+Builds a gazetteer index over N synthetic place names (made-up words, plus
+roads and landmarks named after them). It then times lookups of
+caller-style phrases like "near the Kanomba market on Buseka road", with
+typos, with the LRU cache bypassed, and then through a warm cache.
+"""
+import argparse
+import random
+import time
+from app.services.geocoder import GazetteerIndex, Geocoder, Place
+from benchmarks.bench_facilities import LAT_RANGE, LON_RANGE, measure
+
+SYLLABLES = ["ka", "mu", "na", "ba", "ki", "lu", "ga", "bu", "se", "to", "ya", "wa", "ko", "ma", "ri", "nde", "mbo", "nyo"]
+FEATURES = ["market", "road", "stage", "church", "mosque", "school", "hospital", "petrol station", "primary school"]
+FILLERS = ["near the {}", "opposite {}", "{} area", "at {} junction", "just after {}", "behind the {} on {}"]
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def typo(text: str, rng: random.Random) -> str:
+    position = rng.randrange(len(text))
+    return text[:position] + text[position + 1:]
+
+def run(count: int, queries: int) -> None:
+    rng = random.Random(5)
+    places = []
+    for _ in range(count):
+        base = word(rng).capitalize()
+        name = base if rng.random() < 0.5 else f"{base} {rng.choice(FEATURES)}"
+        places.append(Place(name, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)))
+
+    start = time.perf_counter()
+    index = GazetteerIndex(places)
+    print(f"built index over {len(index)} places in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def phrase() -> str:
+        place = rng.choice(places).name
+        if rng.random() < 0.3:
+            place = typo(place, rng)
+        filler = rng.choice(FILLERS)
+        return filler.format(place, rng.choice(places).name) if filler.count("{}") == 2 else filler.format(place)
+
+    measure("uncached lookup", lambda: index.lookup(phrase()), queries)
+
+    geocoder = Geocoder(path=None)
+    geocoder.index = index
+    geocoder.loaded_mtime = 0.0
+    repeated = [phrase() for _ in range(200)]
+    for text in repeated:
+        geocoder.geocode(text)
+    measure("cached lookup", lambda: geocoder.geocode(rng.choice(repeated)), queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--places", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.places, args.queries)
@@ -0,0 +1,57 @@
+"""
+Per-message cost of the local triage extractor
+
+    python -m benchmarks.bench_triage [--iterations N]
+
+Reports mean and p99 time per message; the extractor runs on every chat
+turn before the LLM call, so it needs to stay well under a millisecond.
+"""
+import argparse
+import statistics
+import time
+from app.services.triage import triage_extractor
+
+MESSAGES = [
+    "help",
+    "I need an ambulance",
+    "hello?",
+    "car crash at Kampala Road, 3 people",
+    "My father collapsed near the Total station on Jinja Road, he is unconscious",
+    "There are two injured people and one is bleeding",
+    "At Plot 12 Acacia Avenue someone was stabbed",
+    "a boda accident opposite Mulago Hospital, a man is not breathing",
+    "I'm alone and having chest pain, please hurry",
+    "We are at the taxi park, my friend is having a seizure and her lips are turning blue. "
+    "There is a lot of traffic and people around, the police are not here yet. Please come quickly.",
+]
+
+def run(iterations: int) -> None:
+    # Warm up the regex engine and caches
+    for message in MESSAGES:
+        triage_extractor.extract(message)
+
+    timings = []
+    for _ in range(iterations):
+        for message in MESSAGES:
+            start = time.perf_counter_ns()
+            triage_extractor.extract(message)
+            timings.append(time.perf_counter_ns() - start)
+
+    timings.sort()
+    mean_us = statistics.fmean(timings) / 1000
+    p50_us = timings[len(timings) // 2] / 1000
+    p99_us = timings[int(len(timings) * 0.99)] / 1000
+    print(f"messages: {len(timings)}")
+    print(f"mean: {mean_us:.1f} us  p50: {p50_us:.1f} us  p99: {p99_us:.1f} us")
+
+    history = [{"role": "user", "content": message} for message in MESSAGES] * 5
+    start = time.perf_counter()
+    for _ in range(iterations):
+        triage_extractor.extract_conversation("how long will it take?", history)
+    per_call_us = (time.perf_counter() - start) / iterations * 1_000_000
+    print(f"extract_conversation over {len(history)} messages: {per_call_us:.1f} us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,245 @@
+"""
+End-to-end load test
+
+    python -m benchmarks.loadtest --spawn --concurrency 50 --users 500
+    python -m benchmarks.loadtest --base-url http://127.0.0.1:8000 --concurrency 20 --duration 60
+
+Each virtual user signs in anonymously, holds a multi-turn chat that ends
+in a dispatch, then lists its emergencies. --spawn starts the OpenAI and
+Supabase stubs and the API as local processes (seeded, so runs repeat);
+otherwise the target at --base-url is driven as-is. Reports throughput
+and p50/p95/p99 per endpoint. Save a run with --output and pass it as
+--baseline to a later run to see the change per endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+import httpx
+
+# Vague opening turns keep the LLM in the loop; the OpenAI stub replies
+# with the dispatch JSON on the third user turn
+CONVERSATION = [
+    "help please",
+    "my father fell down and is not waking up",
+    "we are at the market near the bus park in Wandegeya",
+]
+
+ENDPOINTS = ["auth", "chat", "emergencies"]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.dispatches = 0
+        self.scenarios = 0
+
+    async def call(self, name: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def scenario(client: httpx.AsyncClient, recorder: Recorder) -> None:
+    response = await recorder.call("auth", client.post("/api/v1/auth/anonymous"))
+    if response is None:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    session_id = None
+    for message in CONVERSATION:
+        body = {"message": message}
+        if session_id:
+            body["session_id"] = session_id
+        response = await recorder.call("chat", client.post("/api/v1/chat", json=body, headers=headers))
+        if response is None:
+            return
+        reply = response.json()
+        session_id = reply.get("session_id")
+        if reply.get("dispatch_triggered"):
+            recorder.dispatches += 1
+            break
+
+    await recorder.call("emergencies", client.get("/api/v1/user/emergencies", headers=headers))
+    recorder.scenarios += 1
+
+async def drive(base_url: str, concurrency: int, users: int, duration: Optional[float]) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [users]
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif remaining[0] <= 0:
+                    return
+                else:
+                    remaining[0] -= 1
+                await scenario(client, recorder)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    report = {
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "scenarios": recorder.scenarios,
+        "scenarios_per_second": round(recorder.scenarios / elapsed, 2),
+        "dispatches": recorder.dispatches,
+        "endpoints": {}
+    }
+    for name in ENDPOINTS:
+        ordered = sorted(recorder.latencies[name])
+        report["endpoints"][name] = {
+            "requests": len(ordered),
+            "errors": recorder.errors[name],
+            "rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 1)
+        }
+    return report
+
+def print_report(report: Dict, baseline: Optional[Dict] = None) -> None:
+    print(
+        f"{report['scenarios']} scenarios in {report['elapsed_seconds']}s "
+        f"({report['scenarios_per_second']}/s) at concurrency {report['concurrency']}, "
+        f"{report['dispatches']} dispatches"
+    )
+    print(f"{'endpoint':<12}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<12}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+        )
+        if baseline and name in baseline.get("endpoints", {}):
+            before = baseline["endpoints"][name]
+            changes = []
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before[key]:
+                    changes.append(f"{key} {(stats[key] - before[key]) / before[key] * 100:+.1f}%")
+            print(f"{'':<12}vs baseline: {', '.join(changes)}")
+
+def _wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def spawn(args) -> List[subprocess.Popen]:
+    """Start the stubs and the API; returns the processes to terminate"""
+    python = sys.executable
+    processes = [
+        subprocess.Popen([
+            python, "-m", "benchmarks.stubs.openai_stub", "--port", str(args.openai_port),
+            "--latency-ms", str(args.openai_latency_ms), "--error-rate", str(args.openai_error_rate),
+            "--dispatch-after", str(len(CONVERSATION)), "--seed", str(args.seed)
+        ]),
+        subprocess.Popen([
+            python, "-m", "benchmarks.stubs.supabase_stub", "--port", str(args.supabase_port),
+            "--latency-ms", str(args.supabase_latency_ms), "--error-rate", str(args.supabase_error_rate),
+            "--seed", str(args.seed)
+        ]),
+    ]
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://127.0.0.1:{args.supabase_port}",
+        "SUPABASE_KEY": os.environ.get("SUPABASE_KEY", "stub-service-key"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-stub"),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "loadtest-secret"),
+        "DATA_BACKEND": "supabase",
+        # Every virtual user signs in from 127.0.0.1
+        "ADMISSION_IP_RATE_PER_SECOND": os.environ.get("ADMISSION_IP_RATE_PER_SECOND", "100000"),
+        "ADMISSION_IP_BURST": os.environ.get("ADMISSION_IP_BURST", "100000"),
+        "LOG_LEVEL": "WARNING"
+    }
+    processes.append(subprocess.Popen([
+        python, "-m", "uvicorn", "main:app", "--port", str(args.api_port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"
+    ], env=env))
+
+    try:
+        _wait_until_up(f"http://127.0.0.1:{args.openai_port}/stats")
+        _wait_until_up(f"http://127.0.0.1:{args.supabase_port}/stats")
+        _wait_until_up(f"http://127.0.0.1:{args.api_port}/api/v1/health")
+    except RuntimeError:
+        stop(processes)
+        raise
+    return processes
+
+def stop(processes: List[subprocess.Popen]) -> None:
+    # The API goes first so it can drain queued writes into the stubs
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default=None, help="API to drive (default: the spawned one)")
+    parser.add_argument("--spawn", action="store_true", help="start stubs and the API locally")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200, help="scenarios to run (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes when spawning")
+    parser.add_argument("--api-port", type=int, default=8000)
+    parser.add_argument("--openai-port", type=int, default=8100)
+    parser.add_argument("--supabase-port", type=int, default=8200)
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=20.0)
+    parser.add_argument("--supabase-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    if not args.spawn and not args.base_url:
+        parser.error("pass --spawn or --base-url")
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        base_url = args.base_url or f"http://127.0.0.1:{args.api_port}"
+        report = asyncio.run(drive(base_url, args.concurrency, args.users, args.duration))
+    finally:
+        stop(processes)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+if __name__ == "__main__":
+    main()
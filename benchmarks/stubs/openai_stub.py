@@ -0,0 +1,163 @@
+"""
+Local OpenAI-compatible stub server
+
+Serves POST /v1/chat/completions (plain and streamed) with configurable
+latency, tail latency and error injection, seeded so runs are repeatable.
+Point the API at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 or an
+LLM_BACKENDS entry.
+
+    python -m benchmarks.stubs.openai_stub --port 8100 --latency-ms 300 --slow-rate 0.05 --slow-ms 4000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_REPLY = "I'm getting you help. Stay with me. What is your exact address?"
+
+DISPATCH_REPLY = json.dumps({
+    "confirmation": "Help is on the way. An ambulance has been dispatched to Kampala Road. Please wait for further instructions.",
+    "emergency_details": {
+        "location": "Kampala Road",
+        "incident": "road traffic accident",
+        "victim_count": "3",
+        "user_reported_status": "conscious"
+    },
+    "next_step": "A professional may call you on the number we have on file. Please keep your phone free and unlocked.",
+    "dispatch_triggered": True
+})
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        jitter_ms: float = 50.0,
+        slow_rate: float = 0.0,
+        slow_ms: float = 5000.0,
+        error_rate: float = 0.0,
+        dispatch_after: int = 3,
+        seed: int = 1
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        # Reply with the dispatch JSON once the caller has sent this many messages
+        self.dispatch_after = dispatch_after
+        self.random = random.Random(seed)
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+    app.state.config = config
+    app.state.requests = 0
+
+    def choose_reply(messages: List[Dict]) -> str:
+        user_turns = sum(1 for message in messages if message.get("role") == "user")
+        if config.dispatch_after and user_turns >= config.dispatch_after:
+            return DISPATCH_REPLY
+        return DEFAULT_REPLY
+
+    def delay_seconds() -> float:
+        if config.slow_rate and config.random.random() < config.slow_rate:
+            return config.slow_ms / 1000
+        jitter = config.random.uniform(-config.jitter_ms, config.jitter_ms)
+        return max(0.0, config.latency_ms + jitter) / 1000
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        delay = delay_seconds()
+        fail = config.error_rate and config.random.random() < config.error_rate
+        reply = choose_reply(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if fail:
+            await asyncio.sleep(delay / 2)
+            return JSONResponse(
+                status_code=503,
+                content={"error": {"message": "injected failure", "type": "server_error"}}
+            )
+
+        if body.get("stream"):
+            async def stream():
+                words = reply.split(" ")
+                per_word = delay / max(1, len(words))
+                for index, word in enumerate(words):
+                    await asyncio.sleep(per_word)
+                    piece = word if index == 0 else " " + word
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of calls that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=5000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that return 503")
+    parser.add_argument("--dispatch-after", type=int, default=3, help="user turns before replying with dispatch JSON (0 = never)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        dispatch_after=args.dispatch_after,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
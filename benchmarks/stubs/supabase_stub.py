@@ -0,0 +1,288 @@
+"""
+Local Supabase stand-in (GoTrue auth and PostgREST tables)
+
+Implements the slice of the Supabase HTTP API the app uses, with tables kept
+in memory: anonymous sign-up and token lookup under /auth/v1, and select,
+insert, upsert and update under /rest/v1 with eq/neq/lt/lte/gt/gte/in
+filters, or/and logic trees, order and limit. Latency and error injection
+are seeded so runs are repeatable. Point the API at it with
+SUPABASE_URL=http://127.0.0.1:8200.
+
+    python -m benchmarks.stubs.supabase_stub --port 8200 --latency-ms 20 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 20.0,
+        jitter_ms: float = 5.0,
+        slow_rate: float = 0.0,
+        slow_ms: float = 1000.0,
+        error_rate: float = 0.0,
+        seed: int = 1
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _parse_filter(expression: str) -> Tuple[str, Any]:
+    """Split a PostgREST filter like 'eq.abc' or 'in.(a,b)' into operator and value"""
+    operator, _, value = expression.partition(".")
+    if operator == "in":
+        items = value.strip("()")
+        return operator, {item.strip().strip('"') for item in items.split(",") if item.strip()}
+    return operator, value
+
+def _matches(row: Dict, column: str, operator: str, value: Any) -> bool:
+    current = row.get(column)
+    if operator == "in":
+        return str(current) in value
+    if operator == "is":
+        return current is None if value == "null" else str(current).lower() == value
+    if current is None:
+        return False
+    current = str(current) if not isinstance(current, bool) else str(current).lower()
+    if operator == "eq":
+        return current == value
+    if operator == "neq":
+        return current != value
+    if operator == "lt":
+        return current < value
+    if operator == "lte":
+        return current <= value
+    if operator == "gt":
+        return current > value
+    if operator == "gte":
+        return current >= value
+    raise ValueError(f"unsupported operator: {operator}")
+
+def _split_terms(body: str) -> List[str]:
+    """Split a logic-tree body on top-level commas, respecting parentheses and quotes"""
+    terms, depth, quoted, current = [], 0, False, []
+    for char in body:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            terms.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        terms.append("".join(current))
+    return terms
+
+def _matches_tree(row: Dict, combinator: str, body: str) -> bool:
+    """Evaluate an or=(...)/and=(...) logic tree against a row"""
+    results = []
+    for term in _split_terms(body.strip()[1:-1]):
+        if term.startswith(("or(", "and(")):
+            nested, _, rest = term.partition("(")
+            results.append(_matches_tree(row, nested, "(" + rest))
+            continue
+        column, _, expression = term.partition(".")
+        operator, value = _parse_filter(expression)
+        if isinstance(value, str):
+            value = value.strip('"')
+        results.append(_matches(row, column, operator, value))
+    return any(results) if combinator == "or" else all(results)
+
+def _project(row: Dict, select: Optional[str]) -> Dict:
+    if not select or select == "*":
+        return dict(row)
+    columns = [column.strip() for column in select.split(",")]
+    return {column: row.get(column) for column in columns}
+
+def _order(rows: List[Dict], order: Optional[str]) -> List[Dict]:
+    if not order:
+        return rows
+    # Apply the least significant key first; sorts are stable
+    for term in reversed(order.split(",")):
+        parts = term.split(".")
+        column = parts[0]
+        descending = "desc" in parts[1:]
+        rows = sorted(rows, key=lambda row: (row.get(column) is None, str(row.get(column))), reverse=descending)
+    return rows
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Supabase stub")
+    app.state.config = config
+    app.state.requests = 0
+    tables: Dict[str, List[Dict]] = {}
+    tokens: Dict[str, Dict] = {}
+
+    async def inject() -> Optional[Response]:
+        """Sleep for the configured latency; return an error response if one is due"""
+        app.state.requests += 1
+        if config.slow_rate and config.random.random() < config.slow_rate:
+            delay = config.slow_ms / 1000
+        else:
+            delay = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        fail = config.error_rate and config.random.random() < config.error_rate
+        await asyncio.sleep(delay)
+        if fail:
+            return JSONResponse(status_code=503, content={"message": "injected failure", "code": "503"})
+        return None
+
+    def filtered(table: str, request: Request) -> List[Dict]:
+        rows = tables.setdefault(table, [])
+        for column, expression in request.query_params.multi_items():
+            if column in RESERVED_PARAMS:
+                continue
+            if column in ("or", "and"):
+                rows = [row for row in rows if _matches_tree(row, column, expression)]
+                continue
+            operator, value = _parse_filter(expression)
+            rows = [row for row in rows if _matches(row, column, operator, value)]
+        return rows
+
+    def represent(request: Request, rows: List[Dict], status_code: int) -> Response:
+        if "return=representation" in request.headers.get("prefer", ""):
+            select = request.query_params.get("select")
+            return JSONResponse(status_code=status_code, content=[_project(row, select) for row in rows])
+        return Response(status_code=status_code)
+
+    @app.post("/auth/v1/signup")
+    async def signup(request: Request):
+        error = await inject()
+        if error:
+            return error
+        user = {
+            "id": str(uuid.uuid4()),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "app_metadata": {"provider": "anonymous"},
+            "user_metadata": {},
+            "is_anonymous": True,
+            "created_at": _now()
+        }
+        access_token = uuid.uuid4().hex
+        tokens[access_token] = user
+        return {
+            "access_token": access_token,
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "expires_at": int(time.time()) + 3600,
+            "user": user
+        }
+
+    @app.get("/auth/v1/user")
+    async def get_user(request: Request):
+        error = await inject()
+        if error:
+            return error
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        user = tokens.get(token)
+        if user is None:
+            return JSONResponse(status_code=401, content={"msg": "invalid JWT", "code": 401})
+        return user
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        error = await inject()
+        if error:
+            return error
+        rows = _order(filtered(table, request), request.query_params.get("order"))
+        offset = int(request.query_params.get("offset", 0))
+        limit = request.query_params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit else rows[offset:]
+        select_columns = request.query_params.get("select")
+        return [_project(row, select_columns) for row in rows]
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        error = await inject()
+        if error:
+            return error
+        body = await request.json()
+        incoming = body if isinstance(body, list) else [body]
+        rows = tables.setdefault(table, [])
+        prefer = request.headers.get("prefer", "")
+        upsert = "resolution=merge-duplicates" in prefer
+        ignore_duplicates = "resolution=ignore-duplicates" in prefer
+        conflict_column = request.query_params.get("on_conflict", "id")
+        stored = []
+        for values in incoming:
+            existing = None
+            if (upsert or ignore_duplicates) and values.get(conflict_column) is not None:
+                existing = next(
+                    (row for row in rows if row.get(conflict_column) == values[conflict_column]),
+                    None
+                )
+            if existing is not None:
+                if upsert:
+                    existing.update(values)
+                    stored.append(existing)
+                continue
+            row = {"id": str(uuid.uuid4()), "created_at": _now(), **values}
+            rows.append(row)
+            stored.append(row)
+        return represent(request, stored, 201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        error = await inject()
+        if error:
+            return error
+        values = await request.json()
+        rows = filtered(table, request)
+        for row in rows:
+            row.update(values)
+        return represent(request, rows, 200)
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": app.state.requests,
+            "tables": {name: len(rows) for name, rows in tables.items()}
+        }
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Supabase (GoTrue + PostgREST) stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of calls that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that return 503")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,129 @@
+import asyncio
+import logging
+import signal
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api import api_router
+from app.api.middleware import AdmissionMiddleware, MetricsMiddleware
+from app.api.routes import metrics
+from app.models.repository import repository
+from app.services.activity_tracker import activity_tracker
+from app.services.admission import admission_controller
+from app.services.dispatch_engine import assignment_engine
+from app.services.dispatch_feed import dispatch_feed
+from app.services.facility_locator import facility_locator
+from app.services.geocoder import geocoder
+from app.services.persistence import persistence_scheduler
+from app.services.session_store import session_store
+from app.services.user_provisioning import identity_pool, user_provisioner
+from app.utils.metrics import loop_lag_monitor, mark_process_stopped, record_error
+from app.utils.openai_client import openai_client
+
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+# httpx logs every upstream request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+async def warm_up_connections() -> None:
+    """Open upstream connections before the worker reports ready"""
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                repository.warm_up(settings.warmup_connections),
+                openai_client.warm_up(settings.warmup_connections)
+            ),
+            timeout=settings.warmup_timeout_seconds
+        )
+    except Exception as e:
+        # Not fatal; the first requests open the connections instead
+        record_error(logger, "warmup", "Connection warm-up failed: %r", e)
+
+def close_feed_on_stop_signal() -> None:
+    """
+    End dispatch feed streams as soon as the server is told to stop
+
+    uvicorn waits for open responses before it runs the lifespan shutdown,
+    and feed streams never finish on their own, so without this every stop
+    would sit out the whole graceful timeout. Wraps the handlers uvicorn
+    installed; they still run.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+
+        def handler(received, frame, previous=previous):
+            loop.call_soon_threadsafe(dispatch_feed.close)
+            previous(received, frame)
+
+        signal.signal(signum, handler)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients and pools are created here rather than at import, per worker
+    app.state.lifecycle = "starting"
+    missing = settings.missing_credentials()
+    if missing:
+        raise RuntimeError(f"Missing required settings: {', '.join(missing)}")
+    await openai_client.start()
+    await persistence_scheduler.start()
+    await activity_tracker.start()
+    await user_provisioner.start()
+    if settings.anonymous_auth_mode == "pool":
+        await identity_pool.start()
+    await facility_locator.start()
+    await geocoder.start()
+    await assignment_engine.start()
+    close_feed_on_stop_signal()
+    if settings.metrics_enabled:
+        await loop_lag_monitor.start()
+    if settings.warmup_connections > 0:
+        await warm_up_connections()
+    app.state.lifecycle = "ready"
+    yield
+    app.state.lifecycle = "stopping"
+    await loop_lag_monitor.stop()
+    await assignment_engine.stop()
+    await geocoder.stop()
+    await facility_locator.stop()
+    await identity_pool.stop()
+    # Drain queued writes before the database pool closes
+    await user_provisioner.stop()
+    await persistence_scheduler.stop()
+    await activity_tracker.stop()
+    # Release pooled upstream connections on shutdown
+    await openai_client.aclose()
+    await repository.close()
+    await session_store.close()
+    await admission_controller.close()
+    mark_process_stopped()
 
 app = FastAPI(
     title=settings.project_name,
     version=settings.api_version,
+    lifespan=lifespan,
+    # orjson serializes route results several times faster than the stdlib
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json"
 )
 
+# Admission control sits inside CORS so refusals still carry CORS headers
+# and preflight requests are never shed
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -20,9 +133,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
 
+# Prometheus scrape endpoint
+if settings.metrics_enabled:
+    app.include_router(metrics.router)
+
 @app.get("/")
 async def root():
     return {
@@ -32,6 +152,7 @@ async def root():
     }
 
 if __name__ == "__main__":
+    # Development server with auto-reload; run serve.py in production
     import uvicorn
     uvicorn.run(
         "main:app", 
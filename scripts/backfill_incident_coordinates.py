@@ -0,0 +1,66 @@
+"""
+Geocode stored incidents that have no coordinates
+
+    python -m scripts.backfill_incident_coordinates [--batch-size N] [--concurrency N] [--dry-run]
+
+Walks emergency_incidents without a latitude in id order. Each batch is
+geocoded against GAZETTEER_PATH in one pass (repeated locations are looked
+up once), and the matches are written back with location_source
+"gazetteer". Incidents that still cannot be located are left untouched, so
+the script can be re-run after the gazetteer grows.
+"""
+import argparse
+import asyncio
+import logging
+from app.core.config import settings
+from app.models.repository import repository
+from app.services.geocoder import geocoder
+
+logger = logging.getLogger("backfill")
+
+async def backfill(batch_size: int, concurrency: int, dry_run: bool) -> None:
+    if not settings.gazetteer_path:
+        raise SystemExit("GAZETTEER_PATH is not set")
+    logger.info("Loaded %d gazetteer places", geocoder.load())
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def update(incident_id: str, values: dict) -> bool:
+        async with semaphore:
+            return await repository.update_emergency_incident(incident_id, values)
+
+    scanned = located = 0
+    after_id = None
+    try:
+        while True:
+            rows = await repository.list_unlocated_emergencies(batch_size, after_id)
+            if not rows:
+                break
+            after_id = rows[-1]["id"]
+            scanned += len(rows)
+
+            matches = geocoder.geocode_many([row.get("location") for row in rows])
+            updates = [
+                (row["id"], {"latitude": match.latitude, "longitude": match.longitude, "location_source": "gazetteer"})
+                for row, match in zip(rows, matches)
+                if match is not None
+            ]
+            located += len(updates)
+            if updates and not dry_run:
+                await asyncio.gather(*(update(incident_id, values) for incident_id, values in updates))
+            logger.info("Scanned %d incidents, located %d", scanned, located)
+    finally:
+        await repository.close()
+
+    action = "would locate" if dry_run else "located"
+    logger.info("Done: %s %d of %d incidents without coordinates", action, located, scanned)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent row updates")
+    parser.add_argument("--dry-run", action="store_true", help="Geocode and report without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(backfill(args.batch_size, args.concurrency, args.dry_run))
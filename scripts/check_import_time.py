@@ -0,0 +1,80 @@
+"""
+Fail if importing the app is slow or opens upstream clients
+
+    python -m scripts.check_import_time [--budget-ms N] [--runs N] [--top N]
+
+Imports `main` in fresh interpreters with every credential removed from
+the environment, which also proves the app imports without them. Fails
+if the median cumulative import time exceeds the budget, or if a module
+that should only load during startup (the OpenAI and Supabase SDKs) is
+imported. Prints the slowest modules by their own import time.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Packages only the app lifespan should import
+DEFERRED_MODULES = ("openai", "supabase")
+
+CREDENTIALS = ("JWT_SECRET", "SUPABASE_URL", "SUPABASE_KEY", "OPENAI_API_KEY")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def import_profile() -> Tuple[int, Dict[str, int]]:
+    """Cumulative microseconds to import main, and each module's own time"""
+    env = {name: value for name, value in os.environ.items() if name not in CREDENTIALS}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True, cwd=ROOT
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing main failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    own: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, _, module = match.groups()
+        own[module] = int(self_us)
+        if module == "main":
+            total = int(cumulative_us)
+    return total, own
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Median cumulative import time allowed")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    totals: List[int] = []
+    own: Dict[str, int] = {}
+    for _ in range(args.runs):
+        total, own = import_profile()
+        totals.append(total)
+    median_ms = statistics.median(totals) / 1000
+
+    print(f"import main: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for module, self_us in sorted(own.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {module}")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import time {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    deferred = sorted(module for module in own if module.split(".")[0] in DEFERRED_MODULES)
+    if deferred:
+        failures.append(f"imported at module load instead of startup: {', '.join(deferred[:5])}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
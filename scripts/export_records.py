@@ -0,0 +1,159 @@
+"""
+Export conversations or incidents as NDJSON or Parquet
+
+    python -m scripts.export_records {conversations,incidents} --output PATH
+        [--format ndjson|parquet] [--since ISO] [--until ISO] [--dispatch-only]
+        [--cursor CURSOR | --resume] [--rows-per-file N]
+
+Reads the database a page at a time, oldest first, so memory use does not
+grow with the export. NDJSON goes to one file (or stdout with --output -);
+--resume continues an interrupted export from its last complete line,
+dropping a partly written one. Parquet goes to a directory of part files
+of at most --rows-per-file rows. Each part is renamed into place once
+complete and its end is recorded in the directory's _cursor file, which
+--resume reads. --cursor starts after any row's cursor instead.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Optional
+from app.models.repository import repository
+from app.services.export import (
+    EXPORT_TABLES, ExportQuery, InvalidExportRequest, decode_cursor, encode_cursor, record_exporter, require_pyarrow,
+    utc_timestamp
+)
+
+logger = logging.getLogger("export")
+
+def last_ndjson_cursor(path: str) -> Optional[str]:
+    """Cursor of the last complete line, truncating any partial line after it"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb+") as handle:
+        end = handle.seek(0, os.SEEK_END)
+        # Scan backwards a block at a time; lines are far shorter than the file
+        position, tail = end, b""
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(65536, position)
+            position -= step
+            handle.seek(position)
+            tail = handle.read(step) + tail
+        complete = tail.rfind(b"\n")
+        if complete < 0:
+            handle.truncate(0)
+            return None
+        handle.truncate(position + complete + 1)
+        start = tail.rfind(b"\n", 0, complete) + 1
+        return encode_cursor(json.loads(tail[start:complete]))
+
+def parquet_state(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, "_cursor")) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {"cursor": None, "part": 0}
+
+def save_parquet_state(directory: str, state: dict) -> None:
+    path = os.path.join(directory, "_cursor")
+    with open(path + ".tmp", "w") as handle:
+        json.dump(state, handle)
+    os.replace(path + ".tmp", path)
+
+def build_query(args, cursor: Optional[str], limit: Optional[int] = None) -> ExportQuery:
+    return ExportQuery(
+        args.dataset,
+        since=utc_timestamp(args.since),
+        until=utc_timestamp(args.until),
+        dispatch_only=args.dispatch_only,
+        after=decode_cursor(cursor) if cursor else None,
+        limit=limit
+    )
+
+async def export_ndjson(args) -> None:
+    cursor = args.cursor
+    if args.resume:
+        cursor = last_ndjson_cursor(args.output)
+        logger.info("Resuming after %s", cursor or "the start")
+    query = build_query(args, cursor)
+    to_stdout = args.output == "-"
+    handle = sys.stdout.buffer if to_stdout else open(args.output, "ab" if args.resume else "wb")
+    pages = 0
+    try:
+        async for chunk in record_exporter.ndjson(query):
+            handle.write(chunk)
+            pages += 1
+            if pages % 100 == 0:
+                logger.info("Exported %d rows", query.rows)
+    except BaseException:
+        handle.flush()
+        if query.cursor:
+            logger.error("Export stopped after %d rows; continue with --resume or --cursor %s", query.rows, query.cursor)
+        raise
+    finally:
+        if not to_stdout:
+            handle.close()
+    logger.info("Done: %d rows", query.rows)
+
+async def export_parquet(args) -> None:
+    os.makedirs(args.output, exist_ok=True)
+    state = parquet_state(args.output) if args.resume else {"cursor": args.cursor, "part": 0}
+    if args.resume:
+        logger.info("Resuming at part %d after %s", state["part"], state["cursor"] or "the start")
+    total = 0
+    while True:
+        query = build_query(args, state["cursor"], limit=args.rows_per_file)
+        path = os.path.join(args.output, f"part-{state['part']:05d}.parquet")
+        with open(path + ".tmp", "wb") as handle:
+            async for chunk in record_exporter.parquet(query):
+                handle.write(chunk)
+        if query.rows == 0:
+            os.remove(path + ".tmp")
+            break
+        os.replace(path + ".tmp", path)
+        state = {"cursor": query.cursor, "part": state["part"] + 1}
+        save_parquet_state(args.output, state)
+        total += query.rows
+        logger.info("Wrote %s (%d rows)", path, query.rows)
+        if query.rows < args.rows_per_file:
+            break
+    logger.info("Done: %d rows", total)
+
+async def export(args) -> None:
+    try:
+        if args.format == "parquet":
+            await export_parquet(args)
+        else:
+            await export_ndjson(args)
+    finally:
+        await repository.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("dataset", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--output", required=True, help="NDJSON file (- for stdout) or Parquet directory")
+    parser.add_argument("--format", choices=("ndjson", "parquet"), default="ndjson")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only rows created at or after this time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only rows created before this time")
+    parser.add_argument("--dispatch-only", action="store_true", help="Only conversation turns that triggered a dispatch")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--cursor", help="Start after the row this cursor was built from")
+    start.add_argument("--resume", action="store_true", help="Continue an interrupted export into --output")
+    parser.add_argument("--rows-per-file", type=int, default=1_000_000, help="Rows per Parquet part file")
+    args = parser.parse_args()
+    if args.resume and args.output == "-":
+        parser.error("--resume needs an --output file")
+    if args.format == "parquet":
+        try:
+            require_pyarrow()
+        except RuntimeError as e:
+            parser.error(str(e))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        asyncio.run(export(args))
+    except InvalidExportRequest as e:
+        parser.error(str(e))
@@ -0,0 +1,93 @@
+"""
+Production server
+
+    python serve.py [--workers N] [--host HOST] [--port PORT]
+
+Runs uvicorn without auto-reload, on uvloop and httptools, with one worker
+process per CPU core available to it unless SERVER_WORKERS says otherwise.
+Each worker is a fresh interpreter that runs the app lifespan on its own,
+so every worker opens its own database and OpenAI connection pools and
+starts its own background writers. Ambulance assignment keeps the fleet
+in process memory, so with FLEET_PATH set a single worker is started.
+
+On SIGTERM uvicorn stops accepting connections and gives in-flight
+requests, streamed chats included, SERVER_GRACEFUL_TIMEOUT_SECONDS to
+finish; dispatch feed streams are ended at once, and consoles reconnect
+elsewhere. Each worker's lifespan shutdown then writes its queued incidents
+within SHUTDOWN_DRAIN_TIMEOUT_SECONDS, spooling any it could not write for
+the next start, and flushes its conversation log. Give the orchestrator a
+termination grace period longer than the two combined.
+"""
+import argparse
+import glob
+import logging
+import os
+import uvicorn
+from app.core.config import settings
+
+logger = logging.getLogger("serve")
+
+def available_cores() -> int:
+    """CPU cores this process may run on, which respects container CPU sets"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def prepare_metrics_dir(workers: int) -> None:
+    """Clear multiprocess metric files left by a previous run"""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        if workers > 1 and settings.metrics_enabled:
+            logger.warning("PROMETHEUS_MULTIPROC_DIR is not set; /metrics will only show the worker that serves it")
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+def limit_workers(workers: int) -> int:
+    """One worker while assigning from FLEET_PATH, since each would dispatch the same units"""
+    if workers > 1 and settings.fleet_path:
+        logger.error(
+            "FLEET_PATH is set and every worker would assign the same units on its own; "
+            "starting 1 worker instead of %d", workers
+        )
+        return 1
+    return workers
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument(
+        "--workers", type=int, default=settings.server_workers,
+        help="Worker processes; 0 runs one per available CPU core"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    workers = limit_workers(args.workers or available_cores())
+    prepare_metrics_dir(workers)
+    logger.info("Starting %d workers on %s:%d", workers, args.host, args.port)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        backlog=settings.server_backlog,
+        timeout_keep_alive=settings.server_keepalive_seconds,
+        timeout_graceful_shutdown=settings.server_graceful_timeout_seconds,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.server_forwarded_allow_ips,
+        # Per-request log lines cost more than they tell at production rates;
+        # latency per route is in /metrics
+        access_log=False,
+        server_header=False,
+        log_level=settings.log_level.lower()
+    )
+
+if __name__ == "__main__":
+    main()
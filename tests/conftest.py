@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+# Settings are read when app modules are first imported, so the test
+# environment is set up before any of them are
+os.environ.setdefault("DATA_BACKEND", "memory")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+_spool_dir = tempfile.mkdtemp(prefix="medilocator-tests-")
+os.environ.setdefault("EMERGENCY_SPOOL_PATH", os.path.join(_spool_dir, "emergency_spool.jsonl"))
+os.environ.setdefault("CONVERSATION_LOG_SPOOL_PATH", os.path.join(_spool_dir, "conversation_spool.jsonl"))
+
+import pytest
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def api():
+    """A test client for the app, signed in as user-1; the lifespan is not run"""
+    from fastapi.testclient import TestClient
+    from app.api.dependencies import get_current_user
+    from main import app
+    app.dependency_overrides[get_current_user] = lambda: {"id": "user-1"}
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def use_llm(monkeypatch):
+    """Answer the chat service's LLM calls with handler(request)"""
+    from app.services import chat_service
+    from app.services.response_cache import response_cache
+    from tests.llm import backend, client
+    response_cache.clear()
+
+    def install(handler):
+        monkeypatch.setattr(chat_service, "openai_client", client(backend(handler)))
+
+    return install
@@ -0,0 +1,44 @@
+"""Fake OpenAI-compatible backends served by httpx.MockTransport"""
+import json
+from typing import Callable, Iterable
+import httpx
+from app.utils.openai_client import LLMBackend, OpenAIClient
+
+def completion(content: str) -> httpx.Response:
+    return httpx.Response(200, json={
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]
+    })
+
+def stream(deltas: Iterable[str]) -> httpx.Response:
+    events = [
+        "data: " + json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "test-model",
+            "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+        }) + "\n\n"
+        for delta in deltas
+    ]
+    events.append("data: [DONE]\n\n")
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content="".join(events).encode())
+
+def backend(handler: Callable, name: str = "primary") -> LLMBackend:
+    """An LLMBackend whose HTTP calls are answered by handler(request)"""
+    return LLMBackend(
+        name=name,
+        model="test-model",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        api_key="sk-test",
+        base_url=f"http://{name}.test/v1"
+    )
+
+def client(*backends: LLMBackend, max_concurrency: int = 8) -> OpenAIClient:
+    llm = OpenAIClient()
+    llm._backends = list(backends)
+    llm.max_concurrency = max_concurrency
+    return llm
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.api.middleware import AdmissionMiddleware
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.services import chat_service
+from app.services.admission import (
+    BACKGROUND, CONVERSATION, EMERGENCY, EXEMPT, AdmissionBackend, AdmissionController, InMemoryAdmissionBackend
+)
+from app.services.chat_service import ChatService
+from tests.llm import completion, stream
+
+pytestmark = pytest.mark.anyio
+
+REPORT = "Car crash at Kampala Road, 3 people, one is bleeding"
+
+def controller(max_concurrency: int = 10) -> AdmissionController:
+    return AdmissionController(InMemoryAdmissionBackend(max_keys=100), max_concurrency=max_concurrency)
+
+def test_incomplete_backend_fails_when_created():
+    class PartialBackend(AdmissionBackend):
+        async def take(self, key, rate, burst):
+            return True
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialBackend()
+
+async def test_bucket_refuses_past_its_burst_and_refills():
+    backend = InMemoryAdmissionBackend(max_keys=100)
+    assert [await backend.take("k", 50.0, 2) for _ in range(3)] == [True, True, False]
+    await asyncio.sleep(0.05)
+    assert await backend.take("k", 50.0, 2)
+
+async def test_requests_are_classified_by_route_and_caller():
+    admission = controller()
+    token = create_access_token({"sub": "u1"})
+    assert await admission.classify("/api/v1/health", None, "1.2.3.4") == (EXEMPT, "")
+    assert await admission.classify("/api/v1/auth/anonymous", None, "1.2.3.4") == (BACKGROUND, "ip:1.2.3.4")
+    assert await admission.classify("/api/v1/chat", "not-a-token", "1.2.3.4") == (CONVERSATION, "ip:1.2.3.4")
+    assert await admission.classify("/api/v1/chat", token, "1.2.3.4") == (CONVERSATION, "user:u1")
+    await admission.mark_emergency("u1")
+    assert await admission.classify("/api/v1/chat", token, "1.2.3.4") == (EMERGENCY, "emergency:u1")
+    # Only chat is promoted
+    assert await admission.classify("/api/v1/user/emergencies", token, "1.2.3.4") == (BACKGROUND, "user:u1")
+
+async def test_emergency_callers_have_their_own_bounded_bucket(monkeypatch):
+    monkeypatch.setattr(settings, "admission_user_burst", 1)
+    monkeypatch.setattr(settings, "admission_user_rate_per_second", 0.001)
+    monkeypatch.setattr(settings, "admission_emergency_burst", 3)
+    monkeypatch.setattr(settings, "admission_emergency_rate_per_second", 0.001)
+    admission = controller()
+    assert await admission.allow_rate(CONVERSATION, "user:u1")
+    assert not await admission.allow_rate(CONVERSATION, "user:u1")
+    # A spent user bucket does not hold back a marked caller, but their own one runs out too
+    assert [await admission.allow_rate(EMERGENCY, "emergency:u1") for _ in range(4)] == [True, True, True, False]
+
+def test_emergency_is_capped_at_the_worker_limit_with_a_reserve_above_conversations():
+    admission = controller(max_concurrency=10)
+    assert admission.limits == {EMERGENCY: 10, CONVERSATION: 9, BACKGROUND: 6}
+    assert all(admission.try_acquire(CONVERSATION) for _ in range(9))
+    assert not admission.try_acquire(CONVERSATION)
+    assert admission.try_acquire(EMERGENCY)
+    assert not admission.try_acquire(EMERGENCY)
+    admission.release()
+    assert admission.in_flight == 9
+
+async def test_middleware_answers_refused_requests_without_calling_the_app(monkeypatch):
+    monkeypatch.setattr(settings, "admission_ip_burst", 1)
+    monkeypatch.setattr(settings, "admission_ip_rate_per_second", 0.001)
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    admission = controller(max_concurrency=10)
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(app, controller=admission))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/api/v1/facilities/nearby")).status_code == 200
+        refused = await client.get("/api/v1/facilities/nearby")
+        assert (refused.status_code, refused.headers["retry-after"]) == (429, "1")
+        assert (await client.get("/api/v1/health")).status_code == 200
+
+        admission.in_flight = 6
+        token = create_access_token({"sub": "u1"})
+        shed = await client.get("/api/v1/user/emergencies", headers={"Authorization": f"Bearer {token}"})
+        assert shed.status_code == 503
+    assert calls == ["/api/v1/facilities/nearby", "/api/v1/health"]
+    assert admission.in_flight == 6
+
+def test_client_ip_comes_from_the_peer_not_the_forwarded_header():
+    scope = {
+        "headers": [(b"x-forwarded-for", b"198.51.100.7, 10.0.0.2"), (b"authorization", b"Bearer abc")],
+        "client": ("203.0.113.5", 443)
+    }
+    # A rotated X-Forwarded-For must not open a fresh per-IP bucket
+    assert AdmissionMiddleware._identity(scope) == ("abc", "203.0.113.5")
+    assert AdmissionMiddleware._identity({"headers": []}) == (None, "unknown")
+
+@pytest.fixture
+def admission(monkeypatch):
+    admission = controller()
+    monkeypatch.setattr(chat_service, "admission_controller", admission)
+    return admission
+
+async def test_keywords_alone_do_not_mark_a_caller(use_llm, admission):
+    use_llm(lambda request: completion("Can you tell me more?"))
+    await ChatService.process_chat_message("there was an accident", [], user_id="u1")
+    await ChatService.process_chat_message("I heard a car crash sound near Garden City Mall, 2 men", [], user_id="u1")
+    assert not await admission.backend.is_emergency("u1")
+
+async def test_complete_report_marks_the_caller(use_llm, admission):
+    use_llm(lambda request: completion("How badly are they bleeding?"))
+    await ChatService.process_chat_message(REPORT, [], user_id="u1")
+    assert await admission.backend.is_emergency("u1")
+
+async def test_dispatch_marks_the_caller(use_llm, admission):
+    dispatch = {
+        "confirmation": "Help is on the way.",
+        "emergency_details": {"location": "Kireka", "incident": "fall", "victim_count": "1", "user_reported_status": "conscious"},
+        "dispatch_triggered": True
+    }
+    use_llm(lambda request: stream([json.dumps(dispatch)]))
+    events = [event async for event, _ in ChatService.stream_chat_message("please send help", [], user_id="u2")]
+    assert events[-1] == "done"
+    assert await admission.backend.is_emergency("u2")
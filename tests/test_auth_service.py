@@ -0,0 +1,74 @@
+import pytest
+from app.core.security import create_access_token
+from app.models.repository import InMemoryRepository
+from app.services.activity_tracker import ActivityTracker
+from app.services.auth_service import AuthService
+from app.services.user_provisioning import UserProvisioner
+
+pytestmark = pytest.mark.anyio
+
+class CountingRepository(InMemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.user_reads = 0
+        self.touches = []
+        self.fail_touches = False
+
+    async def get_anonymous_user(self, user_id):
+        self.user_reads += 1
+        return await super().get_anonymous_user(user_id)
+
+    async def touch_anonymous_users(self, user_ids, last_activity):
+        if self.fail_touches:
+            raise ConnectionError("database unavailable")
+        self.touches.append(sorted(user_ids))
+        await super().touch_anonymous_users(user_ids, last_activity)
+
+@pytest.fixture
+def repo():
+    return CountingRepository()
+
+def service(repo, mode="supabase"):
+    return AuthService(
+        repo=repo,
+        tracker=ActivityTracker(repo=repo),
+        provisioner=UserProvisioner(repo=repo),
+        mode=mode
+    )
+
+async def test_verified_users_are_cached(repo):
+    await repo.upsert_anonymous_user({"id": "u1", "is_active": True})
+    auth = service(repo)
+    token = create_access_token({"sub": "u1"})
+    assert (await auth.get_current_user(token))["id"] == "u1"
+    assert (await auth.get_current_user(token))["id"] == "u1"
+    assert repo.user_reads == 1
+
+async def test_deactivated_user_is_refused_straight_away(repo):
+    await repo.upsert_anonymous_user({"id": "u1", "is_active": True})
+    auth = service(repo)
+    token = create_access_token({"sub": "u1"})
+    assert await auth.get_current_user(token) is not None
+    assert await auth.deactivate_user("u1")
+    assert await auth.get_current_user(token) is None
+
+async def test_unknown_user_is_refused_in_supabase_mode(repo):
+    assert await service(repo).get_current_user(create_access_token({"sub": "ghost"})) is None
+
+async def test_activity_writes_coalesce_into_one_bulk_update(repo):
+    auth = service(repo)
+    for user_id in ("u1", "u2", "u1", "u1"):
+        await repo.upsert_anonymous_user({"id": user_id, "is_active": True})
+        await auth.get_current_user(create_access_token({"sub": user_id}))
+    await auth.activity_tracker.flush()
+    assert repo.touches == [["u1", "u2"]]
+
+async def test_failed_activity_writes_are_retried(repo):
+    tracker = ActivityTracker(repo=repo)
+    tracker.touch("u1")
+    repo.fail_touches = True
+    await tracker.flush()
+    assert tracker.depth == 1
+    repo.fail_touches = False
+    await tracker.flush()
+    assert tracker.depth == 0 and repo.touches == [["u1"]]
@@ -0,0 +1,63 @@
+import json
+import httpx
+import pytest
+from benchmarks.loadtest import percentile
+from benchmarks.stubs import openai_stub, supabase_stub
+from app.utils.openai_client import LLMBackend
+
+pytestmark = pytest.mark.anyio
+
+def stub_backend(**config) -> LLMBackend:
+    app = openai_stub.create_app(openai_stub.StubConfig(latency_ms=0, jitter_ms=0, **config))
+    return LLMBackend(
+        name="stub",
+        model="stub",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+        api_key="sk-test",
+        base_url="http://openai.stub/v1"
+    )
+
+def turns(count):
+    return [{"role": "user", "content": f"turn {number}"} for number in range(count)]
+
+async def test_openai_stub_dispatches_on_the_third_user_turn():
+    backend = stub_backend()
+    assert await backend.complete(turns(1), timeout=5) == openai_stub.DEFAULT_REPLY
+    assert json.loads(await backend.complete(turns(3), timeout=5))["dispatch_triggered"] is True
+
+async def test_openai_stub_streams_word_by_word():
+    from app.utils.openai_client import OpenAIClient
+    deltas = [delta async for delta in OpenAIClient._stream_backend(stub_backend(), turns(1), timeout=5)]
+    assert len(deltas) > 1
+    assert "".join(deltas) == openai_stub.DEFAULT_REPLY
+
+async def test_openai_stub_injects_errors():
+    backend = stub_backend(error_rate=1.0)
+    with pytest.raises(Exception):
+        await backend.complete(turns(1), timeout=5)
+    assert backend.breaker.consecutive_failures == 1
+
+async def test_supabase_stub_applies_keyset_logic_trees():
+    app = supabase_stub.create_app(supabase_stub.StubConfig(latency_ms=0, jitter_ms=0))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://supabase.stub") as client:
+        rows = [{"id": f"i{number}", "user_id": "u1", "created_at": f"2026-01-0{number // 2 + 1}"} for number in range(6)]
+        await client.post("/rest/v1/emergency_incidents", json=rows)
+        # Inserting an existing id again is skipped, as the app's upserts expect
+        await client.post(
+            "/rest/v1/emergency_incidents?on_conflict=id",
+            json=rows[0] | {"user_id": "u2"},
+            headers={"prefer": "resolution=ignore-duplicates"}
+        )
+        response = await client.get("/rest/v1/emergency_incidents", params={
+            "select": "id",
+            "user_id": "eq.u1",
+            "or": '(created_at.lt."2026-01-02",and(created_at.eq."2026-01-02",id.lt."i3"))',
+            "order": "created_at.desc,id.desc",
+            "limit": "10"
+        })
+    assert [row["id"] for row in response.json()] == ["i2", "i1", "i0"]
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 3.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.99) == 4.0
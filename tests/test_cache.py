@@ -0,0 +1,26 @@
+import time
+from app.utils.cache import TTLCache
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=5.0)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    now[0] += 6
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60.0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+def test_zero_size_cache_stores_nothing():
+    cache = TTLCache(maxsize=0, ttl=60.0)
+    cache.set("a", 1)
+    assert len(cache) == 0
@@ -0,0 +1,69 @@
+import json
+from app.api.routes import chat
+from tests.llm import completion, stream
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream_endpoint_sends_tokens_and_a_final_response(api, use_llm):
+    use_llm(lambda request: stream(["Where ", "are you?"]))
+    response = api.post("/api/v1/chat/stream", json={"message": "hello there"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    assert events[:2] == [("token", {"text": "Where "}), ("token", {"text": "are you?"})]
+    event, final = events[-1]
+    assert event == "done"
+    assert final["reply"] == "Where are you?"
+    assert final["session_id"]
+
+def test_stream_endpoint_completes_after_a_malformed_dispatch(api, use_llm):
+    malformed = json.dumps({"confirmation": "Help is coming", "emergency_details": None, "dispatch_triggered": True})
+    use_llm(lambda request: stream([malformed]))
+    events = sse_events(api.post("/api/v1/chat/stream", json={"message": "help me"}).text)
+    assert [event for event, _ in events] == ["token", "done"]
+    assert not events[-1][1]["dispatch_triggered"]
+
+def test_requests_without_a_session_id_share_the_users_session(api, use_llm):
+    use_llm(lambda request: completion("Where are you?"))
+    first = api.post("/api/v1/chat", json={"message": "I need help now"}).json()
+    second = api.post("/api/v1/chat", json={"message": "I need help please"}).json()
+    assert first["session_id"] == second["session_id"]
+
+def test_a_known_session_id_continues_the_conversation(api, use_llm):
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content)["messages"])
+        return completion("What happened?")
+
+    use_llm(handler)
+    session_id = api.post("/api/v1/chat", json={"message": "I am at Kireka market"}).json()["session_id"]
+    api.post("/api/v1/chat", json={"message": "someone fainted", "session_id": session_id})
+    contents = [message["content"] for message in seen[-1]]
+    assert "I am at Kireka market" in contents and "What happened?" in contents
+
+def test_the_incident_is_logged_before_the_session_is_saved(api, use_llm, monkeypatch):
+    dispatch = {
+        "confirmation": "Help is on the way.",
+        "emergency_details": {"location": "Kireka", "incident": "fall", "victim_count": "1", "user_reported_status": "conscious"},
+        "dispatch_triggered": True
+    }
+    use_llm(lambda request: completion(json.dumps(dispatch)))
+    calls = []
+
+    async def log_emergency(details, user_id, coordinates=None):
+        calls.append("incident")
+
+    async def append(session_id, user_id, messages):
+        calls.append("session")
+
+    monkeypatch.setattr(chat.emergency_service, "log_emergency", log_emergency)
+    monkeypatch.setattr(chat.session_store, "append", append)
+    response = api.post("/api/v1/chat", json={"message": "My neighbour fell at Kireka, one person, conscious"})
+    assert response.json()["dispatch_triggered"]
+    assert calls == ["incident", "session"]
@@ -0,0 +1,164 @@
+import json
+import httpx
+import pytest
+from app.core.config import settings
+from app.services.chat_service import DISPATCH_CONFIRMATION_PREFIX, FALLBACK_REPLY, ChatService, DispatchStreamParser
+from tests.llm import completion, stream
+
+pytestmark = pytest.mark.anyio
+
+DISPATCH = {
+    "confirmation": "Help is on the way. An ambulance has been dispatched to Kireka market.",
+    "emergency_details": {
+        "location": "Kireka market",
+        "incident": "road accident",
+        "victim_count": "2",
+        "user_reported_status": "bleeding"
+    },
+    "dispatch_triggered": True
+}
+
+def unreachable(request):
+    raise httpx.ConnectError("connection refused")
+
+async def collect(events):
+    return [event async for event in events]
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.finish()
+
+def test_parser_forwards_text_and_detects_dispatch_split_across_chunks():
+    text = json.dumps(DISPATCH)
+    parser = DispatchStreamParser()
+    events = feed_all(parser, ["Stay calm. ", text[:15], text[15:40], text[40:]])
+    assert events[0] == ("token", "Stay calm. ")
+    assert events[1] == ("dispatch", DISPATCH)
+    assert parser.dispatch == DISPATCH
+    assert parser.text == "Stay calm. "
+
+def test_parser_ignores_braces_inside_strings():
+    payload = dict(DISPATCH, confirmation='Help is on the way {to "the} market"')
+    parser = DispatchStreamParser()
+    events = feed_all(parser, [json.dumps(payload)])
+    assert events == [("dispatch", payload)]
+
+def test_parser_releases_other_objects_as_text():
+    parser = DispatchStreamParser()
+    events = feed_all(parser, ['Use {"a": 1} ', "then wait"])
+    assert "".join(payload for _, payload in events) == 'Use {"a": 1} then wait'
+    assert parser.dispatch is None
+
+def test_parser_flushes_an_unclosed_object_at_the_end():
+    parser = DispatchStreamParser()
+    events = feed_all(parser, ["Wait ", '{"emergency_details": '])
+    assert [event for event, _ in events] == ["token", "token"]
+    assert parser.text == 'Wait {"emergency_details": '
+
+async def test_stream_yields_tokens_then_done(use_llm):
+    use_llm(lambda request: stream(["Where ", "are you?"]))
+    events = await collect(ChatService.stream_chat_message("hello", [{"role": "user", "content": "hi"}]))
+    assert events[:2] == [("token", "Where "), ("token", "are you?")]
+    event, response = events[-1]
+    assert event == "done"
+    assert response.reply == "Where are you?"
+    assert response.requires_location
+    assert not response.dispatch_triggered
+
+async def test_stream_sends_dispatch_before_done(use_llm):
+    text = json.dumps(DISPATCH)
+    use_llm(lambda request: stream([text[:30], text[30:]]))
+    events = await collect(ChatService.stream_chat_message("hello", [{"role": "user", "content": "hi"}]))
+    assert [event for event, _ in events] == ["dispatch", "done"]
+    assert events[0][1].dispatch_triggered
+    assert events[1][1].emergency_details["location"] == "Kireka market"
+
+async def test_stream_falls_back_when_the_llm_fails_before_any_text(use_llm):
+    use_llm(unreachable)
+    events = await collect(ChatService.stream_chat_message("hello", [{"role": "user", "content": "hi"}]))
+    assert events[0] == ("token", FALLBACK_REPLY)
+    assert events[-1][0] == "done"
+    assert events[-1][1].reply == FALLBACK_REPLY
+
+async def test_llm_failures_are_logged(use_llm, caplog):
+    use_llm(unreachable)
+    response = await ChatService.process_chat_message("hello", [{"role": "user", "content": "hi"}])
+    assert response.reply == FALLBACK_REPLY
+    await collect(ChatService.stream_chat_message("hello", [{"role": "user", "content": "hi"}]))
+    errors = [record for record in caplog.records if record.name == "app.services.chat_service"]
+    assert [record.getMessage().startswith("Error processing chat: ") for record in errors] == [True, True]
+
+MALFORMED_DISPATCH = json.dumps({"confirmation": "Help is coming", "emergency_details": None, "dispatch_triggered": True})
+
+async def test_stream_falls_back_on_a_malformed_dispatch(use_llm):
+    use_llm(lambda request: stream(["Stay calm. ", MALFORMED_DISPATCH[:20], MALFORMED_DISPATCH[20:]]))
+    events = await collect(ChatService.stream_chat_message("hello", [{"role": "user", "content": "hi"}]))
+    assert [event for event, _ in events] == ["token", "token", "done"]
+    assert events[1] == ("token", FALLBACK_REPLY)
+    assert events[-1][1].reply == FALLBACK_REPLY
+    assert not events[-1][1].dispatch_triggered
+
+@pytest.mark.parametrize("reply", [
+    MALFORMED_DISPATCH,
+    json.dumps({"confirmation": ["not", "text"], "emergency_details": {"location": "Kireka"}}),
+    json.dumps({"note": {"emergency_details": {}}}),
+])
+async def test_malformed_dispatch_reply_falls_back(use_llm, reply):
+    use_llm(lambda request: completion(reply))
+    response = await ChatService.process_chat_message("hello", [{"role": "user", "content": "hi"}])
+    assert response.reply == FALLBACK_REPLY
+    assert not response.dispatch_triggered
+
+REPORT = "Car crash at Kampala Road, 3 people, one is bleeding"
+
+def recording(reply):
+    """Handler answering every call with reply, keeping the prompts it was sent"""
+    prompts = []
+
+    def handler(request):
+        prompts.append(json.loads(request.content)["messages"])
+        return completion(reply)
+
+    handler.prompts = prompts
+    return handler
+
+async def test_triage_only_prefills_details_by_default(use_llm):
+    handler = recording("How many are injured badly?")
+    use_llm(handler)
+    response = await ChatService.process_chat_message(REPORT, [])
+    assert not response.dispatch_triggered
+    notes = [message["content"] for message in handler.prompts[0] if message["role"] == "system"]
+    assert any("location=Kampala Road" in note for note in notes)
+
+async def test_auto_dispatch_skips_the_llm_for_a_plain_report(use_llm, monkeypatch):
+    monkeypatch.setattr(settings, "triage_auto_dispatch", True)
+    use_llm(unreachable)
+    response = await ChatService.process_chat_message(REPORT, [])
+    assert response.dispatch_triggered
+    assert response.emergency_details["location"] == "Kampala Road"
+    assert response.reply.startswith(DISPATCH_CONFIRMATION_PREFIX)
+
+@pytest.mark.parametrize("message", [
+    "I need a ride to the Fire Station at Kampala Road for my two kids",
+    "I heard a car crash sound near Garden City Mall, 2 men",
+    "There is no fire at Acacia Mall, 2 people are asking",
+])
+async def test_auto_dispatch_leaves_ordinary_messages_to_the_llm(use_llm, monkeypatch, message):
+    monkeypatch.setattr(settings, "triage_auto_dispatch", True)
+    handler = recording("Can you tell me more?")
+    use_llm(handler)
+    response = await ChatService.process_chat_message(message, [])
+    assert not response.dispatch_triggered
+    assert len(handler.prompts) == 1
+
+async def test_auto_dispatch_happens_once_per_conversation(use_llm, monkeypatch):
+    monkeypatch.setattr(settings, "triage_auto_dispatch", True)
+    use_llm(recording("An ambulance is already coming."))
+    history = [
+        {"role": "user", "content": REPORT},
+        {"role": "assistant", "content": f"{DISPATCH_CONFIRMATION_PREFIX}. An ambulance has been dispatched."},
+    ]
+    response = await ChatService.process_chat_message("another car crashed at Kampala Road, 2 people", history)
+    assert not response.dispatch_triggered
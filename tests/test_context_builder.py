@@ -0,0 +1,41 @@
+from app.services.context_builder import ContextBuilder, count_tokens, format_location, message_tokens
+
+SYSTEM = "You are Medilocator."
+
+def history(turns):
+    messages = []
+    for number in range(turns):
+        messages.append({"role": "user", "content": f"caller statement {number} " + "detail " * 20})
+        messages.append({"role": "assistant", "content": f"reply {number} " + "question " * 20})
+    return messages
+
+def prompt_tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+def test_short_conversation_is_sent_whole():
+    builder = ContextBuilder(budget_tokens=1500, min_recent_messages=6, summary_max_tokens=200)
+    conversation = history(2)
+    messages = builder.build(SYSTEM, conversation, "help")
+    assert messages == [{"role": "system", "content": SYSTEM}] + conversation + [{"role": "user", "content": "help"}]
+
+def test_long_conversation_stays_within_budget_and_keeps_the_opening_statement():
+    builder = ContextBuilder(budget_tokens=600, min_recent_messages=4, summary_max_tokens=100)
+    conversation = history(60)
+    messages = builder.build(SYSTEM, conversation, "they stopped breathing")
+    assert prompt_tokens(messages) <= 600
+    summary = messages[1]["content"]
+    assert summary.startswith("Earlier in this conversation the caller said: caller statement 0")
+    assert messages[-5:-1] == conversation[-4:]
+    assert messages[-1]["content"] == "they stopped breathing"
+
+def test_most_recent_turns_are_kept_even_over_budget():
+    builder = ContextBuilder(budget_tokens=50, min_recent_messages=4, summary_max_tokens=20)
+    conversation = history(10)
+    messages = builder.build(SYSTEM, conversation, "help")
+    assert messages[-5:-1] == conversation[-4:]
+
+def test_location_is_rendered_compactly():
+    assert format_location({"latitude": 0.3476123456, "longitude": 32.58, "address": "", "extra": {"a": 1}}) == (
+        "latitude=0.34761, longitude=32.58"
+    )
+    assert count_tokens("") == 0
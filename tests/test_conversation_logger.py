@@ -0,0 +1,99 @@
+import asyncio
+import os
+import pytest
+from app.models.repository import InMemoryRepository
+from app.services.conversation_logger import ConversationLogWriter
+
+pytestmark = pytest.mark.anyio
+
+class FlakyRepository(InMemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+        self.batches = []
+
+    async def insert_conversation_messages(self, rows):
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        self.batches.append(len(rows))
+        return await super().insert_conversation_messages(rows)
+
+def rows(count, start=0):
+    return [{"user_id": "u1", "user_message": f"m{number}"} for number in range(start, start + count)]
+
+@pytest.fixture
+def repo():
+    return FlakyRepository()
+
+@pytest.fixture
+def writer(repo, tmp_path):
+    return ConversationLogWriter(repo=repo, batch_size=100, max_queue=500, spool_path=str(tmp_path / "spool.jsonl"))
+
+async def test_queued_rows_are_written_in_batches(repo, writer):
+    for row in rows(250):
+        writer.enqueue(row)
+    await writer.flush()
+    assert repo.batches == [100, 100, 50]
+    assert writer.rows_written == 250 and writer.depth == 0
+
+async def test_failed_writes_are_spooled_and_replayed(repo, writer):
+    repo.failing = True
+    for row in rows(150):
+        writer.enqueue(row)
+    await writer.flush()
+    assert writer.rows_spooled == 150
+    assert repo.tables["conversation_messages"] == []
+
+    repo.failing = False
+    writer._replay_not_before = 0.0
+    await writer._replay_spool()
+    assert [row["user_message"] for row in repo.tables["conversation_messages"]] == [f"m{n}" for n in range(150)]
+    assert not os.path.exists(writer.spool_path) and not os.path.exists(writer.spool_path + ".replay")
+
+async def test_rows_beyond_the_queue_limit_go_to_the_spool(repo, writer):
+    for row in rows(520):
+        writer.enqueue(row)
+    assert writer.depth == 500
+    await writer.flush()
+    assert writer.rows_written == 500 and writer.rows_spooled == 20
+
+async def test_replay_skips_a_torn_line_and_keeps_failed_rows(repo, writer):
+    with open(writer.spool_path, "w") as spool:
+        spool.write('{"user_id": "u1", "user_message": "kept"}\n{"user_id": "u1", "user_m')
+    await writer.flush()
+    repo.failing = True
+    await writer._replay_spool()
+    # The replay failed: the readable row stays claimed for the next attempt
+    assert os.path.exists(writer.spool_path + ".replay")
+    repo.failing = False
+    writer._replay_not_before = 0.0
+    await writer._replay_spool()
+    assert [row["user_message"] for row in repo.tables["conversation_messages"]] == ["kept"]
+
+class SlowRepository(InMemoryRepository):
+    async def insert_conversation_messages(self, rows):
+        await asyncio.sleep(0.3)
+        return await super().insert_conversation_messages(rows)
+
+async def test_stop_mid_insert_finishes_the_batch(tmp_path):
+    repo = SlowRepository()
+    writer = ConversationLogWriter(repo=repo, batch_size=2, flush_interval=5, spool_path=str(tmp_path / "spool.jsonl"))
+    await writer.start()
+    for row in rows(3):
+        writer.enqueue(row)
+    await asyncio.sleep(0.1)
+    await writer.stop()
+    assert [row["user_message"] for row in repo.tables["conversation_messages"]] == ["m0", "m1", "m2"]
+    assert writer.depth == 0 and not os.path.exists(writer.spool_path)
+
+async def test_a_cancelled_insert_spools_its_batch(tmp_path):
+    writer = ConversationLogWriter(repo=SlowRepository(), batch_size=2, spool_path=str(tmp_path / "spool.jsonl"))
+    for row in rows(2):
+        writer.enqueue(row)
+    task = asyncio.ensure_future(writer.flush())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert writer.depth == 0 and writer.rows_spooled == 2
+    assert [row["user_message"] for row in writer._read_spool(writer.spool_path)] == ["m0", "m1"]
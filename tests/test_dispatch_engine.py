@@ -0,0 +1,144 @@
+import asyncio
+import random
+import pytest
+from app.api.routes import admin
+from app.core.config import settings
+from app.models.repository import InMemoryRepository
+from app.services.dispatch_engine import (
+    CRITICAL, URGENT, Assignment, AssignmentEngine, FleetIndex, incident_priority
+)
+from app.utils.geo import haversine_km
+
+pytestmark = pytest.mark.anyio
+
+def engine(**overrides) -> AssignmentEngine:
+    return AssignmentEngine(repo=InMemoryRepository(), fleet_path=None, **{"batch_interval": 0, **overrides})
+
+def test_priority_follows_the_reported_state():
+    assert incident_priority({"user_reported_status": "he is unconscious", "incident": "fall"}) == CRITICAL
+    assert incident_priority({"user_reported_status": "conscious", "incident": "sprained ankle"}) == URGENT
+
+def test_nearest_matches_a_brute_force_scan():
+    rng = random.Random(5)
+    fleet = FleetIndex(cell_degrees=0.05)
+    for number in range(500):
+        fleet.upsert(str(number), rng.uniform(0, 1), rng.uniform(32, 33), available=number % 7 != 0)
+    for _ in range(20):
+        lat, lon = rng.uniform(0, 1), rng.uniform(32, 33)
+        expected = sorted(
+            (haversine_km(lat, lon, unit.latitude, unit.longitude), unit.id)
+            for unit in fleet.units.values() if unit.available
+        )
+        expected = [id for distance, id in expected if distance <= 20][:5]
+        assert [id for _, id in fleet.nearest(lat, lon, 5, 20)] == expected
+
+def test_units_leave_the_index_while_busy_or_moved():
+    fleet = FleetIndex()
+    fleet.upsert("a", 0.30, 32.50, capabilities=["ALS"])
+    fleet.occupy("a", "i1")
+    assert fleet.nearest(0.30, 32.50, 1, 10) == []
+    fleet.upsert("a", 0.40, 32.60, available=True)
+    assert fleet.nearest(0.30, 32.50, 1, 5) == []
+    assert [id for _, id in fleet.nearest(0.40, 32.60, 1, 5, capability="als")] == ["a"]
+    assert fleet.remove("a") and not fleet.cells
+
+def test_batch_assignment_does_not_strand_the_second_incident():
+    dispatch = engine(max_search_km=1.5)
+    # Taken one at a time, "first" would claim "east", its nearest unit,
+    # leaving "second" with nothing in range
+    dispatch.update_unit("east", 0.300, 32.505)
+    dispatch.update_unit("west", 0.300, 32.490)
+    dispatch.submit("first", 0.300, 32.500)
+    dispatch.submit("second", 0.300, 32.507)
+    assignments = {assignment.incident_id: assignment.unit_id for assignment in dispatch.assign_pending()}
+    assert assignments == {"first": "west", "second": "east"}
+    assert dispatch.fleet.available_count == 0
+
+def test_critical_incidents_go_first_and_prefer_advanced_units():
+    dispatch = engine()
+    dispatch.update_unit("basic", 0.300, 32.500)
+    dispatch.update_unit("als", 0.300, 32.530, capabilities=["als"])
+    dispatch.submit("urgent", 0.300, 32.500, URGENT)
+    dispatch.submit("critical", 0.300, 32.500, CRITICAL)
+    assignments = {assignment.incident_id: assignment.unit_id for assignment in dispatch.assign_pending()}
+    assert assignments == {"critical": "als", "urgent": "basic"}
+
+def test_incidents_without_a_unit_stay_queued_until_one_is_released():
+    dispatch = engine()
+    dispatch.update_unit("only", 0.300, 32.500)
+    dispatch.submit("first", 0.300, 32.500)
+    dispatch.submit("second", 0.300, 32.500)
+    assert [assignment.incident_id for assignment in dispatch.assign_pending()] == ["first"]
+    assert dispatch.pending == 1
+    assert dispatch.assign_pending() == []
+
+    dispatch.release("only")
+    assert [assignment.incident_id for assignment in dispatch.assign_pending()] == ["second"]
+    assert dispatch.release("unknown") is None
+
+async def test_running_engine_records_assignments():
+    dispatch = engine()
+    await dispatch.repository.insert_emergency_incident({"id": "i1", "user_id": "u1", "status": "logged"})
+    await dispatch.start()
+    try:
+        dispatch.update_unit("u", 0.300, 32.500)
+        dispatch.submit("i1", 0.300, 32.500)
+        for _ in range(100):
+            if dispatch.assigned:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        # Waits for the assignment write
+        await dispatch.stop()
+    [row] = dispatch.repository.tables["emergency_incidents"]
+    assert (row["status"], row["assigned_unit_id"]) == ("assigned", "u")
+
+class FailingRepository(InMemoryRepository):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def update_emergency_incident(self, incident_id, values):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return await super().update_emergency_incident(incident_id, values)
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "emergency_write_max_retries", 2)
+    monkeypatch.setattr(settings, "emergency_write_retry_base_seconds", 0.001)
+
+async def test_assignment_writes_are_retried_after_errors(fast_retries):
+    dispatch = AssignmentEngine(repo=FailingRepository(failures=2), fleet_path=None)
+    await dispatch.repository.insert_emergency_incident({"id": "i1", "user_id": "u1", "status": "dispatched"})
+    await dispatch._record(Assignment("i1", "u", 0.1, URGENT, 1.0))
+    [row] = dispatch.repository.tables["emergency_incidents"]
+    assert (row["status"], row["assigned_unit_id"]) == ("assigned", "u")
+
+@pytest.mark.parametrize("failures", [0, 10])
+async def test_an_assignment_that_cannot_be_written_is_spooled(fast_retries, failures):
+    # Either the row never appears or the database keeps failing
+    dispatch = AssignmentEngine(repo=FailingRepository(failures), fleet_path=None)
+    spooled = []
+
+    async def spool_update(incident_id, values):
+        spooled.append((incident_id, values))
+
+    dispatch.spool_update = spool_update
+    await dispatch._record(Assignment("i1", "u", 0.1, URGENT, 1.0))
+    [(incident_id, values)] = spooled
+    assert (incident_id, values["assigned_unit_id"], values["status"]) == ("i1", "u", "assigned")
+
+def test_admin_unit_routes(api, monkeypatch):
+    monkeypatch.setattr(settings, "admin_api_key", "admin-secret")
+    monkeypatch.setattr(admin, "assignment_engine", engine())
+    headers = {"X-Admin-Key": "admin-secret"}
+    assert api.put("/api/v1/admin/units/a", json={"latitude": 0.3, "longitude": 32.5}).status_code == 403
+
+    response = api.put("/api/v1/admin/units/a", json={"latitude": 0.3, "longitude": 32.5, "capabilities": ["als"]}, headers=headers)
+    assert response.json()["available"] is True
+    assert [unit["id"] for unit in api.get("/api/v1/admin/units", headers=headers).json()] == ["a"]
+    assert api.post("/api/v1/admin/units/b/release", headers=headers).status_code == 404
+    assert api.delete("/api/v1/admin/units/a", headers=headers).status_code == 204
+    assert api.delete("/api/v1/admin/units/a", headers=headers).status_code == 404
@@ -0,0 +1,108 @@
+import asyncio
+import orjson
+import pytest
+from app.api.routes import admin
+from app.core.config import settings
+from app.services.dispatch_feed import HEARTBEAT_MESSAGE, RETRY_MESSAGE, DispatchFeed
+
+pytestmark = pytest.mark.anyio
+
+def events(chunk: bytes) -> list:
+    """(id, event, data) of every message in an SSE chunk"""
+    parsed = []
+    for message in chunk.strip().split(b"\n\n"):
+        fields = dict(line.split(b": ", 1) for line in message.split(b"\n"))
+        parsed.append((fields[b"id"].decode(), fields[b"event"].decode(), orjson.loads(fields[b"data"])))
+    return parsed
+
+async def connect(feed: DispatchFeed, last_event_id=None):
+    stream = feed.stream(last_event_id)
+    assert await stream.__anext__() == RETRY_MESSAGE
+    return stream
+
+async def test_events_fan_out_to_every_console():
+    feed = DispatchFeed(heartbeat_seconds=5)
+    first, second = await connect(feed), await connect(feed)
+    event_id = feed.publish("dispatch", {"id": "a"})
+    feed.publish("dispatch", {"id": "b"})
+    for stream in (first, second):
+        chunk = await stream.__anext__()
+        assert [(kind, data["id"]) for _, kind, data in events(chunk)] == [("dispatch", "a"), ("dispatch", "b")]
+        assert events(chunk)[0][0] == event_id == f"{feed.epoch}-1"
+    assert feed.stats()["subscribers"] == 2 and feed.stats()["published"] == 2
+    await first.aclose()
+    await second.aclose()
+    assert feed.stats()["subscribers"] == 0
+
+async def test_a_console_that_overflows_its_queue_is_replayed_from_history():
+    feed = DispatchFeed(queue_size=2, history_size=10, heartbeat_seconds=5)
+    stream = await connect(feed)
+    for number in range(5):
+        feed.publish("dispatch", {"id": number})
+    subscriber = next(iter(feed._subscribers))
+    assert subscriber.behind and not subscriber.queue
+    assert [data["id"] for _, _, data in events(await stream.__anext__())] == [0, 1, 2, 3, 4]
+    # Back to the queue once caught up
+    feed.publish("dispatch", {"id": 5})
+    assert [data["id"] for _, _, data in events(await stream.__anext__())] == [5]
+    await stream.aclose()
+
+async def test_a_console_behind_the_history_is_reset():
+    feed = DispatchFeed(queue_size=2, history_size=3, heartbeat_seconds=5)
+    stream = await connect(feed)
+    for number in range(6):
+        feed.publish("dispatch", {"id": number})
+    [(event_id, kind, data)] = events(await stream.__anext__())
+    assert (event_id, kind) == (f"{feed.epoch}-6", "reset")
+    assert "reload" in data["reason"]
+    await stream.aclose()
+
+async def test_reconnecting_with_last_event_id_resumes_after_it():
+    feed = DispatchFeed(history_size=10, heartbeat_seconds=5)
+    ids = [feed.publish("dispatch", {"id": number}) for number in range(4)]
+    stream = await connect(feed, ids[1])
+    assert [data["id"] for _, _, data in events(await stream.__anext__())] == [2, 3]
+    await stream.aclose()
+
+    # Up to date: nothing to replay, just the next event
+    stream = await connect(feed, ids[-1])
+    feed.publish("dispatch", {"id": 4})
+    assert [data["id"] for _, _, data in events(await stream.__anext__())] == [4]
+    await stream.aclose()
+
+@pytest.mark.parametrize("last_event_id", ["0badcafe-1", "garbage", "{epoch}-99"])
+async def test_an_id_from_another_run_gets_a_reset(last_event_id):
+    feed = DispatchFeed(history_size=10, heartbeat_seconds=5)
+    feed.publish("dispatch", {"id": 0})
+    stream = await connect(feed, last_event_id.format(epoch=feed.epoch))
+    assert [kind for _, kind, _ in events(await stream.__anext__())] == ["reset"]
+    await stream.aclose()
+
+async def test_idle_consoles_get_a_heartbeat():
+    feed = DispatchFeed(heartbeat_seconds=0.01)
+    stream = await connect(feed)
+    assert await stream.__anext__() == HEARTBEAT_MESSAGE
+    await stream.aclose()
+
+async def test_close_ends_every_stream():
+    feed = DispatchFeed(heartbeat_seconds=5)
+    streams = [await connect(feed) for _ in range(3)]
+    pending = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+    await asyncio.sleep(0)
+    feed.close()
+    for future in pending:
+        with pytest.raises(StopAsyncIteration):
+            await future
+    assert feed.stats()["subscribers"] == 0
+
+def test_feed_route_turns_consoles_away_when_full(api, monkeypatch):
+    monkeypatch.setattr(settings, "admin_api_key", "admin-secret")
+    feed = DispatchFeed(max_subscribers=1)
+    monkeypatch.setattr(admin, "dispatch_feed", feed)
+    headers = {"X-Admin-Key": "admin-secret"}
+    assert feed.has_room()
+    feed.subscribe()
+    assert not feed.has_room()
+    response = api.get("/api/v1/admin/feed", headers=headers)
+    assert (response.status_code, response.json()["detail"]) == (503, "Dispatch feed is full")
+    assert api.get("/api/v1/admin/feed/stats", headers=headers).json()["subscribers"] == 1
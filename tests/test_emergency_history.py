@@ -0,0 +1,89 @@
+import json
+import pytest
+from app.models.repository import InMemoryRepository
+from app.api.routes import emergencies
+from app.services.emergency_history import (
+    EmergencyHistory, InvalidPageRequest, decode_cursor, encode_cursor, etag_matches, parse_fields
+)
+
+pytestmark = pytest.mark.anyio
+
+async def seeded(count: int, user_id: str = "user-1") -> InMemoryRepository:
+    repo = InMemoryRepository()
+    for number in range(count):
+        # Pairs share a timestamp so the id breaks the tie
+        await repo.insert_emergency_incident({
+            "id": f"i{number:02d}",
+            "user_id": user_id,
+            "created_at": f"2026-01-01T00:00:{number // 2:02d}",
+            "location": "Kireka",
+            "incident": "accident"
+        })
+    await repo.insert_emergency_incident({"id": "other", "user_id": "user-2", "created_at": "2026-01-02T00:00:00"})
+    return repo
+
+async def test_pages_walk_the_history_newest_first_without_gaps():
+    history = EmergencyHistory(repo=await seeded(7))
+    seen, cursor = [], None
+    while True:
+        page = json.loads((await history.get_page("user-1", limit=3, cursor=cursor)).body)
+        seen.extend(row["id"] for row in page["emergencies"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"i{number:02d}" for number in reversed(range(7))]
+
+async def test_last_full_page_has_no_next_cursor():
+    history = EmergencyHistory(repo=await seeded(3))
+    page = json.loads((await history.get_page("user-1", limit=3)).body)
+    assert len(page["emergencies"]) == 3
+    assert page["next_cursor"] is None
+
+async def test_fields_are_projected_and_keep_the_cursor_columns():
+    history = EmergencyHistory(repo=await seeded(1))
+    page = json.loads((await history.get_page("user-1", fields="incident")).body)
+    assert page["emergencies"] == [{"id": "i00", "created_at": "2026-01-01T00:00:00", "incident": "accident"}]
+
+def test_unknown_fields_and_bad_cursors_are_rejected():
+    with pytest.raises(InvalidPageRequest, match="unknown fields: password"):
+        parse_fields("incident,password")
+    with pytest.raises(InvalidPageRequest):
+        decode_cursor("not a cursor")
+    # A well-formed cursor whose id would break out of the filter
+    with pytest.raises(InvalidPageRequest):
+        decode_cursor(encode_cursor({"created_at": "2026-01-01T00:00:00", "id": 'x",id.gt."'}))
+    assert decode_cursor(encode_cursor({"created_at": "2026-01-01T00:00:00", "id": "i01"})) == (
+        "2026-01-01T00:00:00", "i01"
+    )
+
+def test_etag_matching():
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+
+async def test_cached_page_is_served_until_the_user_writes():
+    repo = await seeded(2)
+    history = EmergencyHistory(repo=repo)
+    first = await history.get_page("user-1")
+    await repo.insert_emergency_incident({"id": "i99", "user_id": "user-1", "created_at": "2026-01-03T00:00:00"})
+    assert await history.get_page("user-1") is first
+    history.invalidate("user-1")
+    fresh = await history.get_page("user-1")
+    assert fresh.etag != first.etag
+    assert json.loads(fresh.body)["emergencies"][0]["id"] == "i99"
+
+async def test_route_returns_304_for_a_matching_etag(api, monkeypatch):
+    monkeypatch.setattr(emergencies, "emergency_history", EmergencyHistory(repo=await seeded(3)))
+
+    response = api.get("/api/v1/user/emergencies", params={"limit": 2, "fields": "incident"})
+    assert response.status_code == 200
+    assert len(response.json()["emergencies"]) == 2
+    etag = response.headers["etag"]
+
+    assert api.get(
+        "/api/v1/user/emergencies", params={"limit": 2, "fields": "incident"}, headers={"If-None-Match": etag}
+    ).status_code == 304
+    assert api.get("/api/v1/user/emergencies", params={"fields": "password"}).status_code == 400
+    assert api.get("/api/v1/user/emergencies", params={"cursor": "!!"}).status_code == 400
+    assert api.get("/api/v1/user/emergencies", params={"limit": 1000}).status_code == 422
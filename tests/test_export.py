@@ -0,0 +1,102 @@
+import io
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.api.routes import admin
+from app.core.config import settings
+from app.models.repository import InMemoryRepository
+from app.services.export import (
+    ExportQuery, InvalidExportRequest, RecordExporter, decode_cursor, encode_cursor, utc_timestamp
+)
+
+pytestmark = pytest.mark.anyio
+
+def seeded(count: int) -> InMemoryRepository:
+    repo = InMemoryRepository()
+    repo.tables["conversation_messages"] = [
+        {
+            "id": number,
+            "created_at": f"2026-01-01T00:{number // 2:02d}:00",
+            "user_id": "u1",
+            "user_message": f"m{number}",
+            "assistant_reply": "ok",
+            "dispatch_triggered": number % 3 == 0
+        }
+        for number in range(count)
+    ]
+    return repo
+
+async def lines(chunks) -> list:
+    return [json.loads(line) async for chunk in chunks for line in chunk.splitlines()]
+
+async def test_ndjson_export_reads_every_row_in_order_a_page_at_a_time():
+    exporter = RecordExporter(repo=seeded(25), page_size=10)
+    query = ExportQuery("conversations")
+    chunks = [chunk async for chunk in exporter.stream(query, "ndjson")]
+    assert len(chunks) == 3
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["id"] for row in rows] == list(range(25))
+    assert query.rows == 25 and decode_cursor(query.cursor) == ("2026-01-01T00:12:00", 24)
+
+async def test_interrupted_export_resumes_after_its_last_row():
+    exporter = RecordExporter(repo=seeded(25), page_size=10)
+    query = ExportQuery("conversations")
+    async for _ in exporter.ndjson(query):
+        break
+    resumed = ExportQuery("conversations", after=decode_cursor(query.cursor))
+    assert [row["id"] for row in await lines(exporter.ndjson(resumed))] == list(range(10, 25))
+
+async def test_filters_and_limit():
+    exporter = RecordExporter(repo=seeded(25), page_size=4)
+    query = ExportQuery(
+        "conversations", since="2026-01-01T00:02:00", until="2026-01-01T00:10:00", dispatch_only=True, limit=3
+    )
+    assert [row["id"] for row in await lines(exporter.ndjson(query))] == [6, 9, 12]
+
+def test_invalid_requests_are_rejected():
+    with pytest.raises(InvalidExportRequest, match="unknown dataset"):
+        ExportQuery("users")
+    with pytest.raises(InvalidExportRequest, match="unknown format"):
+        RecordExporter(repo=seeded(0)).stream(ExportQuery("incidents"), "csv")
+    for row_id in (True, "x'; drop", None):
+        with pytest.raises(InvalidExportRequest):
+            decode_cursor(encode_cursor({"created_at": "2026-01-01T00:00:00", "id": row_id}))
+    with pytest.raises(InvalidExportRequest):
+        decode_cursor(encode_cursor({"created_at": "yesterday", "id": 1}))
+
+def test_bounds_are_converted_to_naive_utc():
+    eat = timezone(timedelta(hours=3))
+    assert utc_timestamp(datetime(2026, 1, 1, 3, 0, tzinfo=eat)) == "2026-01-01T00:00:00"
+    assert utc_timestamp(None) is None
+
+async def test_parquet_export_round_trips():
+    pq = pytest.importorskip("pyarrow.parquet")
+    exporter = RecordExporter(repo=seeded(25), page_size=10, row_group_size=10)
+    query = ExportQuery("conversations")
+    data = b"".join([chunk async for chunk in exporter.parquet(query)])
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 25
+    assert table.column("id").to_pylist() == [str(number) for number in range(25)]
+
+def test_export_route(api, monkeypatch):
+    monkeypatch.setattr(settings, "admin_api_key", "admin-secret")
+    monkeypatch.setattr(admin, "record_exporter", RecordExporter(repo=seeded(5), page_size=2))
+    headers = {"X-Admin-Key": "admin-secret"}
+
+    response = api.get("/api/v1/admin/export/conversations", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [0, 1, 2, 3, 4]
+
+    cursor = encode_cursor({"created_at": "2026-01-01T00:01:00", "id": 2})
+    resumed = api.get("/api/v1/admin/export/conversations", params={"cursor": cursor}, headers=headers)
+    assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == [3, 4]
+
+    assert api.get("/api/v1/admin/export/users", headers=headers).status_code == 400
+    assert api.get("/api/v1/admin/export/conversations", params={"cursor": "!!"}, headers=headers).status_code == 400
+
+    def missing_pyarrow():
+        raise RuntimeError("Parquet exports require the 'pyarrow' package")
+
+    monkeypatch.setattr(admin, "require_pyarrow", missing_pyarrow)
+    assert api.get("/api/v1/admin/export/incidents", params={"format": "parquet"}, headers=headers).status_code == 501
@@ -0,0 +1,91 @@
+import json
+import os
+import random
+import pytest
+from app.api.routes import facilities as facilities_route
+from app.services.facility_locator import (
+    ALWAYS_OPEN, Facility, FacilityIndex, FacilityLocator, load_facilities, parse_hours
+)
+from app.utils.geo import haversine_km
+
+pytestmark = pytest.mark.anyio
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, "data", "facilities.sample.csv")
+
+def facility(id, latitude, longitude, **fields) -> Facility:
+    return Facility(id=id, name=id, type=fields.pop("type", "hospital"), latitude=latitude, longitude=longitude, **fields)
+
+def test_parse_hours():
+    assert parse_hours("24/7") == (ALWAYS_OPEN, ALWAYS_OPEN)
+    assert parse_hours(None) == (ALWAYS_OPEN, ALWAYS_OPEN)
+    assert parse_hours("08:00-17:30") == (480, 1050)
+    assert parse_hours("22:00-06:00") == (1320, 360)
+
+def test_csv_and_geojson_load_and_skip_rows_without_coordinates(tmp_path):
+    facilities = load_facilities(SAMPLE)
+    assert len(facilities) == 9
+    assert facilities[0].capabilities == ("emergency", "icu", "maternity", "surgery", "trauma")
+
+    path = tmp_path / "facilities.geojson"
+    path.write_text(json.dumps({"features": [
+        {"geometry": {"type": "Point", "coordinates": [32.5, 0.3]}, "properties": {"id": "a", "capabilities": ["ICU"]}},
+        {"geometry": {"type": "LineString", "coordinates": []}, "properties": {"id": "b"}},
+        {"geometry": None, "properties": {"id": "c"}}
+    ]}))
+    [loaded] = load_facilities(str(path))
+    assert (loaded.id, loaded.latitude, loaded.longitude, loaded.capabilities) == ("a", 0.3, 32.5, ("icu",))
+
+def test_query_matches_a_brute_force_scan():
+    rng = random.Random(3)
+    points = [facility(str(number), rng.uniform(-1, 1), rng.uniform(31, 33)) for number in range(2000)]
+    index = FacilityIndex(points, cell_degrees=0.1)
+    for _ in range(20):
+        lat, lon = rng.uniform(-1, 1), rng.uniform(31, 33)
+        expected = sorted(
+            (haversine_km(lat, lon, point.latitude, point.longitude), point.id) for point in points
+        )
+        expected = [id for distance, id in expected if distance <= 15][:10]
+        assert [found.id for found, _ in index.query(lat, lon, 15, 10)] == expected
+
+def test_query_filters_by_capability_type_and_hours():
+    index = FacilityIndex([
+        facility("icu", 0.30, 32.50, capabilities=("emergency", "icu")),
+        facility("er", 0.30, 32.51, capabilities=("emergency",)),
+        facility("day-clinic", 0.30, 32.50, type="clinic", hours="08:00-17:00"),
+        facility("night-clinic", 0.30, 32.50, type="clinic", hours="22:00-06:00")
+    ])
+    assert [found.id for found, _ in index.query(0.3, 32.5, 5, 10, capabilities=["ICU"])] == ["icu"]
+    assert [found.id for found, _ in index.query(0.3, 32.5, 5, 10, capabilities=["emergency", "icu"])] == ["icu"]
+    assert index.query(0.3, 32.5, 5, 10, capabilities=["dialysis"]) == []
+    clinics_at = lambda minute: {
+        found.id for found, _ in index.query(0.3, 32.5, 5, 10, facility_type="Clinic", open_at_minute=minute)
+    }
+    assert clinics_at(9 * 60) == {"day-clinic"}
+    assert clinics_at(23 * 60) == {"night-clinic"}
+    assert clinics_at(2 * 60) == {"night-clinic"}
+    assert clinics_at(20 * 60) == set()
+
+async def test_failed_reload_keeps_the_old_index(tmp_path):
+    path = tmp_path / "facilities.csv"
+    path.write_text(open(SAMPLE).read())
+    locator = FacilityLocator(path=str(path), reload_interval=60)
+    assert await locator.reload()
+    assert not await locator.reload()
+    assert len(locator.index) == 9
+
+    path.unlink()
+    assert not await locator.reload(force=True)
+    assert len(locator.index) == 9
+
+def test_nearby_route(api, monkeypatch):
+    locator = FacilityLocator(path=None)
+    monkeypatch.setattr(facilities_route, "facility_locator", locator)
+    params = {"lat": 0.3380, "lon": 32.5760, "radius_km": 12, "capability": "icu"}
+    assert api.get("/api/v1/facilities/nearby", params=params).status_code == 503
+
+    locator.index = FacilityIndex(load_facilities(SAMPLE))
+    locator.loaded_mtime = 0.0
+    response = api.get("/api/v1/facilities/nearby", params=params)
+    assert response.status_code == 200
+    assert [found["id"] for found in response.json()["facilities"]] == ["mulago", "kiruddu"]
+    assert response.json()["facilities"][0]["distance_km"] == 0.0
@@ -0,0 +1,31 @@
+import threading
+from app.utils.file_lock import acquire_lock, file_lock, release_lock
+
+def test_non_blocking_lock_fails_while_held(tmp_path):
+    path = str(tmp_path / "locks" / "spool.lock")
+    held = acquire_lock(path)
+    assert acquire_lock(path, blocking=False) is None
+    release_lock(held)
+    again = acquire_lock(path, blocking=False)
+    assert again is not None
+    release_lock(again)
+    release_lock(None)
+
+def test_blocking_lock_waits_for_the_holder(tmp_path):
+    path = str(tmp_path / "spool.lock")
+    order = []
+    entered = threading.Event()
+
+    def contender():
+        entered.set()
+        with file_lock(path):
+            order.append("contender")
+
+    with file_lock(path):
+        thread = threading.Thread(target=contender)
+        thread.start()
+        entered.wait(1)
+        thread.join(0.1)
+        order.append("holder")
+    thread.join(1)
+    assert order == ["holder", "contender"]
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import threading
+import pytest
+from app.models.repository import InMemoryRepository
+from app.services.dispatch_engine import AssignmentEngine
+from app.services.dispatch_feed import DispatchFeed
+from app.services.emergency_history import EmergencyHistory
+from app.services.emergency_service import EmergencyService
+from app.services.geocoder import GazetteerIndex, Geocoder, Place, load_gazetteer, normalize_words
+from app.services.incident_dedup import IncidentDeduplicator
+from app.services.persistence import PersistenceScheduler
+
+pytestmark = pytest.mark.anyio
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, "data", "gazetteer.sample.csv")
+
+def loaded_geocoder() -> Geocoder:
+    geocoder = Geocoder(path=SAMPLE)
+    geocoder.load()
+    return geocoder
+
+def test_normalize_expands_abbreviations_and_drops_stopwords():
+    assert normalize_words("Opp. the Total stn on Jinja Rd") == ["total", "station", "jinja", "road"]
+
+def test_most_specific_place_wins():
+    index = GazetteerIndex(load_gazetteer(SAMPLE))
+    assert index.lookup("near the Total station on Jinja Road").place.name == "Total Jinja Road"
+    assert index.lookup("on jinja rd").place.name == "Jinja Road"
+    assert index.lookup("outside Acacai Mall").place.name == "Acacia Mall"
+    assert index.lookup("somewhere far away") is None
+
+async def test_misses_are_looked_up_off_the_event_loop():
+    geocoder = loaded_geocoder()
+    lookup = geocoder.index.lookup
+    threads = []
+
+    def recording(text, min_similarity):
+        threads.append(threading.get_ident())
+        return lookup(text, min_similarity)
+
+    geocoder.index.lookup = recording
+    first = await geocoder.resolve("Acacia Mall")
+    assert threads and threads[0] != threading.get_ident()
+    # The second lookup is a cache hit and never reaches the index
+    assert await geocoder.resolve("acacia   mall") is first
+    assert len(threads) == 1
+    assert await geocoder.resolve(None) is None
+
+async def test_lookup_racing_a_reload_is_not_cached():
+    geocoder = loaded_geocoder()
+    release = threading.Event()
+    lookup = geocoder.index.lookup
+
+    def slow(text, min_similarity):
+        release.wait(5)
+        return lookup(text, min_similarity)
+
+    geocoder.index.lookup = slow
+    pending = asyncio.create_task(geocoder.resolve("Acacia Mall"))
+    await asyncio.sleep(0.05)
+    geocoder.index = GazetteerIndex([Place("Acacia Mall", 1.0, 1.0)])
+    geocoder.cache.clear()
+    release.set()
+    assert (await pending).latitude == 0.3330
+    assert (await geocoder.resolve("Acacia Mall")).latitude == 1.0
+
+async def test_incident_without_coordinates_is_located_from_the_gazetteer():
+    repo = InMemoryRepository()
+    service = EmergencyService(
+        repo=repo,
+        persistence=PersistenceScheduler(repo=repo),
+        history=EmergencyHistory(repo=repo),
+        assignments=AssignmentEngine(repo=repo, fleet_path=None),
+        locations=loaded_geocoder(),
+        duplicates=IncidentDeduplicator(),
+        feed=DispatchFeed()
+    )
+    stored = await service.log_emergency(
+        {"location": "outside Acacia Mall", "incident": "fall", "victim_count": "1", "user_reported_status": "conscious"},
+        "user-1"
+    )
+    assert (stored["latitude"], stored["longitude"], stored["location_source"]) == (0.3330, 32.5870, "gazetteer")
+    assert service.assignments.pending == 1
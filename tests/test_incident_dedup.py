@@ -0,0 +1,110 @@
+import pytest
+from app.api.routes import admin
+from app.core.config import settings
+from app.models.repository import InMemoryRepository
+from app.services.dispatch_engine import CRITICAL, URGENT, AssignmentEngine
+from app.services.dispatch_feed import DispatchFeed
+from app.services.emergency_history import EmergencyHistory
+from app.services.emergency_service import EmergencyService
+from app.services.geocoder import Geocoder
+from app.services.incident_dedup import IncidentDeduplicator, IncidentIndex, jaccard, shingles
+from app.services.persistence import PersistenceScheduler
+
+pytestmark = pytest.mark.anyio
+
+ACACIA = (0.3330, 32.5870)
+
+def deduplicator() -> IncidentDeduplicator:
+    return IncidentDeduplicator(index=IncidentIndex(window_seconds=900, radius_km=0.5), enabled=True)
+
+def test_shingles_ignore_case_filler_and_word_order():
+    assert shingles("Near the Acacia Mall") == shingles("mall acacia")
+    assert jaccard(shingles("Kireka market"), shingles("Kireka markt")) > 0.5
+    assert jaccard(shingles("Kireka market"), shingles("Ntinda stage")) < 0.2
+
+def test_nearby_report_of_the_same_kind_is_flagged_not_withheld():
+    dedup = deduplicator()
+    assert dedup.check("a", "chest pain", "Acacia Mall", *ACACIA, URGENT, now=0) is None
+    duplicate = dedup.check("b", "heart attack", "acacia mall food court", 0.3332, 32.5871, URGENT, now=60)
+    assert (duplicate.original_id, duplicate.confirmed) == ("a", False)
+    # A third caller points at the first incident of the group
+    assert dedup.check("c", "chest pains", "Acacia", 0.3331, 32.5872, URGENT, now=90).original_id == "a"
+    assert dedup.stats()["flagged"] == 2 and dedup.stats()["confirmed"] == 0
+
+def test_conflicting_kinds_distance_and_age_rule_out_a_match():
+    dedup = deduplicator()
+    dedup.check("fire", "fire", "Acacia Mall", *ACACIA, URGENT, now=0)
+    assert dedup.check("crash", "car crash", "Acacia Mall", *ACACIA, URGENT, now=10) is None
+    assert dedup.check("far", "fire", "Acacia Mall", 0.3500, 32.5870, URGENT, now=20) is None
+    assert dedup.check("late", "fire", "Acacia Mall", *ACACIA, URGENT, now=2000) is None
+
+def test_unlocated_reports_match_on_near_identical_location_text():
+    dedup = deduplicator()
+    dedup.check("a", "fall", "Kireka market on Jinja road", None, None, URGENT, now=0)
+    assert dedup.check("b", "fall", "jinja road, kireka market", None, None, URGENT, now=30).original_id == "a"
+    assert dedup.check("c", "fall", "Ntinda stage", None, None, URGENT, now=40) is None
+
+def test_confirm_marks_the_flagged_match():
+    dedup = deduplicator()
+    dedup.check("a", "fire", "Acacia Mall", *ACACIA, URGENT, now=0)
+    dedup.check("b", "fire", "Acacia Mall", *ACACIA, URGENT, now=10)
+    assert dedup.confirm("b", "a").confirmed
+    assert dedup.confirm("x", "a") is None
+    assert dedup.stats()["confirmed"] == 2
+
+@pytest.fixture
+def service():
+    repo = InMemoryRepository()
+    return EmergencyService(
+        repo=repo,
+        persistence=PersistenceScheduler(repo=repo),
+        history=EmergencyHistory(repo=repo),
+        assignments=AssignmentEngine(repo=repo, fleet_path=None),
+        locations=Geocoder(path=None),
+        duplicates=deduplicator(),
+        feed=DispatchFeed()
+    )
+
+def chest_pain(caller: str) -> dict:
+    return {"location": "Acacia Mall", "incident": "chest pain", "victim_count": "1", "user_reported_status": caller}
+
+async def test_two_chest_pain_callers_at_one_mall_both_get_a_unit(service):
+    first = await service.log_emergency(chest_pain("conscious"), "user-1", ACACIA)
+    second = await service.log_emergency(chest_pain("unconscious"), "user-2", (0.3331, 32.5871))
+    assert second["duplicate_of"] == first["id"]
+    assert second["status"] == "dispatched"
+    assert service.assignments.pending == 2
+
+async def test_confirming_a_duplicate_withdraws_it_from_the_queue(service):
+    first = await service.log_emergency(chest_pain("conscious"), "user-1", ACACIA)
+    second = await service.log_emergency(chest_pain("conscious"), "user-2", ACACIA)
+    assert await service.confirm_duplicate(second["id"], first["id"]) is True
+    assert service.assignments.pending == 1
+    stored = service.repository.tables["emergency_incidents"][1]
+    assert (stored["status"], stored["duplicate_of"]) == ("duplicate", first["id"])
+    assert await service.confirm_duplicate("unknown", first["id"]) is None
+
+async def test_confirming_an_assigned_duplicate_frees_its_unit(service):
+    service.assignments.update_unit("amb-1", *ACACIA)
+    service.assignments.update_unit("amb-2", *ACACIA)
+    first = await service.log_emergency(chest_pain("conscious"), "user-1", ACACIA)
+    second = await service.log_emergency(chest_pain("conscious"), "user-2", ACACIA)
+    assert len(service.assignments.assign_pending()) == 2
+    assert await service.confirm_duplicate(second["id"], first["id"]) is True
+    assert service.assignments.fleet.available_count == 1
+    assert service.assignments.withdraw(second["id"]) is False
+
+def test_confirm_route(api, monkeypatch, service):
+    monkeypatch.setattr(settings, "admin_api_key", "admin-secret")
+    monkeypatch.setattr(admin, "emergency_service", service)
+    headers = {"X-Admin-Key": "admin-secret"}
+    service.assignments.submit("b", *ACACIA, CRITICAL)
+    service.repository.tables["emergency_incidents"].append({"id": "b", "status": "dispatched"})
+
+    url = "/api/v1/admin/duplicates/b/confirm"
+    assert api.post(url, json={"duplicate_of": "a"}).status_code == 403
+    assert api.post(url, json={"duplicate_of": "b"}, headers=headers).status_code == 400
+    assert api.post("/api/v1/admin/duplicates/c/confirm", json={"duplicate_of": "a"}, headers=headers).status_code == 404
+    response = api.post(url, json={"duplicate_of": "a"}, headers=headers)
+    assert response.json() == {"incident_id": "b", "duplicate_of": "a", "withdrawn": True}
+    assert service.assignments.pending == 0
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from main import app
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+
+def test_main_imports_without_credentials():
+    env = {key: value for key, value in os.environ.items() if key not in ("OPENAI_API_KEY", "JWT_SECRET")}
+    env["DATA_BACKEND"] = "supabase"
+    result = subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_missing_credentials_are_listed(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "")
+    monkeypatch.setattr(settings, "data_backend", "supabase")
+    monkeypatch.setattr(settings, "supabase_url", "")
+    monkeypatch.setattr(settings, "supabase_key", "key")
+    assert settings.missing_credentials() == ["OPENAI_API_KEY", "SUPABASE_URL"]
+    with pytest.raises(RuntimeError, match="OPENAI_API_KEY, SUPABASE_URL"):
+        with TestClient(app):
+            pass
+
+def test_ready_only_between_startup_and_shutdown(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_connections", 0)
+    client = TestClient(app)
+    assert client.get("/api/v1/ready").status_code == 503
+    with client:
+        assert client.get("/api/v1/ready").json() == {"status": "ready"}
+        assert client.get("/api/v1/health").json()["status"] == "healthy"
+    assert app.state.lifecycle == "stopping"
+    response = client.get("/api/v1/ready")
+    assert (response.status_code, response.json()) == (503, {"status": "stopping"})
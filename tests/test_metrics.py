@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+import pytest
+from prometheus_client import REGISTRY
+from app.utils.metrics import LoopLagMonitor, observe_db, record_error
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_record_error_counts_by_component(caplog):
+    before = sample("medilocator_errors_total", component="test_component")
+    with caplog.at_level(logging.ERROR):
+        record_error(logging.getLogger("test"), "test_component", "failed: %s", "boom")
+    assert sample("medilocator_errors_total", component="test_component") == before + 1
+    assert "failed: boom" in caplog.text
+
+@pytest.mark.anyio
+async def test_observe_db_labels_the_outcome():
+    @observe_db("test_table", "select")
+    async def query(fail):
+        if fail:
+            raise ConnectionError("down")
+        return "rows"
+
+    labels = {"table": "test_table", "operation": "select"}
+    assert await query(False) == "rows"
+    with pytest.raises(ConnectionError):
+        await query(True)
+    assert sample("medilocator_db_operation_duration_seconds_count", outcome="success", **labels) >= 1
+    assert sample("medilocator_db_operation_duration_seconds_count", outcome="error", **labels) >= 1
+
+@pytest.mark.anyio
+async def test_loop_lag_monitor_sees_a_blocked_loop():
+    monitor = LoopLagMonitor(interval=0.01)
+    await monitor.start()
+    await asyncio.sleep(0.005)
+    time.sleep(0.1)
+    # The probe records as soon as the loop is free, before it sleeps again
+    await asyncio.sleep(0.001)
+    lag = sample("medilocator_event_loop_lag_seconds")
+    await monitor.stop()
+    assert lag >= 0.05
+
+def test_scrape_endpoint_labels_requests_by_route_template(api):
+    api.get("/api/v1/facilities/nearby", params={"latitude": 0.3, "longitude": 32.5})
+    body = api.get("/metrics").text
+    assert "medilocator_http_request_duration_seconds_count" in body
+    assert 'route="/api/v1/facilities/nearby"' in body
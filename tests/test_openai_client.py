@@ -0,0 +1,112 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.core.config import settings
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.openai_client import OpenAIClient
+from tests.llm import backend, client, completion, stream
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+async def test_completion_returns_stripped_content():
+    llm = client(backend(lambda request: completion("  Hello there  ")))
+    assert await llm.chat_completion(MESSAGES) == "Hello there"
+
+async def test_concurrent_calls_are_capped():
+    running = peak = 0
+
+    async def handler(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return completion("ok")
+
+    llm = client(backend(handler), max_concurrency=2)
+    results = await asyncio.gather(*(llm.chat_completion(MESSAGES) for _ in range(6)))
+    assert results == ["ok"] * 6
+    assert peak == 2
+    assert llm.in_flight == 0 and llm.waiting == 0
+
+async def test_call_gives_up_when_every_slot_stays_busy(monkeypatch):
+    monkeypatch.setattr(settings, "openai_queue_timeout_seconds", 0.05)
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return completion("ok")
+
+    llm = client(backend(handler), max_concurrency=1)
+    first = asyncio.create_task(llm.chat_completion(MESSAGES))
+    await asyncio.sleep(0.01)
+    with pytest.raises(Exception, match="saturated"):
+        await llm.chat_completion(MESSAGES)
+    release.set()
+    assert await first == "ok"
+
+async def test_missing_api_key_is_reported(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "")
+    with pytest.raises(ValueError, match="API key"):
+        OpenAIClient().backends
+
+async def test_aclose_drops_the_pool():
+    llm = OpenAIClient()
+    await llm.start()
+    assert llm._http_client is not None
+    await llm.aclose()
+    assert llm._http_client is None and llm._backends is None
+
+def failing(request):
+    return httpx.Response(500, json={"error": {"message": "upstream down"}})
+
+async def test_failed_backend_hands_over_to_the_next():
+    primary = backend(failing, "primary")
+    secondary = backend(lambda request: completion("from secondary"), "secondary")
+    llm = client(primary, secondary)
+    assert await llm.chat_completion(MESSAGES) == "from secondary"
+    assert primary.breaker.consecutive_failures == 1
+
+async def test_open_circuit_is_skipped():
+    calls = []
+
+    def counted(request):
+        calls.append(request)
+        return completion("from primary")
+
+    primary = backend(counted, "primary")
+    primary.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    primary.breaker.record_failure()
+    llm = client(primary, backend(lambda request: completion("from secondary"), "secondary"))
+    assert await llm.chat_completion(MESSAGES) == "from secondary"
+    assert calls == []
+
+async def test_every_circuit_open_fails_fast():
+    only = backend(lambda request: completion("unused"))
+    only.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    only.breaker.record_failure()
+    with pytest.raises(Exception, match="unavailable"):
+        await client(only).chat_completion(MESSAGES)
+
+async def test_slow_backend_is_hedged_and_the_first_answer_wins(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_initial_delay_seconds", 0.05)
+
+    async def slow(request):
+        await asyncio.sleep(5)
+        return completion("from primary")
+
+    primary = backend(slow, "primary")
+    llm = client(primary, backend(lambda request: completion("from secondary"), "secondary"))
+    started = time.monotonic()
+    assert await llm.chat_completion(MESSAGES) == "from secondary"
+    assert time.monotonic() - started < 1
+    assert (llm.hedges_started, llm.hedges_won) == (1, 1)
+    # Losing the race is not held against the primary
+    assert primary.breaker.consecutive_failures == 0
+
+async def test_stream_fails_over_before_any_content():
+    llm = client(backend(failing, "primary"), backend(lambda request: stream(["Where ", "are you?"]), "secondary"))
+    assert [delta async for delta in llm.chat_completion_stream(MESSAGES)] == ["Where ", "are you?"]
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import pytest
+from app.models.repository import InMemoryRepository
+from app.services.conversation_logger import ConversationLogWriter
+from app.services.persistence import PersistenceScheduler
+
+pytestmark = pytest.mark.anyio
+
+class FlakyRepository(InMemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+        self.hanging = False
+
+    async def insert_emergency_incident(self, row):
+        if self.hanging:
+            await asyncio.Event().wait()
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        return await super().insert_emergency_incident(row)
+
+@pytest.fixture
+def repo():
+    return FlakyRepository()
+
+@pytest.fixture
+def make_scheduler(repo, tmp_path):
+    def make(**options):
+        writer = ConversationLogWriter(repo=repo, spool_path=str(tmp_path / "conversations.jsonl"))
+        options = {
+            "workers": 2,
+            "max_retries": 1,
+            "retry_base_delay": 0.01,
+            "write_timeout": 1.0,
+            "spool_path": str(tmp_path / "emergencies.jsonl"),
+            "replay_interval": 0.05,
+            "drain_timeout": 1.0,
+            **options
+        }
+        return PersistenceScheduler(repo=repo, log_writer=writer, **options)
+    return make
+
+def incident(number):
+    return {"id": f"incident-{number}", "user_id": "u1", "location": "Kireka"}
+
+def stored_ids(repo):
+    return sorted(row["id"] for row in repo.tables["emergency_incidents"])
+
+async def test_incident_is_written_and_confirmed(repo, make_scheduler):
+    scheduler = make_scheduler()
+    await scheduler.start()
+    try:
+        stored = await scheduler.persist_emergency(incident(1))
+        assert stored["id"] == "incident-1"
+    finally:
+        await scheduler.stop()
+    assert stored_ids(repo) == ["incident-1"]
+
+async def test_spool_left_by_a_previous_run_is_replayed_on_start(repo, make_scheduler):
+    scheduler = make_scheduler()
+    with open(scheduler.spool_path, "w") as spool:
+        spool.write(json.dumps(incident(1)) + "\n" + json.dumps(incident(2)) + "\n")
+    await scheduler.start()
+    await scheduler.stop()
+    assert stored_ids(repo) == ["incident-1", "incident-2"]
+    assert not os.path.exists(scheduler.spool_path + ".replay")
+
+async def test_incident_spooled_at_runtime_is_replayed_without_a_restart(repo, make_scheduler):
+    scheduler = make_scheduler()
+    await scheduler.start()
+    try:
+        repo.failing = True
+        assert await scheduler.persist_emergency(incident(1)) is None
+        assert scheduler.emergencies_spooled == 1 and os.path.exists(scheduler.spool_path)
+
+        # Nothing is replayed while inserts are still failing
+        await asyncio.sleep(0.03)
+        assert stored_ids(repo) == []
+
+        repo.failing = False
+        for _ in range(50):
+            if stored_ids(repo):
+                break
+            await asyncio.sleep(0.02)
+        assert stored_ids(repo) == ["incident-1"]
+    finally:
+        await scheduler.stop()
+    assert not os.path.exists(scheduler.spool_path)
+
+async def test_spooled_updates_are_applied_after_the_replayed_inserts(repo, make_scheduler):
+    scheduler = make_scheduler()
+    await scheduler.spool_update("incident-1", {"status": "assigned", "assigned_unit_id": "amb-1"})
+    await scheduler.spool_update("unknown", {"status": "assigned"})
+    # The insert was spooled after the update, as when its retries outlast the assignment's
+    scheduler._append_spool([incident(1)])
+    await scheduler.start()
+    await scheduler.stop()
+    [row] = repo.tables["emergency_incidents"]
+    assert (row["status"], row["assigned_unit_id"]) == ("assigned", "amb-1")
+    assert scheduler.stats()["emergency"]["updates_spooled"] == 2
+    assert not os.path.exists(scheduler.spool_path) and not os.path.exists(scheduler.spool_path + ".replay")
+
+async def test_an_update_that_fails_on_replay_is_spooled_again(repo, make_scheduler, monkeypatch):
+    scheduler = make_scheduler()
+    await scheduler.spool_update("incident-1", {"status": "assigned"})
+    scheduler._append_spool([incident(1)])
+
+    async def failing_update(incident_id, values):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(repo, "update_emergency_incident", failing_update)
+    await scheduler.start()
+    await scheduler.stop()
+    assert stored_ids(repo) == ["incident-1"]
+    assert scheduler._read_spool(scheduler.spool_path) == [{"id": "incident-1", "update": {"status": "assigned"}}]
+
+async def test_replay_is_skipped_while_another_worker_holds_the_lock(repo, make_scheduler):
+    from app.utils.file_lock import acquire_lock, release_lock
+    scheduler = make_scheduler()
+    with open(scheduler.spool_path, "w") as spool:
+        spool.write(json.dumps(incident(1)) + "\n")
+    held = acquire_lock(scheduler.spool_path + ".replay.lock", blocking=False)
+    try:
+        await scheduler.start()
+        await asyncio.sleep(0.12)
+        assert stored_ids(repo) == []
+    finally:
+        release_lock(held)
+    for _ in range(50):
+        if stored_ids(repo):
+            break
+        await asyncio.sleep(0.02)
+    await scheduler.stop()
+    assert stored_ids(repo) == ["incident-1"]
+
+async def test_unwritten_incidents_are_spooled_when_the_drain_times_out(repo, make_scheduler):
+    scheduler = make_scheduler(workers=1, drain_timeout=0.05)
+    await scheduler.start()
+    repo.hanging = True
+    for number in range(3):
+        scheduler._enqueue(incident(number))
+    await asyncio.sleep(0.01)
+    await scheduler.stop()
+    assert scheduler.emergencies_spooled == 3
+    assert sorted(row["id"] for row in scheduler._read_spool(scheduler.spool_path)) == [
+        "incident-0", "incident-1", "incident-2"
+    ]
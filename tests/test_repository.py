@@ -0,0 +1,42 @@
+import pytest
+from app.models.repository import InMemoryRepository, Repository, SupabaseRepository, create_repository
+
+pytestmark = pytest.mark.anyio
+
+def test_incomplete_backend_fails_when_created():
+    class PartialRepository(Repository):
+        async def get_anonymous_user(self, user_id):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialRepository()
+
+def test_backends_are_chosen_by_name():
+    assert isinstance(create_repository("memory"), InMemoryRepository)
+    assert isinstance(create_repository("supabase"), SupabaseRepository)
+    with pytest.raises(ValueError, match="Unknown data backend"):
+        create_repository("sqlite")
+
+async def test_anonymous_sign_in_token_resolves_to_its_user():
+    repo = InMemoryRepository()
+    identity = await repo.auth_sign_in_anonymously()
+    assert await repo.auth_get_user_id(identity["access_token"]) == identity["user_id"]
+    assert await repo.auth_get_user_id("unknown") is None
+
+async def test_user_rows_are_upserted_and_batch_inserts_skip_existing_ids():
+    repo = InMemoryRepository()
+    await repo.upsert_anonymous_user({"id": "u1", "is_active": True})
+    await repo.upsert_anonymous_user({"id": "u1", "is_active": False})
+    await repo.insert_anonymous_users([{"id": "u1", "is_active": True}, {"id": "u2", "is_active": True}])
+    assert (await repo.get_anonymous_user("u1"))["is_active"] is False
+    assert (await repo.get_anonymous_user("u2"))["is_active"] is True
+    await repo.touch_anonymous_users(["u1", "u2"], "2026-01-01T00:00:00")
+    assert (await repo.get_anonymous_user("u2"))["last_activity"] == "2026-01-01T00:00:00"
+
+async def test_incident_writes_are_idempotent_by_id():
+    repo = InMemoryRepository()
+    assert await repo.insert_emergency_incident({"id": "i1", "user_id": "u1"}) is not None
+    assert await repo.insert_emergency_incident({"id": "i1", "user_id": "u1"}) is None
+    assert len(repo.tables["emergency_incidents"]) == 1
+    assert await repo.update_emergency_incident("i1", {"status": "assigned"})
+    assert not await repo.update_emergency_incident("missing", {"status": "assigned"})
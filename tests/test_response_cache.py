@@ -0,0 +1,53 @@
+import pytest
+from app.models.schemas import ChatResponse
+from app.services.chat_service import ChatService
+from app.services.response_cache import ResponseCache, normalize_message
+from tests.llm import completion
+
+def reply(text, dispatch=False):
+    return ChatResponse(reply=text, dispatch_triggered=dispatch, emergency_details={"location": "x"} if dispatch else None)
+
+def test_only_opening_turns_are_cacheable():
+    cache = ResponseCache(enabled=True, maxsize=10, ttl=60)
+    assert cache.key_for("Help!!", []) == cache.key_for("  help ", []) == "opening:help"
+    assert cache.key_for("help", [{"role": "user", "content": "hi"}]) is None
+    assert cache.key_for("help", [], {"latitude": 0.3}) is None
+    assert cache.key_for("x" * 500, []) is None
+    assert cache.key_for("?!", []) is None
+
+def test_cached_replies_are_copies():
+    cache = ResponseCache(enabled=True, maxsize=10, ttl=60)
+    key = cache.key_for("help", [])
+    cache.set(key, reply("Where are you?"))
+    first = cache.get(key)
+    first.session_id = "s1"
+    assert cache.get(key).session_id is None
+
+def test_dispatches_are_never_cached():
+    cache = ResponseCache(enabled=True, maxsize=10, ttl=60)
+    key = cache.key_for("help", [])
+    cache.set(key, reply("Help is on the way", dispatch=True))
+    assert cache.get(key) is None
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(enabled=False, maxsize=10, ttl=60)
+    assert cache.key_for("help", []) is None
+    cache.set("opening:help", reply("Where are you?"))
+    assert cache.get("opening:help") is None
+
+def test_normalize_message():
+    assert normalize_message("I NEED an   ambulance!!") == "i need an ambulance"
+
+@pytest.mark.anyio
+async def test_repeat_openers_skip_the_llm(use_llm):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return completion("What is your emergency?")
+
+    use_llm(handler)
+    first = await ChatService.process_chat_message("I need an ambulance", [])
+    second = await ChatService.process_chat_message("i need an ambulance!", [])
+    assert first.reply == second.reply == "What is your emergency?"
+    assert len(calls) == 1
@@ -0,0 +1,48 @@
+import os
+import sys
+import serve
+from app.core.config import settings
+
+def test_workers_default_to_the_available_cores(monkeypatch):
+    calls = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **options: calls.append((app, options)))
+    monkeypatch.setattr(serve, "available_cores", lambda: 3)
+    monkeypatch.setattr(settings, "server_workers", 0)
+    monkeypatch.setattr(sys, "argv", ["serve.py", "--port", "9000"])
+    serve.main()
+    [(app, options)] = calls
+    assert app == "main:app"
+    assert options["workers"] == 3 and options["port"] == 9000
+    assert (options["loop"], options["http"]) == ("uvloop", "httptools")
+    assert options["timeout_graceful_shutdown"] == settings.server_graceful_timeout_seconds
+    assert options["access_log"] is False
+
+def test_worker_flag_overrides_the_core_count(monkeypatch):
+    calls = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **options: calls.append(options))
+    monkeypatch.setattr(sys, "argv", ["serve.py", "--workers", "2"])
+    serve.main()
+    assert calls[0]["workers"] == 2
+
+def test_available_cores_is_positive():
+    assert serve.available_cores() >= 1
+
+def test_stale_metric_files_are_cleared(monkeypatch, tmp_path):
+    (tmp_path / "gauge_live_1.db").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("kept")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    serve.prepare_metrics_dir(4)
+    assert os.listdir(tmp_path) == ["notes.txt"]
+
+def test_a_fleet_runs_on_a_single_worker(monkeypatch, caplog):
+    calls = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **options: calls.append(options))
+    monkeypatch.setattr(settings, "fleet_path", "data/fleet.sample.csv")
+    monkeypatch.setattr(sys, "argv", ["serve.py", "--workers", "4"])
+    serve.main()
+    assert calls[0]["workers"] == 1
+    assert "FLEET_PATH is set" in caplog.text
+    assert serve.limit_workers(1) == 1
+
+    monkeypatch.setattr(settings, "fleet_path", None)
+    assert serve.limit_workers(4) == 4
@@ -0,0 +1,60 @@
+import time
+import pytest
+from app.services.session_store import InMemorySessionBackend, SessionBackend, SessionStore
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def store():
+    return SessionStore(InMemorySessionBackend(max_sessions=3, ttl=60.0), max_messages=4, max_chars=100)
+
+def turn(user, reply):
+    return [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+
+def test_incomplete_backend_fails_when_created():
+    class PartialBackend(SessionBackend):
+        async def get(self, session_id):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialBackend()
+
+async def test_history_belongs_to_its_user(store):
+    session_id = await store.start("u1", turn("help", "Where are you?"))
+    assert len(await store.get_history(session_id, "u1")) == 2
+    assert await store.get_history(session_id, "u2") is None
+
+async def test_sessions_without_an_id_reuse_one_session_per_user(store):
+    first = await store.start("u1", turn("help", "Where are you?"))
+    await store.append(first, "u1", turn("Kireka", "What happened?"))
+    second = await store.start("u1")
+    assert second == first
+    assert await store.get_history(second, "u1") == []
+    assert await store.start("u2") != first
+    assert len(store.backend) == 2
+
+async def test_oldest_turns_are_dropped_past_the_caps(store):
+    session_id = await store.start("u1", turn("a", "b") + turn("c", "d"))
+    await store.append(session_id, "u1", turn("e", "f"))
+    assert [msg["content"] for msg in await store.get_history(session_id, "u1")] == ["c", "d", "e", "f"]
+    await store.append(session_id, "u1", turn("x" * 60, "y" * 60))
+    assert [msg["content"] for msg in await store.get_history(session_id, "u1")] == ["y" * 60]
+
+async def test_reading_a_session_keeps_it_from_eviction(store):
+    sessions = [await store.start(f"u{number}") for number in range(3)]
+    await store.get_history(sessions[0], "u0")
+    await store.start("u3")
+    assert await store.get_history(sessions[0], "u0") == []
+    assert await store.get_history(sessions[1], "u1") is None
+
+async def test_reading_a_session_restarts_its_idle_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    backend = InMemorySessionBackend(max_sessions=10, ttl=60.0)
+    await backend.put("s", {"user_id": "u1", "messages": []})
+    now[0] += 50
+    assert await backend.get("s") is not None
+    now[0] += 50
+    assert await backend.get("s") is not None
+    now[0] += 61
+    assert await backend.get("s") is None
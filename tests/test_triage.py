@@ -0,0 +1,63 @@
+import pytest
+from app.services.triage import TriageExtractor, incident_name
+
+@pytest.fixture
+def triage():
+    return TriageExtractor(cache_size=100)
+
+def test_plain_report_yields_every_dispatch_field(triage):
+    result = triage.extract("Car crash at Kampala Road, 3 people, one is bleeding")
+    assert result.location == "Kampala Road"
+    assert result.incident == "road traffic accident"
+    assert result.victim_count == "3"
+    assert result.user_reported_status == "bleeding"
+    assert result.is_complete and not result.tentative
+
+@pytest.mark.parametrize("text, count", [
+    ("two injured people", "2"),
+    ("12 passengers", "12"),
+    ("I'm alone", "1"),
+    ("my father and my brother", "2"),
+])
+def test_victim_counts(triage, text, count):
+    assert triage.extract(text).victim_count == count
+
+def test_place_names_are_not_incidents(triage):
+    result = triage.extract("I need a ride to the Fire Station at Kampala Road for my two kids")
+    assert result.incident is None
+    assert not result.is_complete
+
+@pytest.mark.parametrize("text", [
+    "There is no fire at Acacia Mall",
+    "Nobody is bleeding",
+    "he didn't collapse, he is fine",
+])
+def test_negated_phrases_are_skipped(triage, text):
+    assert triage.extract(text).incident is None
+
+def test_a_later_affirmed_phrase_still_counts(triage):
+    assert incident_name("There was no fire but my son was burned") == "burns"
+    assert triage.extract("nobody is bleeding, he fainted").user_reported_status == "unconscious"
+
+@pytest.mark.parametrize("text", [
+    "I heard a car crash sound near Garden City Mall, 2 men",
+    "What if there is a fire at Kampala Road with 2 people?",
+    "Is he having a heart attack at Acacia Mall? There are 2 men",
+    "I'm worried my father might have a stroke at Jinja Road",
+])
+def test_questions_hypotheticals_and_hearsay_are_tentative(triage, text):
+    assert triage.extract(text).tentative
+
+def test_earlier_turns_fill_missing_fields_with_their_tentativeness(triage):
+    history = [
+        {"role": "user", "content": "What should I do if someone has a seizure?"},
+        {"role": "assistant", "content": "Where are you?"},
+    ]
+    result = triage.extract_conversation("we are at Kampala Road, 2 people", history)
+    assert result.incident == "seizure" and result.tentative
+    result = triage.extract_conversation("he is having a seizure now at Kampala Road, 2 people", history)
+    assert not result.tentative
+
+def test_assistant_turns_are_ignored(triage):
+    history = [{"role": "assistant", "content": "Is there a fire at Kampala Road?"}]
+    assert triage.extract_conversation("hello", history).is_empty
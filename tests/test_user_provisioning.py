@@ -0,0 +1,170 @@
+import asyncio
+import pytest
+from app.core.security import create_access_token, verify_token
+from app.models.repository import InMemoryRepository
+from app.services.activity_tracker import ActivityTracker
+from app.services.auth_service import AuthService
+from app.services.user_provisioning import IdentityPool, UserProvisioner
+
+pytestmark = pytest.mark.anyio
+
+class RecordingRepository(InMemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.fail_inserts = False
+        self.fail_sign_ins = False
+
+    async def insert_anonymous_users(self, rows):
+        if self.fail_inserts:
+            raise ConnectionError("database unavailable")
+        self.batches.append([row["id"] for row in rows])
+        await super().insert_anonymous_users(rows)
+
+    async def auth_sign_in_anonymously(self):
+        if self.fail_sign_ins:
+            raise ConnectionError("auth unavailable")
+        return await super().auth_sign_in_anonymously()
+
+def service(repo, mode, pool=None):
+    return AuthService(
+        repo=repo,
+        tracker=ActivityTracker(repo=repo),
+        provisioner=UserProvisioner(repo=repo, batch_size=2),
+        pool=pool or IdentityPool(repo=repo, size=0),
+        mode=mode
+    )
+
+async def test_local_sign_in_is_served_before_its_row_is_written():
+    repo = RecordingRepository()
+    auth = service(repo, "local")
+    identity, error = await auth.sign_in_anonymously()
+    assert error is None and repo.batches == []
+    auth.user_cache.clear()
+    assert (await auth.get_current_user(identity["access_token"]))["id"] == identity["user_id"]
+
+    await auth.provisioner.flush()
+    assert repo.batches == [[identity["user_id"]]]
+    assert (await repo.get_anonymous_user(identity["user_id"]))["is_active"] is True
+
+async def test_rows_are_written_in_batches_and_retried_after_a_failure():
+    repo = RecordingRepository()
+    provisioner = UserProvisioner(repo=repo, batch_size=2, flush_interval=60)
+    for user_id in ("u1", "u2", "u3", "u1"):
+        provisioner.add({"id": user_id, "is_active": True})
+    repo.fail_inserts = True
+    await provisioner.flush()
+    assert provisioner.depth == 3
+    repo.fail_inserts = False
+    await provisioner.flush()
+    assert repo.batches == [["u1", "u2"], ["u3"]]
+    assert provisioner.depth == 0
+
+async def test_full_batch_is_written_without_waiting_for_the_interval():
+    repo = RecordingRepository()
+    provisioner = UserProvisioner(repo=repo, batch_size=2, flush_interval=60)
+    await provisioner.start()
+    try:
+        provisioner.add({"id": "u1"})
+        provisioner.add({"id": "u2"})
+        for _ in range(100):
+            if repo.batches:
+                break
+            await asyncio.sleep(0.01)
+        assert repo.batches == [["u1", "u2"]]
+        provisioner.add({"id": "u3"})
+    finally:
+        await provisioner.stop()
+    assert repo.batches[-1] == ["u3"]
+
+class CountingRepository(RecordingRepository):
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    async def insert_anonymous_users(self, rows):
+        self.attempts += 1
+        await super().insert_anonymous_users(rows)
+
+async def test_failed_inserts_back_off_while_sign_ins_keep_filling_batches():
+    repo = CountingRepository()
+    repo.fail_inserts = True
+    provisioner = UserProvisioner(repo=repo, batch_size=2, flush_interval=60, retry_interval=60)
+    await provisioner.start()
+    try:
+        provisioner.add({"id": "u1"})
+        provisioner.add({"id": "u2"})
+        for _ in range(100):
+            if repo.attempts:
+                break
+            await asyncio.sleep(0.01)
+        for number in range(3, 40):
+            provisioner.add({"id": f"u{number}"})
+            await asyncio.sleep(0.001)
+        assert repo.attempts == 1
+    finally:
+        repo.fail_inserts = False
+        await provisioner.stop()
+    assert provisioner.depth == 0 and sum(len(batch) for batch in repo.batches) == 39
+
+async def test_queue_is_capped_while_inserts_fail():
+    repo = RecordingRepository()
+    provisioner = UserProvisioner(repo=repo, batch_size=2, max_pending=3)
+    for number in range(5):
+        provisioner.add({"id": f"u{number}"})
+    # A row already queued can still be re-added
+    provisioner.add({"id": "u0"})
+    assert (provisioner.depth, provisioner.dropped) == (3, 2)
+    assert provisioner.pending_user("u4") is None
+    assert await provisioner.flush() is True
+    assert provisioner.dropped == 0
+
+async def test_dropped_user_is_re_created_at_their_next_request():
+    repo = RecordingRepository()
+    auth = service(repo, "local")
+    auth.provisioner.max_pending = 0
+    identity, _ = await auth.sign_in_anonymously()
+    auth.user_cache.clear()
+    auth.provisioner.max_pending = 10
+    assert (await auth.get_current_user(identity["access_token"]))["id"] == identity["user_id"]
+    assert auth.provisioner.pending_user(identity["user_id"]) is not None
+
+async def test_token_minted_by_another_worker_is_provisioned_lazily():
+    repo = RecordingRepository()
+    auth = service(repo, "local")
+    user = await auth.get_current_user(create_access_token({"sub": "elsewhere"}))
+    assert user["id"] == "elsewhere"
+    assert auth.provisioner.pending_user("elsewhere") is not None
+
+async def test_user_deactivated_before_their_row_is_written_is_created_inactive():
+    repo = RecordingRepository()
+    auth = service(repo, "local")
+    identity, _ = await auth.sign_in_anonymously()
+    assert await auth.deactivate_user(identity["user_id"])
+    assert await auth.get_current_user(identity["access_token"]) is None
+    await auth.provisioner.flush()
+    assert (await repo.get_anonymous_user(identity["user_id"]))["is_active"] is False
+
+async def test_pool_sign_in_uses_a_pre_created_identity_and_falls_back_when_empty():
+    repo = RecordingRepository()
+    pool = IdentityPool(repo=repo, size=2, concurrency=2)
+    assert await pool.refill() == 2
+    pooled = [pool.take(), pool.take()]
+    pool._identities.extend(pooled)
+    auth = service(repo, "pool", pool)
+
+    first, _ = await auth.sign_in_anonymously()
+    second, _ = await auth.sign_in_anonymously()
+    assert [first["user_id"], second["user_id"]] == pooled
+    assert verify_token(first["access_token"])["sub"] == pooled[0]
+    fallback, _ = await auth.sign_in_anonymously()
+    assert fallback["user_id"] not in pooled
+
+async def test_failed_refill_keeps_what_was_created():
+    repo = RecordingRepository()
+    pool = IdentityPool(repo=repo, size=3, concurrency=3)
+    repo.fail_sign_ins = True
+    assert await pool.refill() == 0
+    assert pool.take() is None
+    repo.fail_sign_ins = False
+    assert await pool.refill() == 3